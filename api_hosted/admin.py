@@ -1,5 +1,7 @@
 from django.contrib import admin
-from api_hosted.models import APIUser, UsageLog
+from api_hosted.models import APIUser, UsageLog, UsageHourlyRollup, UsageDailyRollup
+from api_hosted.rollups import usage_this_month
+from api_hosted.usage import usage_recorder
 
 
 @admin.register(APIUser)
@@ -7,7 +9,7 @@ class APIUserAdmin(admin.ModelAdmin):
     list_display = ['id', 'email', 'is_pro', 'projects_remaining', 'total_requests', 'total_cost', 'created_at']
     list_filter = ['created_at', 'is_pro']
     search_fields = ['email', 'id', 'subscription_id', 'stripe_customer_id']
-    readonly_fields = ['id', 'created_at', 'auth_token']
+    readonly_fields = ['id', 'created_at', 'auth_token', 'unflushed_usage', 'month_to_date_usage']
     ordering = ['-created_at']
     
     fieldsets = (
@@ -18,19 +20,34 @@ class APIUserAdmin(admin.ModelAdmin):
             'fields': ('is_pro', 'projects_remaining', 'subscription_id', 'stripe_customer_id')
         }),
         ('Usage Statistics', {
-            'fields': ('total_requests', 'total_tokens_used', 'total_cost')
+            'fields': ('total_requests', 'total_tokens_used', 'total_cost', 'unflushed_usage', 'month_to_date_usage')
+        }),
+        ('Preferences', {
+            'fields': ('ai_cache_enabled',)
         }),
         ('Authentication', {
             'fields': ('auth_token',),
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.display(description='Usage this month')
+    def month_to_date_usage(self, obj):
+        """Month-to-date usage from the daily rollups"""
+        usage = usage_this_month(obj)
+        return f"{usage['month']}: {usage['requests']} requests, {usage['tokens_used']} tokens, ${usage['cost']}"
+    
+    @admin.display(description='Unflushed usage')
+    def unflushed_usage(self, obj):
+        """Buffered usage not yet added to the totals above"""
+        pending = usage_recorder.pending(obj.pk)
+        return f"{pending['requests']} requests, {pending['tokens']} tokens, ${pending['cost']}"
 
 
 @admin.register(UsageLog)
 class UsageLogAdmin(admin.ModelAdmin):
-    list_display = ['id', 'api_user', 'action', 'tokens_used', 'cost', 'model', 'timestamp']
-    list_filter = ['action', 'model', 'timestamp']
+    list_display = ['id', 'api_user', 'action', 'tokens_used', 'cost', 'model', 'route', 'latency_ms', 'timestamp']
+    list_filter = ['action', 'model', 'route', 'prompt_template', 'fallback_used', 'hedged', 'timestamp']
     search_fields = ['api_user__email', 'action']
     readonly_fields = ['timestamp']
     ordering = ['-timestamp']
@@ -43,5 +60,39 @@ class UsageLogAdmin(admin.ModelAdmin):
         ('Usage Details', {
             'fields': ('tokens_used', 'cost', 'model', 'prompt_length')
         }),
+        ('Routing', {
+            'fields': ('route', 'requested_model', 'fallback_used', 'hedged', 'hedge_tokens', 'latency_ms')
+        }),
+        ('Prompt Cache', {
+            'fields': ('prompt_template', 'prompt_tokens', 'cached_tokens')
+        }),
     )
 
+
+
+class ReadOnlyRollupAdmin(admin.ModelAdmin):
+    """Rollups are maintained by the aggregator only"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UsageDailyRollup)
+class UsageDailyRollupAdmin(ReadOnlyRollupAdmin):
+    list_display = ['day', 'api_user', 'requests', 'tokens_used', 'cost']
+    list_filter = ['day']
+    search_fields = ['api_user__email', 'api_user__id']
+    date_hierarchy = 'day'
+    ordering = ['-day']
+
+
+@admin.register(UsageHourlyRollup)
+class UsageHourlyRollupAdmin(ReadOnlyRollupAdmin):
+    list_display = ['hour', 'api_user', 'model', 'requests', 'tokens_used', 'cost']
+    list_filter = ['model', 'hour']
+    search_fields = ['api_user__email', 'api_user__id']
+    date_hierarchy = 'hour'
+    ordering = ['-hour']
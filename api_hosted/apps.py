@@ -5,3 +5,5 @@ class ApiHostedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_hosted'
 
+    def ready(self):
+        from api_hosted import signals  # noqa: F401
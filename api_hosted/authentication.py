@@ -2,16 +2,62 @@ import jwt as pyjwt
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from api_hosted.models import APIUser
+from api_hosted.principals import principal_cache
+from api_hosted.revocation import token_denylist
 from api_hosted.services import JWTService
 
 
 class JWTAuthentication(BaseAuthentication):
     """
     Custom JWT authentication for hosted API
-    Verifies Bearer token in Authorization header
+    Verifies Bearer token in Authorization header; the user is resolved
+    through the principal cache (api_hosted/principals.py)
     """
     
     def authenticate(self, request):
+        payload, token = self._decode(request)
+        if token_denylist.is_revoked(payload):
+            raise AuthenticationFailed('Token has been revoked')
+        user_id, email = payload['userId'], payload['email']
+        try:
+            api_user = principal_cache.get(user_id, email)
+        except APIUser.DoesNotExist:
+            raise AuthenticationFailed('User not found')
+        except Exception as e:
+            raise AuthenticationFailed(f'Authentication failed: {str(e)}')
+        
+        # Return user and token
+        return (api_user, token)
+    
+    async def aauthenticate(self, request):
+        """
+        Async variant of authenticate() for async views (async cache/ORM lookup)
+        
+        Args:
+            request: Django HttpRequest
+        
+        Returns:
+            tuple: (APIUser, token)
+        
+        Raises:
+            AuthenticationFailed: If the token or user is invalid
+        """
+        payload, token = self._decode(request)
+        if await token_denylist.ais_revoked(payload):
+            raise AuthenticationFailed('Token has been revoked')
+        user_id, email = payload['userId'], payload['email']
+        try:
+            api_user = await principal_cache.aget(user_id, email)
+        except APIUser.DoesNotExist:
+            raise AuthenticationFailed('User not found')
+        except Exception as e:
+            raise AuthenticationFailed(f'Authentication failed: {str(e)}')
+        
+        return (api_user, token)
+    
+    @staticmethod
+    def _decode(request):
+        """Verify the Bearer token and return (payload, token)"""
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         
         if not auth_header:
@@ -28,32 +74,23 @@ class JWTAuthentication(BaseAuthentication):
         try:
             # Verify and decode token
             payload = JWTService.verify_token(token)
-            
-            # Get user from database
-            user_id = payload.get('userId')
-            email = payload.get('email')
-            
-            if not user_id or not email:
-                raise AuthenticationFailed('Invalid token payload')
-            
-            try:
-                api_user = APIUser.objects.get(id=user_id, email=email)
-            except APIUser.DoesNotExist:
-                raise AuthenticationFailed('User not found')
-            
-            # Return user and token
-            return (api_user, token)
-            
         except pyjwt.ExpiredSignatureError:
             raise AuthenticationFailed('Token has expired')
         except pyjwt.InvalidTokenError:
             raise AuthenticationFailed('Invalid token')
         except Exception as e:
             raise AuthenticationFailed(f'Authentication failed: {str(e)}')
+        
+        user_id = payload.get('userId')
+        email = payload.get('email')
+        
+        if not user_id or not email:
+            raise AuthenticationFailed('Invalid token payload')
+        
+        return payload, token
     
     def authenticate_header(self, request):
         """
         Return WWW-Authenticate header for 401 responses
         """
         return 'Bearer realm="api"'
-
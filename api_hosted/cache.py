@@ -0,0 +1,112 @@
+"""
+Response cache for the AI proxy
+
+Entries live in the `ai_responses` Django cache alias: Redis when
+CACHE_REDIS_URL is set (size-bounded by Redis' maxmemory LRU policy),
+otherwise a per-process LocMemCache bounded by MAX_ENTRIES.
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('provokely.api_hosted')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different re-sends share a cache entry
+
+    Applies Unicode NFKC, collapses runs of whitespace and strips the ends.
+    Case and punctuation are preserved because they can change the answer.
+    """
+    return _WHITESPACE_RE.sub(' ', unicodedata.normalize('NFKC', prompt or '')).strip()
+
+
+class AIResponseCache:
+    """Cache AI completions by (model, max_tokens, prompt template, normalized prompt hash)"""
+
+    KEY_PREFIX = 'ai_resp'
+    HITS_KEY = 'ai_resp:stats:hits'
+    MISSES_KEY = 'ai_resp:stats:misses'
+
+    def __init__(self, alias='ai_responses', timeout=None):
+        """
+        Args:
+            alias: Django cache alias
+            timeout: Entry TTL in seconds (defaults to settings.AI_RESPONSE_CACHE_TTL)
+        """
+        self.cache = caches[alias]
+        self.timeout = timeout if timeout is not None else getattr(settings, 'AI_RESPONSE_CACHE_TTL', 86400)
+
+    @staticmethod
+    def prompt_hash(prompt: str) -> str:
+        return hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+
+    def make_key(self, prompt: str, model: str, max_tokens: int, variant: str = '') -> str:
+        # variant: prefix hash of a non-default prompt template ('' keeps existing keys)
+        if variant:
+            return f"{self.KEY_PREFIX}:{model}:{max_tokens}:{variant}:{self.prompt_hash(prompt)}"
+        return f"{self.KEY_PREFIX}:{model}:{max_tokens}:{self.prompt_hash(prompt)}"
+
+    def get(self, prompt: str, model: str, max_tokens: int, variant: str = ''):
+        """
+        Look up a cached completion
+
+        Returns:
+            dict or None: Cached {'response', 'tokens_used', 'model'} on a hit
+        """
+        key = self.make_key(prompt, model, max_tokens, variant)
+        try:
+            entry = self.cache.get(key)
+        except Exception as e:
+            # A cache outage must never fail the request
+            logger.warning('AI response cache read failed: %s', e)
+            return None
+        self._count(self.HITS_KEY if entry is not None else self.MISSES_KEY)
+        return entry
+
+    def set(self, prompt: str, model: str, max_tokens: int, result: dict, variant: str = ''):
+        """Store a completion result"""
+        key = self.make_key(prompt, model, max_tokens, variant)
+        try:
+            self.cache.set(key, {
+                'response': result['response'],
+                'tokens_used': result['tokens_used'],
+                'model': result['model'],
+            }, timeout=self.timeout)
+        except Exception as e:
+            logger.warning('AI response cache write failed: %s', e)
+
+    def _count(self, key):
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, timeout=None)
+            try:
+                self.cache.incr(key)
+            except Exception:
+                pass
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters since the cache backend was last cleared
+
+        Returns:
+            dict: hits, misses and hit_ratio
+        """
+        hits = self.cache.get(self.HITS_KEY) or 0
+        misses = self.cache.get(self.MISSES_KEY) or 0
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+        }
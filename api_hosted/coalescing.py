@@ -0,0 +1,214 @@
+"""
+Singleflight-style coalescing of identical in-flight AI requests
+
+Within a process, followers wait on the leader's threading.Event. Across
+gunicorn workers, the leader holds a lock created with cache.add() (atomic
+SET NX on Redis) and publishes its result under a short-lived key that
+followers in other processes poll for.
+
+`arun` is the same protocol for the async (ASGI) path: followers await the
+leader's future and cross-process polling uses asyncio.sleep, so waiting
+never blocks the event loop.
+"""
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """Run at most one upstream call per key at a time and share its result"""
+
+    KEY_PREFIX = 'ai_inflight'
+
+    def __init__(self, alias='default', lock_ttl=None, wait_timeout=None, result_ttl=None, poll_interval=0.1):
+        """
+        Args:
+            alias: Django cache alias used for the distributed lock and result hand-off
+            lock_ttl: Seconds before an abandoned lock expires (settings.AI_COALESCE_LOCK_TTL)
+            wait_timeout: Max seconds a follower waits before calling upstream itself
+                (settings.AI_COALESCE_WAIT_TIMEOUT)
+            result_ttl: Seconds the leader's result stays available to late followers
+                (settings.AI_COALESCE_RESULT_TTL)
+            poll_interval: Seconds between cross-process result polls
+        """
+        self.alias = alias
+        self.lock_ttl = lock_ttl or getattr(settings, 'AI_COALESCE_LOCK_TTL', 120)
+        self.wait_timeout = wait_timeout or getattr(settings, 'AI_COALESCE_WAIT_TIMEOUT', 90)
+        self.result_ttl = result_ttl or getattr(settings, 'AI_COALESCE_RESULT_TTL', 15)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        # (event loop, key) -> leader's future; only touched from that loop's thread
+        self._async_calls = {}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def run(self, key, fn):
+        """
+        Call fn() once for all concurrent callers with the same key
+
+        Args:
+            key: Coalescing key (e.g. user, model and prompt hash)
+            fn: Zero-argument callable producing a cacheable result
+
+        Returns:
+            tuple: (result, shared) where shared is False only for the caller that ran fn()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._run_distributed(key, fn)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run_distributed(self, key, fn):
+        lock_key = f"{self.KEY_PREFIX}:lock:{key}"
+        result_key = f"{self.KEY_PREFIX}:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            if self._acquire(lock_key, token):
+                try:
+                    result = fn()
+                    self._safe(self.cache.set, result_key, result, timeout=self.result_ttl)
+                    return result, False
+                finally:
+                    self._release(lock_key, token)
+
+            # Another worker is calling upstream: wait for its result
+            while time.monotonic() < deadline:
+                result = self._safe(self.cache.get, result_key)
+                if result is not None:
+                    return result, True
+                if self._safe(self.cache.get, lock_key) is None:
+                    break  # leader finished without a result (failed); try to lead
+                time.sleep(self.poll_interval)
+            else:
+                # Leader is taking too long; do not hold the request hostage
+                return fn(), False
+
+    async def arun(self, key, fn):
+        """
+        Async run(): await fn() once for all concurrent callers with the same key
+
+        Args:
+            key: Coalescing key (e.g. user, model and prompt hash)
+            fn: Zero-argument coroutine function producing a cacheable result
+
+        Returns:
+            tuple: (result, shared) where shared is False only for the caller that ran fn()
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        call = self._async_calls.get(call_key)
+        if call is not None:
+            # shield: a follower's cancelled request must not cancel the leader's future
+            return await asyncio.shield(call), True
+
+        call = self._async_calls[call_key] = loop.create_future()
+        try:
+            result, shared = await self._arun_distributed(key, fn)
+            call.set_result(result)
+            return result, shared
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                call.cancel()
+            else:
+                call.set_exception(e)
+                call.exception()  # retrieved: no "never retrieved" warning without followers
+            raise
+        finally:
+            self._async_calls.pop(call_key, None)
+
+    async def _arun_distributed(self, key, fn):
+        lock_key = f"{self.KEY_PREFIX}:lock:{key}"
+        result_key = f"{self.KEY_PREFIX}:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            if await self._aacquire(lock_key, token):
+                try:
+                    result = await fn()
+                    await self._asafe(self.cache.aset, result_key, result, timeout=self.result_ttl)
+                    return result, False
+                finally:
+                    if await self._asafe(self.cache.aget, lock_key) == token:
+                        await self._asafe(self.cache.adelete, lock_key)
+
+            while time.monotonic() < deadline:
+                result = await self._asafe(self.cache.aget, result_key)
+                if result is not None:
+                    return result, True
+                if await self._asafe(self.cache.aget, lock_key) is None:
+                    break
+                await asyncio.sleep(self.poll_interval)
+            else:
+                return await fn(), False
+
+    async def _aacquire(self, lock_key, token):
+        try:
+            return await self.cache.aadd(lock_key, token, timeout=self.lock_ttl)
+        except Exception:
+            return True
+
+    @staticmethod
+    async def _asafe(method, *args, **kwargs):
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            return None
+
+    def _acquire(self, lock_key, token):
+        try:
+            return self.cache.add(lock_key, token, timeout=self.lock_ttl)
+        except Exception:
+            # Cache unavailable: fall back to per-process coalescing only
+            return True
+
+    def _release(self, lock_key, token):
+        # Best effort compare-and-delete so an expired lock taken over by
+        # another worker is not removed
+        if self._safe(self.cache.get, lock_key) == token:
+            self._safe(self.cache.delete, lock_key)
+
+    @staticmethod
+    def _safe(method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            return None
+
+
+# One coalescer per process so concurrent requests in threaded workers see each other
+request_coalescer = RequestCoalescer()
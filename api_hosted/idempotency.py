@@ -0,0 +1,116 @@
+"""
+Idempotency-Key support for the AI proxy
+
+Clients retry /api/ai on network errors. With an Idempotency-Key header the
+first successful response is stored (IDEMPOTENCY_TTL, in the shared default
+cache) and replayed for retries with the same key, without calling OpenAI,
+logging usage or touching the quota again. A duplicate that arrives while
+the first request is still running waits for its result.
+
+Keys are scoped per user and bound to the request body: reusing a key with a
+different body is rejected. Failed requests are not stored, so a retry after
+an upstream error runs again.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from shared.exceptions import IdempotencyConflictError
+
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(data):
+    """Stable hash of a request body"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """Store first responses per (user, Idempotency-Key) and replay them"""
+
+    KEY_PREFIX = 'ai_idem'
+    IN_PROGRESS = 'in_progress'
+    DONE = 'done'
+
+    def __init__(self, alias='default', ttl=None, lock_ttl=None, wait_timeout=None, poll_interval=0.1):
+        """
+        Args:
+            alias: Django cache alias
+            ttl: Seconds a stored response stays replayable (settings.IDEMPOTENCY_TTL)
+            lock_ttl: Seconds before an abandoned in-progress marker expires (settings.IDEMPOTENCY_LOCK_TTL)
+            wait_timeout: Max seconds a duplicate waits for the first request (settings.IDEMPOTENCY_WAIT_TIMEOUT)
+            poll_interval: Seconds between checks while waiting
+        """
+        self.alias = alias
+        self.ttl = ttl or getattr(settings, 'IDEMPOTENCY_TTL', 86400)
+        self.lock_ttl = lock_ttl or getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 120)
+        self.wait_timeout = wait_timeout or getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 90)
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, user_id, idempotency_key):
+        digest = hashlib.sha256(idempotency_key.encode('utf-8')).hexdigest()
+        return f"{self.KEY_PREFIX}:{user_id}:{digest}"
+
+    def run(self, user_id, idempotency_key, fingerprint, fn):
+        """
+        Run fn() once per key and replay its stored response afterwards
+
+        Args:
+            user_id: APIUser id (keys are per user)
+            idempotency_key: Client supplied Idempotency-Key
+            fingerprint: request_fingerprint() of the request body
+            fn: Zero-argument callable returning (status_code, data)
+
+        Returns:
+            tuple: (status_code, data, replayed)
+
+        Raises:
+            IdempotencyConflictError: Key reused with another body (422), or the
+                first request is still running after wait_timeout (409)
+        """
+        key = self.make_key(user_id, idempotency_key)
+        deadline = time.monotonic() + self.wait_timeout
+
+        while True:
+            if self.cache.add(key, {'state': self.IN_PROGRESS, 'fingerprint': fingerprint}, timeout=self.lock_ttl):
+                try:
+                    status_code, data = fn()
+                except Exception:
+                    self.cache.delete(key)
+                    raise
+                if 200 <= status_code < 300:
+                    self.cache.set(key, {
+                        'state': self.DONE,
+                        'fingerprint': fingerprint,
+                        'status': status_code,
+                        'data': data,
+                    }, timeout=self.ttl)
+                else:
+                    # Not stored: a retry of a failed request runs again
+                    self.cache.delete(key)
+                return status_code, data, False
+
+            entry = self.cache.get(key)
+            if entry is None:
+                continue  # first request failed or expired meanwhile: take over
+            if entry['fingerprint'] != fingerprint:
+                raise IdempotencyConflictError(
+                    'Idempotency-Key was already used with a different request body', status_code=422
+                )
+            if entry['state'] == self.DONE:
+                return entry['status'], entry['data'], True
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflictError(
+                    'A request with this Idempotency-Key is still in progress', status_code=409
+                )
+            time.sleep(self.poll_interval)
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api_hosted.rollups import UsageRollupAggregator
+
+
+class Command(BaseCommand):
+    help = 'Fold new UsageLog rows into the hourly and daily usage rollups (resumes with the rows not rolled up yet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='UsageLog rows per transaction')
+
+    def handle(self, *args, **options):
+        folded = UsageRollupAggregator(batch_size=options['batch_size']).run()
+        self.stdout.write(f"folded {folded} usage log rows into rollups")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api_hosted.cache import AIResponseCache
+
+
+class Command(BaseCommand):
+    help = 'Show AI response cache hit/miss counters (shared across workers when CACHE_REDIS_URL is set)'
+
+    def handle(self, *args, **kwargs):
+        stats = AIResponseCache().stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  hit ratio: {stats['hit_ratio']:.2%}"
+        )
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory
+from django.test.utils import override_settings
+
+from api_hosted.management.commands.bench_openai_client import StubHandler
+from api_hosted.models import APIUser
+from api_hosted.services import JWTService
+from api_hosted.usage import usage_recorder
+from api_hosted.views import AIProxyView, AsyncAIProxyView
+from shared.openai_client import openai_clients
+from shared.stats import percentile
+
+
+class SlowStubHandler(StubHandler):
+    """chat.completions stub that takes `latency` seconds, like a real completion"""
+    latency = 0.5
+    lock = threading.Lock()
+    in_flight = 0
+    peak_in_flight = 0
+
+    def do_POST(self):
+        cls = SlowStubHandler
+        with cls.lock:
+            cls.in_flight += 1
+            cls.peak_in_flight = max(cls.peak_in_flight, cls.in_flight)
+        try:
+            time.sleep(cls.latency)
+            super().do_POST()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent /api/ai capacity of sync workers with one async (ASGI) process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+        parser.add_argument('--sync-workers', type=int, default=4,
+                            help='Sync workers (each serves one request at a time, like gunicorn sync)')
+        parser.add_argument('--concurrency', type=int, default=100, help='Concurrent requests offered to the async process')
+        parser.add_argument('--upstream-ms', type=float, default=500.0, help='Simulated OpenAI latency')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        SlowStubHandler.latency = options['upstream_ms'] / 1000.0
+        server = ThreadingHTTPServer(('127.0.0.1', 0), SlowStubHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        previous_base_url = os.environ.get('OPENAI_BASE_URL')
+        os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        user_id = f"bench_async_{int(time.time() * 1000)}"
+        api_user = APIUser.objects.create(id=user_id, email=f"{user_id}@bench.invalid", is_pro=True,
+                                          ai_cache_enabled=False)
+        token = JWTService.generate_token(api_user.id, api_user.email)
+        try:
+            with override_settings(OPENAI_API_KEY=getattr(settings, 'OPENAI_API_KEY', None) or 'bench-key',
+                                   AI_RATE_LIMIT_ENABLED=False):
+                openai_clients.reset()
+                report = {
+                    'requests': options['requests'],
+                    'upstream_ms': options['upstream_ms'],
+                    'sync': self._run_sync(api_user, token, options),
+                    'async': self._run_async(api_user, token, options),
+                }
+                usage_recorder.flush_all()
+        finally:
+            openai_clients.reset()
+            APIUser.objects.filter(pk=user_id).delete()
+            server.shutdown()
+            if previous_base_url is None:
+                os.environ.pop('OPENAI_BASE_URL', None)
+            else:
+                os.environ['OPENAI_BASE_URL'] = previous_base_url
+
+        report['async_vs_sync_per_process'] = round(
+            report['async']['rps_per_process'] / report['sync']['rps_per_process'], 1
+        ) if report['sync']['rps_per_process'] else None
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for mode in ('sync', 'async'):
+            self.stdout.write(mode)
+            for key, value in report[mode].items():
+                self.stdout.write(f"{key:>24}: {value}")
+        self.stdout.write(f"{'async/sync per process':>24}: {report['async_vs_sync_per_process']}x")
+
+    @staticmethod
+    def _body(api_user, i, mode):
+        # Distinct prompts: nothing is served from cache or coalesced
+        return json.dumps({'prompt': f'{mode} benchmark prompt {i}', 'userEmail': api_user.email})
+
+    def _run_sync(self, api_user, token, options):
+        view = AIProxyView.as_view()
+        factory = RequestFactory()
+        SlowStubHandler.peak_in_flight = 0
+
+        def one(i):
+            request = factory.post('/api/ai', data=self._body(api_user, i, 'sync'), content_type='application/json',
+                                   HTTP_AUTHORIZATION=f'Bearer {token}')
+            started = time.perf_counter()
+            try:
+                response = view(request)
+                response.render()
+                return response.status_code, (time.perf_counter() - started) * 1000
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['sync_workers']) as pool:
+            results = list(pool.map(one, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        return self._summary(results, elapsed, processes=options['sync_workers'])
+
+    def _run_async(self, api_user, token, options):
+        view = AsyncAIProxyView.as_view()
+        factory = AsyncRequestFactory()
+        SlowStubHandler.peak_in_flight = 0
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def one(i):
+                async with semaphore:
+                    request = factory.post('/api/ai', data=self._body(api_user, i, 'async'),
+                                           content_type='application/json',
+                                           headers={'Authorization': f'Bearer {token}'})
+                    started = time.perf_counter()
+                    response = await view(request)
+                    return response.status_code, (time.perf_counter() - started) * 1000
+
+            return await asyncio.gather(*[one(i) for i in range(options['requests'])])
+
+        started = time.perf_counter()
+        results = asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+        return self._summary(results, elapsed, processes=1)
+
+    @staticmethod
+    def _summary(results, elapsed, processes):
+        latencies = [ms for _, ms in results]
+        rps = len(results) / elapsed if elapsed else 0.0
+        return {
+            'processes': processes,
+            'ok': sum(1 for code, _ in results if code == 200),
+            'elapsed_s': round(elapsed, 3),
+            'rps': round(rps, 1),
+            'rps_per_process': round(rps / processes, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'peak_upstream_in_flight': SlowStubHandler.peak_in_flight,
+        }
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from shared.openai_client import OpenAIClientRegistry
+from shared.stats import percentile
+
+
+COMPLETION = json.dumps({
+    'id': 'chatcmpl-bench',
+    'object': 'chat.completion',
+    'created': 0,
+    'model': 'gpt-4o-mini',
+    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': 'ok'}}],
+    'usage': {'prompt_tokens': 5, 'completion_tokens': 1, 'total_tokens': 6},
+}).encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive chat.completions endpoint"""
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment so keep-alive is not penalised by delayed ACKs
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+    connections = set()
+
+    def do_POST(self):
+        StubHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request OpenAI client construction with the shared per-process client'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Completions per mode')
+        parser.add_argument('--base-url', default=None,
+                            help='OpenAI-compatible base URL; a local keep-alive stub is started when omitted')
+        parser.add_argument('--model', default='gpt-4o-mini')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        server = None
+        base_url = options['base_url']
+        if not base_url:
+            server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        api_key = getattr(settings, 'OPENAI_API_KEY', None) or 'bench-key'
+        previous_base_url = os.environ.get('OPENAI_BASE_URL')
+        os.environ['OPENAI_BASE_URL'] = base_url
+        try:
+            from openai import OpenAI
+
+            registry = OpenAIClientRegistry()
+            report = {
+                'requests': options['requests'],
+                'base_url': base_url,
+                'per_request_client': self._run(lambda: OpenAI(api_key=api_key), options),
+                'shared_client': self._run(lambda: registry.get(api_key), options),
+            }
+            registry.reset()
+        finally:
+            if previous_base_url is None:
+                os.environ.pop('OPENAI_BASE_URL', None)
+            else:
+                os.environ['OPENAI_BASE_URL'] = previous_base_url
+            if server is not None:
+                server.shutdown()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for mode in ('per_request_client', 'shared_client'):
+            self.stdout.write(mode)
+            for key, value in report[mode].items():
+                self.stdout.write(f"{key:>24}: {value}")
+
+    def _run(self, get_client, options):
+        StubHandler.connections = set()
+        construct_us, total_ms = [], []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            client = get_client()
+            constructed = time.perf_counter()
+            client.chat.completions.create(
+                model=options['model'],
+                messages=[{'role': 'user', 'content': 'ping'}],
+                max_tokens=1,
+            )
+            finished = time.perf_counter()
+            construct_us.append((constructed - started) * 1_000_000)
+            total_ms.append((finished - started) * 1000)
+
+        return {
+            'client_setup_mean_us': round(sum(construct_us) / len(construct_us), 1),
+            'request_p50_ms': round(percentile(total_ms, 50), 3),
+            'request_p95_ms': round(percentile(total_ms, 95), 3),
+            'request_p99_ms': round(percentile(total_ms, 99), 3),
+            # Only known for the local stub: distinct client sockets opened
+            'connections_opened': len(StubHandler.connections) or None,
+        }
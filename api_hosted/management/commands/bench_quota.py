@@ -0,0 +1,118 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api_hosted.models import APIUser
+from api_hosted.quota import ProjectReservation
+from shared.exceptions import QuotaExceededError
+
+
+class Command(BaseCommand):
+    help = 'Hammer free-tier project reservations from many threads and verify no quota is over- or under-spent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Number of benchmark users')
+        parser.add_argument('--quota', type=int, default=3, help='Free projects per user')
+        parser.add_argument('--requests', type=int, default=500, help='Total new-project requests')
+        parser.add_argument('--concurrency', type=int, default=200, help='Parallel requests')
+        parser.add_argument('--fail-ratio', type=float, default=0.2, help='Fraction of simulated AI calls that fail')
+        parser.add_argument('--upstream-ms', type=float, default=5.0, help='Simulated AI call latency')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Use the old read/check/decrement/save() flow for comparison')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        run_id = f"bench_quota_{int(time.time() * 1000)}"
+        user_ids = [f"{run_id}_{i}" for i in range(options['users'])]
+        APIUser.objects.bulk_create([
+            APIUser(id=user_id, email=f"{user_id}@bench.invalid", projects_remaining=options['quota'])
+            for user_id in user_ids
+        ])
+
+        plan = [(rng.choice(user_ids), rng.random() < options['fail_ratio']) for _ in range(options['requests'])]
+        attempt = self._legacy_attempt if options['legacy'] else self._attempt
+        upstream = options['upstream_ms'] / 1000.0
+
+        def run(item):
+            user_id, fails = item
+            try:
+                return user_id, attempt(user_id, fails, upstream), None
+            except Exception as e:
+                return user_id, 'error', f"{type(e).__name__}: {e}"
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as pool:
+                outcomes = list(pool.map(run, plan))
+            elapsed = time.perf_counter() - started
+
+            served = {user_id: 0 for user_id in user_ids}
+            for user_id, outcome, _ in outcomes:
+                if outcome == 'served':
+                    served[user_id] += 1
+            remaining = dict(APIUser.objects.filter(id__in=user_ids).values_list('id', 'projects_remaining'))
+        finally:
+            APIUser.objects.filter(id__in=user_ids).delete()
+
+        # Correct iff every user was served at most `quota` projects and the
+        # counter equals quota minus projects actually served
+        violations = sum(
+            1 for user_id in user_ids
+            if served[user_id] > options['quota'] or remaining[user_id] != options['quota'] - served[user_id]
+        )
+        counts, errors = {}, {}
+        for _, outcome, error in outcomes:
+            counts[outcome] = counts.get(outcome, 0) + 1
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+        report = {
+            'mode': 'legacy' if options['legacy'] else 'reservation',
+            'requests': len(outcomes),
+            'concurrency': options['concurrency'],
+            'elapsed_s': round(elapsed, 3),
+            'outcomes': counts,
+            # Exception type and message per failed request (a served or refunded project is never an error)
+            'errors': errors,
+            'projects_served': sum(served.values()),
+            'max_servable': options['users'] * options['quota'],
+            'users_with_wrong_count': violations,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for key, value in report.items():
+                self.stdout.write(f"{key:>24}: {value}")
+
+    @staticmethod
+    def _attempt(user_id, fails, upstream):
+        # The request path gets its user from the principal cache, not a fresh SELECT;
+        # reserve() only needs the primary key
+        api_user = APIUser(pk=user_id, projects_remaining=0)
+        try:
+            reservation = ProjectReservation.reserve(api_user)
+        except QuotaExceededError:
+            return 'limit_reached'
+        time.sleep(upstream)
+        if fails:
+            reservation.refund()
+            return 'upstream_failed'
+        reservation.commit()
+        return 'served'
+
+    @staticmethod
+    def _legacy_attempt(user_id, fails, upstream):
+        api_user = APIUser.objects.get(pk=user_id)
+        if api_user.projects_remaining <= 0:
+            return 'limit_reached'
+        api_user.projects_remaining -= 1
+        api_user.save()
+        time.sleep(upstream)
+        return 'upstream_failed' if fails else 'served'
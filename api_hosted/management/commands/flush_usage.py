@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api_hosted.usage import usage_recorder
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered usage events to the database (replays batches abandoned by crashed flushers)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between flushes with --loop')
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per batch')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = usage_recorder.flush_all(options['batch_size'])
+            if flushed or not options['loop']:
+                self.stdout.write(f"flushed {flushed} usage events")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
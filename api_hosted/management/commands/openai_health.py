@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from shared.openai_client import openai_clients
+
+
+class Command(BaseCommand):
+    help = 'Probe the OpenAI API through the shared per-process client (exit code 1 when unhealthy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=float, default=5.0, help='Seconds before the probe gives up')
+
+    def handle(self, *args, **options):
+        result = openai_clients.health_check(timeout=options['timeout'])
+        self.stdout.write(json.dumps(result))
+        if not result['ok']:
+            raise SystemExit(1)
@@ -0,0 +1,57 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from api_hosted.models import UsageLog
+from api_hosted.services import MODEL_PRICING
+
+# OpenAI bills prompt tokens served from its prompt cache at half the input rate
+CACHED_TOKEN_DISCOUNT = 0.5
+
+
+class Command(BaseCommand):
+    help = 'Provider prompt cache hit ratio (cached / prompt tokens) per prompt template and model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Look back this many days')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        rows = (
+            UsageLog.objects
+            .filter(timestamp__gte=since, prompt_tokens__gt=0)
+            .values('prompt_template', 'model')
+            .annotate(requests=Count('id'), prompt_tokens=Sum('prompt_tokens'), cached_tokens=Sum('cached_tokens'))
+            .order_by('prompt_template', 'model')
+        )
+
+        report = []
+        for row in rows:
+            rate = MODEL_PRICING.get(row['model'], 0.15)
+            report.append({
+                'template': row['prompt_template'] or '-',
+                'model': row['model'],
+                'requests': row['requests'],
+                'prompt_tokens': row['prompt_tokens'],
+                'cached_tokens': row['cached_tokens'],
+                'hit_ratio': round(row['cached_tokens'] / row['prompt_tokens'], 4),
+                'saved_usd': round(row['cached_tokens'] / 1_000_000 * rate * CACHED_TOKEN_DISCOUNT, 4),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if not report:
+            self.stdout.write(f"No usage with prompt token counts in the last {options['days']} days")
+            return
+        self.stdout.write(f"{'template':<16}{'model':<16}{'requests':>10}{'prompt':>12}{'cached':>12}"
+                          f"{'hit ratio':>11}{'saved $':>10}")
+        for row in report:
+            self.stdout.write(
+                f"{row['template']:<16}{row['model']:<16}{row['requests']:>10}{row['prompt_tokens']:>12}"
+                f"{row['cached_tokens']:>12}{row['hit_ratio']:>11.2%}{row['saved_usd']:>10.4f}"
+            )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api_hosted.revocation import token_denylist
+
+
+class Command(BaseCommand):
+    help = 'Delete JWT denylist entries past their expiry (run periodically, e.g. daily from cron)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"purged {token_denylist.purge()} expired JWT revocations")
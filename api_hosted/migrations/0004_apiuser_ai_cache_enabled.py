@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0003_apiuser_is_pro_apiuser_projects_remaining_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apiuser',
+            name='ai_cache_enabled',
+            field=models.BooleanField(default=True, help_text='Serve repeated prompts from the AI response cache'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0004_apiuser_ai_cache_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='event_id',
+            field=models.CharField(blank=True, editable=False, help_text='Usage event ID; makes write-behind replays idempotent', max_length=36, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='usagelog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0005_usagelog_event_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'usage_rollup_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('requests', models.IntegerField(default=0)),
+                ('tokens_used', models.BigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('api_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='api_hosted.apiuser')),
+            ],
+            options={
+                'db_table': 'usage_daily_rollups',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('api_user', 'day'), name='usage_daily_user_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UsageHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('hour', models.DateTimeField(help_text='Start of the hour')),
+                ('requests', models.IntegerField(default=0)),
+                ('tokens_used', models.BigIntegerField(default=0)),
+                ('cost', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('api_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_usage', to='api_hosted.apiuser')),
+            ],
+            options={
+                'db_table': 'usage_hourly_rollups',
+                'ordering': ['-hour'],
+                'constraints': [models.UniqueConstraint(fields=('api_user', 'model', 'hour'), name='usage_hourly_user_model_hour_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0006_usage_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='fallback_used',
+            field=models.BooleanField(default=False, help_text='Served by a fallback model'),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='hedged',
+            field=models.BooleanField(default=False, help_text='A hedged second request was sent'),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='latency_ms',
+            field=models.IntegerField(blank=True, help_text='Upstream latency including fallbacks', null=True),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='requested_model',
+            field=models.CharField(blank=True, default='', help_text='Model pinned by the client, if any', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='route',
+            field=models.CharField(blank=True, default='', help_text='Routing rule that picked the model', max_length=50),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0007_usagelog_routing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='cached_tokens',
+            field=models.IntegerField(default=0, help_text="Prompt tokens served from the provider's prompt cache"),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='prompt_template',
+            field=models.CharField(blank=True, default='', help_text='Prompt template used', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='usagelog',
+            name='prompt_tokens',
+            field=models.IntegerField(default=0, help_text='Prompt tokens billed upstream'),
+        ),
+    ]
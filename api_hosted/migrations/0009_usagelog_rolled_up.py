@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:07
+
+from django.db import migrations, models
+
+
+def flag_folded_rows(apps, schema_editor):
+    """Rows up to the old id watermark are already in the rollups"""
+    RollupWatermark = apps.get_model('api_hosted', 'RollupWatermark')
+    UsageLog = apps.get_model('api_hosted', 'UsageLog')
+    last_id = RollupWatermark.objects.filter(name='usage_rollups').values_list('last_id', flat=True).first()
+    if last_id:
+        UsageLog.objects.filter(id__lte=last_id).update(rolled_up=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0008_usagelog_prompt_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='rolled_up',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(flag_folded_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='usagelog',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='usage_logs_unrolled_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0009_usagelog_rolled_up'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='requests',
+            field=models.IntegerField(default=1, help_text='AI calls this row accounts for (batch rows sum several)'),
+        ),
+    ]
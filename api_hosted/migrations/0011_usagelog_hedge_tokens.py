@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0010_usagelog_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagelog',
+            name='hedge_tokens',
+            field=models.IntegerField(default=0, help_text='Estimated tokens billed for the discarded hedge attempt'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_hosted', '0011_usagelog_hedge_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JWTRevocation',
+            fields=[
+                ('key', models.CharField(help_text="'jti:<jti>' or 'user:<userId>'", max_length=300, primary_key=True, serialize=False)),
+                ('user_id', models.CharField(db_index=True, max_length=255)),
+                ('revoked_before', models.FloatField(blank=True, help_text='User cutoff: tokens issued at or before this epoch time are revoked', null=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='No token this entry covers is valid after it')),
+            ],
+            options={
+                'db_table': 'jwt_revocations',
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 
 
@@ -6,7 +7,7 @@ class APIUser(models.Model):
     """User accounts for hosted API service"""
     id = models.CharField(max_length=255, primary_key=True)
     email = models.EmailField(unique=True, db_index=True)
-    auth_token = models.TextField(null=True, blank=True)
+    auth_token = models.TextField(null=True, blank=True)  # Legacy: /api/auth tokens are stateless and no longer stored
     created_at = models.DateTimeField(auto_now_add=True)
     total_requests = models.IntegerField(default=0)
     total_tokens_used = models.IntegerField(default=0)
@@ -17,6 +18,8 @@ class APIUser(models.Model):
     subscription_id = models.CharField(max_length=255, null=True, blank=True, help_text="Stripe subscription ID")
     stripe_customer_id = models.CharField(max_length=255, null=True, blank=True, help_text="Stripe customer ID")
     
+    ai_cache_enabled = models.BooleanField(default=True, help_text="Serve repeated prompts from the AI response cache")
+    
     class Meta:
         db_table = 'api_users'
         ordering = ['-created_at']
@@ -34,20 +37,107 @@ class APIUser(models.Model):
 class UsageLog(models.Model):
     """Track API usage for billing and analytics"""
     api_user = models.ForeignKey(APIUser, on_delete=models.CASCADE, related_name='usage_logs')
-    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Event time, not insert time: write-behind flushes insert rows after the fact
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
     action = models.CharField(max_length=100, help_text="API action performed")
+    requests = models.IntegerField(default=1, help_text="AI calls this row accounts for (batch rows sum several)")
     tokens_used = models.IntegerField(default=0)
     cost = models.DecimalField(max_digits=10, decimal_places=4, default=0)
     model = models.CharField(max_length=50, default='gpt-4o-mini')
     prompt_length = models.IntegerField(default=0, help_text="Character length of prompt")
+    event_id = models.CharField(max_length=36, null=True, blank=True, unique=True, editable=False,
+                                help_text="Usage event ID; makes write-behind replays idempotent")
+    # Model routing decision (api_hosted/routing.py)
+    route = models.CharField(max_length=50, blank=True, default='', help_text="Routing rule that picked the model")
+    requested_model = models.CharField(max_length=50, blank=True, default='',
+                                       help_text="Model pinned by the client, if any")
+    fallback_used = models.BooleanField(default=False, help_text="Served by a fallback model")
+    hedged = models.BooleanField(default=False, help_text="A hedged second request was sent")
+    hedge_tokens = models.IntegerField(default=0, help_text="Estimated tokens billed for the discarded hedge attempt")
+    latency_ms = models.IntegerField(null=True, blank=True, help_text="Upstream latency including fallbacks")
+    # Provider prompt caching (shared/prompts.py)
+    prompt_template = models.CharField(max_length=50, blank=True, default='', help_text="Prompt template used")
+    prompt_tokens = models.IntegerField(default=0, help_text="Prompt tokens billed upstream")
+    cached_tokens = models.IntegerField(default=0, help_text="Prompt tokens served from the provider's prompt cache")
+    # Folded into the usage rollups (api_hosted/rollups.py)
+    rolled_up = models.BooleanField(default=False, editable=False)
     
     class Meta:
         db_table = 'usage_logs'
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['api_user', 'timestamp']),
+            # Only the aggregator's backlog is indexed
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='usage_logs_unrolled_idx'),
         ]
     
     def __str__(self):
         return f"{self.api_user.email} - {self.action} ({self.timestamp})"
 
+
+
+class UsageHourlyRollup(models.Model):
+    """UsageLog aggregated per user, model and hour (UTC)"""
+    api_user = models.ForeignKey(APIUser, on_delete=models.CASCADE, related_name='hourly_usage')
+    model = models.CharField(max_length=50)
+    hour = models.DateTimeField(help_text="Start of the hour")
+    requests = models.IntegerField(default=0)
+    tokens_used = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    
+    class Meta:
+        db_table = 'usage_hourly_rollups'
+        ordering = ['-hour']
+        constraints = [
+            models.UniqueConstraint(fields=['api_user', 'model', 'hour'], name='usage_hourly_user_model_hour_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.api_user_id} {self.model} {self.hour:%Y-%m-%d %H:00}"
+
+
+class UsageDailyRollup(models.Model):
+    """UsageLog aggregated per user and day (UTC)"""
+    api_user = models.ForeignKey(APIUser, on_delete=models.CASCADE, related_name='daily_usage')
+    day = models.DateField()
+    requests = models.IntegerField(default=0)
+    tokens_used = models.BigIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    
+    class Meta:
+        db_table = 'usage_daily_rollups'
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['api_user', 'day'], name='usage_daily_user_day_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.api_user_id} {self.day}"
+
+
+class RollupWatermark(models.Model):
+    """Aggregator lock row; last_id records the highest UsageLog id folded so far"""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'usage_rollup_watermarks'
+    
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class JWTRevocation(models.Model):
+    """Revoked /api/auth token or per-user revocation cutoff (api_hosted/revocation.py)"""
+    key = models.CharField(max_length=300, primary_key=True, help_text="'jti:<jti>' or 'user:<userId>'")
+    user_id = models.CharField(max_length=255, db_index=True)
+    revoked_before = models.FloatField(null=True, blank=True,
+                                       help_text="User cutoff: tokens issued at or before this epoch time are revoked")
+    expires_at = models.DateTimeField(db_index=True, help_text="No token this entry covers is valid after it")
+    
+    class Meta:
+        db_table = 'jwt_revocations'
+    
+    def __str__(self):
+        return self.key
@@ -0,0 +1,190 @@
+"""
+Cached authenticated principals for JWTAuthentication
+
+Decoding the JWT is CPU only, but resolving it to an APIUser used to cost a
+SELECT on every authenticated request. PrincipalCache keeps a snapshot of
+the fields requests authorize on (email, is_pro, projects_remaining,
+ai_cache_enabled, Stripe ids) in two tiers:
+
+    - a process-local LRU with a short TTL (AUTH_PRINCIPAL_LOCAL_TTL), which
+      bounds how stale another worker's copy can be
+    - the shared Django cache (Redis when CACHE_REDIS_URL is set) with a
+      longer TTL (AUTH_PRINCIPAL_CACHE_TTL); without Redis that cache is
+      per-process too, so its TTL is capped to AUTH_PRINCIPAL_LOCAL_TTL
+
+Both tiers are invalidated when an APIUser is saved or deleted (see
+api_hosted/signals.py), which covers the Stripe webhook handlers, and when a
+project reservation changes projects_remaining. Users are rebuilt with the
+other fields deferred, so reading e.g. total_cost still loads it from the
+database. projects_remaining is only a snapshot: quota is enforced by the
+atomic UPDATE in api_hosted/quota.py, never by the cached value.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from api_hosted.models import APIUser
+
+logger = logging.getLogger('provokely.api_hosted')
+
+PRINCIPAL_FIELDS = (
+    'id', 'email', 'is_pro', 'projects_remaining', 'ai_cache_enabled', 'subscription_id', 'stripe_customer_id',
+)
+
+
+class PrincipalCache:
+    """Two-tier (local LRU + shared cache) APIUser snapshots keyed by user id"""
+
+    KEY_PREFIX = 'auth_principal'
+
+    def __init__(self, alias='default'):
+        """
+        Args:
+            alias: Django cache alias of the shared tier
+        """
+        self.alias = alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'AUTH_PRINCIPAL_CACHE_ENABLED', True)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, user_id):
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def _ttl(self):
+        ttl = getattr(settings, 'AUTH_PRINCIPAL_CACHE_TTL', 300)
+        if isinstance(self.cache, LocMemCache):
+            # Per process: other workers never see this worker's invalidations
+            return min(ttl, getattr(settings, 'AUTH_PRINCIPAL_LOCAL_TTL', 5))
+        return ttl
+
+    @staticmethod
+    def _snapshot(api_user):
+        return {field: getattr(api_user, field) for field in PRINCIPAL_FIELDS}
+
+    @staticmethod
+    def _instance(snapshot):
+        # Deferred fields are fetched on first access, like .only(*PRINCIPAL_FIELDS);
+        # from_db() takes the values in model field order
+        names = [f.attname for f in APIUser._meta.concrete_fields if f.attname in snapshot]
+        return APIUser.from_db('default', names, [snapshot[name] for name in names])
+
+    def _local_get(self, user_id):
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is None:
+                return None
+            snapshot, expires = entry
+            if expires <= time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return snapshot
+
+    def _local_set(self, user_id, snapshot):
+        ttl = getattr(settings, 'AUTH_PRINCIPAL_LOCAL_TTL', 5)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._local[user_id] = (snapshot, time.monotonic() + ttl)
+            self._local.move_to_end(user_id)
+            while len(self._local) > getattr(settings, 'AUTH_PRINCIPAL_LOCAL_MAX_ENTRIES', 10000):
+                self._local.popitem(last=False)
+
+    def _shared_get(self, user_id):
+        try:
+            return self.cache.get(self._key(user_id))
+        except Exception as e:
+            # A cache outage falls back to the database
+            logger.warning('Principal cache read failed: %s', e)
+            return None
+
+    def _shared_set(self, user_id, snapshot):
+        try:
+            self.cache.set(self._key(user_id), snapshot, timeout=self._ttl())
+        except Exception as e:
+            logger.warning('Principal cache write failed: %s', e)
+
+    def get(self, user_id, email):
+        """
+        APIUser for a verified token's (user id, email)
+
+        Args:
+            user_id: Token's userId claim
+            email: Token's email claim
+
+        Returns:
+            APIUser: With PRINCIPAL_FIELDS loaded (other fields deferred)
+
+        Raises:
+            APIUser.DoesNotExist: If no user has this id and email
+        """
+        if not self.enabled():
+            return APIUser.objects.get(id=user_id, email=email)
+
+        snapshot = self._local_get(user_id)
+        if snapshot is None:
+            snapshot = self._shared_get(user_id)
+            if snapshot is not None:
+                self._local_set(user_id, snapshot)
+        if snapshot is not None and snapshot['email'] == email:
+            return self._instance(snapshot)
+
+        api_user = APIUser.objects.only(*PRINCIPAL_FIELDS).get(id=user_id, email=email)
+        snapshot = self._snapshot(api_user)
+        self._shared_set(user_id, snapshot)
+        self._local_set(user_id, snapshot)
+        return api_user
+
+    async def aget(self, user_id, email):
+        """Async get(): shared tier and database are queried without blocking the event loop"""
+        if not self.enabled():
+            return await APIUser.objects.aget(id=user_id, email=email)
+
+        snapshot = self._local_get(user_id)
+        if snapshot is None:
+            try:
+                snapshot = await self.cache.aget(self._key(user_id))
+            except Exception as e:
+                logger.warning('Principal cache read failed: %s', e)
+            if snapshot is not None:
+                self._local_set(user_id, snapshot)
+        if snapshot is not None and snapshot['email'] == email:
+            return self._instance(snapshot)
+
+        api_user = await APIUser.objects.only(*PRINCIPAL_FIELDS).aget(id=user_id, email=email)
+        snapshot = self._snapshot(api_user)
+        try:
+            await self.cache.aset(self._key(user_id), snapshot, timeout=self._ttl())
+        except Exception as e:
+            logger.warning('Principal cache write failed: %s', e)
+        self._local_set(user_id, snapshot)
+        return api_user
+
+    def invalidate(self, user_id):
+        """Drop a user's snapshot from this process and the shared tier"""
+        with self._lock:
+            self._local.pop(user_id, None)
+        try:
+            self.cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.warning('Principal cache invalidation failed: %s', e)
+
+    def clear_local(self):
+        """Forget this process' snapshots (tests)"""
+        with self._lock:
+            self._local.clear()
+
+
+principal_cache = PrincipalCache()
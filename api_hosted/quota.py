@@ -0,0 +1,110 @@
+"""
+Atomic free-tier project quota
+
+A request that starts a new project reserves one project with a single
+conditional UPDATE (... SET projects_remaining = projects_remaining - 1
+WHERE projects_remaining > 0), so concurrent requests can never take the
+counter below zero. The reservation is committed once the AI call succeeded
+and refunded with an atomic increment when it failed.
+"""
+import logging
+import time
+
+from django.db import DatabaseError
+from django.db.models import F
+
+from api_hosted.models import APIUser
+from api_hosted.principals import principal_cache
+from shared.exceptions import QuotaExceededError
+
+logger = logging.getLogger('provokely.api_hosted')
+
+
+class ProjectReservation:
+    """One reserved free-tier project; commit on success, refund on failure"""
+
+    RESERVE_ATTEMPTS = 3
+    REFUND_ATTEMPTS = 3
+
+    def __init__(self, api_user, amount=1):
+        """
+        Args:
+            api_user: APIUser the project was reserved for
+            amount: Number of projects reserved
+        """
+        self.api_user = api_user
+        self.amount = amount
+        self.settled = False
+
+    @classmethod
+    def reserve(cls, api_user, amount=1):
+        """
+        Atomically take `amount` projects from the user's remaining quota
+
+        Args:
+            api_user: APIUser instance
+            amount: Number of projects to reserve
+
+        Returns:
+            ProjectReservation
+
+        Raises:
+            QuotaExceededError: If fewer than `amount` projects remain
+            DatabaseError: If the UPDATE still fails after RESERVE_ATTEMPTS tries
+        """
+        for attempt in range(cls.RESERVE_ATTEMPTS):
+            try:
+                updated = APIUser.objects.filter(
+                    pk=api_user.pk,
+                    projects_remaining__gte=amount
+                ).update(projects_remaining=F('projects_remaining') - amount)
+                break
+            except DatabaseError as e:
+                # Lock timeouts under write contention ('database is locked' on SQLite):
+                # the failed UPDATE changed nothing, so it is safe to run again
+                if attempt == cls.RESERVE_ATTEMPTS - 1:
+                    logger.warning('Quota reservation for %s failed: %s', api_user.pk, e)
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+        if not updated:
+            raise QuotaExceededError('No free validations remaining')
+        # Queryset updates send no save signal: drop the cached principal's snapshot
+        principal_cache.invalidate(api_user.pk)
+
+        # Keep the in-memory instance roughly in step for responses; never save() it
+        api_user.projects_remaining = max(0, api_user.projects_remaining - amount)
+        return cls(api_user, amount)
+
+    def commit(self):
+        """Keep the reservation (the AI call succeeded)"""
+        self.settled = True
+
+    def refund(self):
+        """Give the reserved projects back (the AI call failed); idempotent"""
+        if self.settled:
+            return
+        self.settled = True
+        for attempt in range(self.REFUND_ATTEMPTS):
+            try:
+                APIUser.objects.filter(pk=self.api_user.pk).update(
+                    projects_remaining=F('projects_remaining') + self.amount
+                )
+                break
+            except DatabaseError as e:
+                # Lock timeouts under write contention: the user must not lose the project
+                if attempt == self.REFUND_ATTEMPTS - 1:
+                    logger.error('Quota refund of %s for %s failed: %s', self.amount, self.api_user.pk, e)
+                    raise
+                time.sleep(0.05 * (attempt + 1))
+        principal_cache.invalidate(self.api_user.pk)
+        self.api_user.projects_remaining += self.amount
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.refund()
+        return False
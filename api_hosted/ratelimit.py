@@ -0,0 +1,268 @@
+"""
+Per-user rate limiting for the AI proxy
+
+Each APIUser gets:
+    - a cap on concurrent in-flight /api/ai requests, so one heavy user
+      cannot occupy every sync worker with long completions
+    - a requests-per-minute and a tokens-per-minute token bucket
+
+Pro users get higher limits (settings.AI_RATE_LIMITS); buckets are keyed by
+tier, so an upgrade starts from a full Pro bucket. Token buckets are charged
+the pre-flight estimate (prompt + max_tokens) and credited the unused part
+once the real usage is known.
+
+State lives in Redis (RATE_LIMIT_REDIS_URL, default CACHE_REDIS_URL) and is
+updated with Lua scripts so every worker sees the same counters; without
+Redis it is kept per process. A store outage fails open.
+"""
+import logging
+import math
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger('provokely.api_hosted')
+
+DEFAULT_LIMITS = {
+    'free': {'concurrency': 2, 'requests_per_minute': 20, 'tokens_per_minute': 40000},
+    'pro': {'concurrency': 8, 'requests_per_minute': 120, 'tokens_per_minute': 400000},
+}
+
+# Slots of a crashed worker are reclaimed after this many seconds
+INFLIGHT_TTL = 600
+
+# KEYS: bucket hashes. ARGV: now, then (capacity, refill per second, cost) per key.
+# Either every bucket is charged or none is; returns {allowed, index of the
+# limiting bucket (1-based, 0 if allowed), seconds until it has enough tokens}.
+TAKE_BUCKETS_LUA = """
+local now = tonumber(ARGV[1])
+local state = {}
+local worst, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local stored = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(stored[1]) or capacity
+    local ts = tonumber(stored[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    state[i] = {tokens, capacity, rate, cost}
+    if cost > tokens and (cost - tokens) / rate > wait then
+        worst, wait = i, (cost - tokens) / rate
+    end
+end
+local allowed = worst == 0
+for i, key in ipairs(KEYS) do
+    local tokens, capacity, rate, cost = unpack(state[i])
+    if allowed then tokens = math.min(capacity, tokens - cost) end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+return {allowed and 1 or 0, worst, tostring(wait)}
+"""
+
+# KEYS: in-flight sorted set (slot id -> acquired at). ARGV: limit, now, ttl, slot id.
+# Slots older than ttl are dropped one by one, so a crashed worker's slot is
+# reclaimed even while the user keeps retrying; rejections change nothing.
+ACQUIRE_SLOT_LUA = """
+local now = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+return 1
+"""
+
+
+class LocalRateLimitStore:
+    """Process-local counters (development and single-process deployments)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._buckets = {}
+
+    def acquire_slot(self, key, limit, now):
+        """Slot id if fewer than `limit` slots are held (slots older than INFLIGHT_TTL expire), else None"""
+        with self._lock:
+            slots = self._slots.setdefault(key, {})
+            for slot, acquired in list(slots.items()):
+                if acquired <= now - INFLIGHT_TTL:
+                    del slots[slot]
+            if len(slots) >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            slots[slot] = now
+            return slot
+
+    def release_slot(self, key, slot):
+        with self._lock:
+            self._slots.get(key, {}).pop(slot, None)
+
+    def take(self, buckets, now):
+        """buckets: [(key, capacity, rate, cost)] -> (allowed, limiting index or None, wait seconds)"""
+        with self._lock:
+            levels, worst, wait = [], None, 0.0
+            for i, (key, capacity, rate, cost) in enumerate(buckets):
+                tokens, ts = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+                levels.append(tokens)
+                if cost > tokens and (cost - tokens) / rate > wait:
+                    worst, wait = i, (cost - tokens) / rate
+            allowed = worst is None
+            for (key, capacity, rate, cost), tokens in zip(buckets, levels):
+                self._buckets[key] = (min(capacity, tokens - cost) if allowed else tokens, now)
+            return allowed, worst, wait
+
+
+class RedisRateLimitStore:
+    """Counters shared by all workers through Redis"""
+
+    def __init__(self, url):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self._take = self.redis.register_script(TAKE_BUCKETS_LUA)
+        self._acquire = self.redis.register_script(ACQUIRE_SLOT_LUA)
+
+    def acquire_slot(self, key, limit, now):
+        slot = uuid.uuid4().hex
+        return slot if self._acquire(keys=[key], args=[limit, now, INFLIGHT_TTL, slot]) else None
+
+    def release_slot(self, key, slot):
+        self.redis.zrem(key, slot)
+
+    def take(self, buckets, now):
+        args = [now]
+        for _, capacity, rate, cost in buckets:
+            args.extend([capacity, rate, cost])
+        allowed, worst, wait = self._take(keys=[b[0] for b in buckets], args=args)
+        return bool(allowed), (int(worst) - 1 if int(worst) else None), float(wait)
+
+
+class RateLimitPermit:
+    """An admitted request: holds a concurrency slot and its token charge"""
+
+    def __init__(self, limiter, user_id, tier, charged_tokens, slot=None):
+        self.limiter = limiter
+        self.user_id = user_id
+        self.tier = tier
+        self.charged_tokens = charged_tokens
+        self.slot = slot
+        self.released = False
+
+    def release(self, tokens_used=None):
+        """
+        Free the concurrency slot and credit back unused tokens; idempotent
+
+        Args:
+            tokens_used: Actual tokens consumed (None: credit the whole charge)
+        """
+        if self.released:
+            return
+        self.released = True
+        self.limiter.release(self, tokens_used)
+
+
+class AIRateLimiter:
+    """Admit or reject /api/ai requests per user"""
+
+    KEY_PREFIX = 'ai_rl'
+
+    def __init__(self, store=None):
+        """
+        Args:
+            store: LocalRateLimitStore/RedisRateLimitStore; chosen from settings on first use when omitted
+        """
+        self._store = store
+        self._store_lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    url = getattr(settings, 'RATE_LIMIT_REDIS_URL', None)
+                    self._store = RedisRateLimitStore(url) if url else LocalRateLimitStore()
+        return self._store
+
+    @staticmethod
+    def limits_for_tier(tier):
+        """Limits for a tier: concurrency, requests_per_minute, tokens_per_minute"""
+        limits = dict(DEFAULT_LIMITS[tier])
+        limits.update(getattr(settings, 'AI_RATE_LIMITS', {}).get(tier, {}))
+        return limits
+
+    def limits_for(self, api_user):
+        """(tier, limits) for a user; Pro users get the higher limits"""
+        tier = 'pro' if api_user.is_pro else 'free'
+        return tier, self.limits_for_tier(tier)
+
+    def acquire(self, api_user, estimated_tokens, requests=1):
+        """
+        Admit a request or say how long to wait
+
+        Args:
+            api_user: APIUser instance
+            estimated_tokens: Upper bound of tokens the request can use
+            requests: Upstream calls the request makes (charged to the per-minute request bucket)
+
+        Returns:
+            tuple: (RateLimitPermit, None) when admitted, else
+                (None, {'limit': 'concurrency'|'requests'|'tokens', 'retry_after': seconds})
+        """
+        if not getattr(settings, 'AI_RATE_LIMIT_ENABLED', True):
+            return RateLimitPermit(self, api_user.pk, None, 0), None
+
+        tier, limits = self.limits_for(api_user)
+        slot_key = self._slot_key(api_user.pk)
+        token_capacity = limits['tokens_per_minute']
+        # A request larger than the whole bucket could never pass; charge at most a full bucket
+        charged = min(max(0, int(estimated_tokens)), token_capacity)
+
+        try:
+            now = time.time()
+            slot = self.store.acquire_slot(slot_key, limits['concurrency'], now)
+            if slot is None:
+                return None, {'limit': 'concurrency', 'retry_after': 1}
+
+            allowed, worst, wait = self.store.take([
+                (f"{self.KEY_PREFIX}:rpm:{tier}:{api_user.pk}", limits['requests_per_minute'],
+                 limits['requests_per_minute'] / 60.0, min(max(1, requests), limits['requests_per_minute'])),
+                (f"{self.KEY_PREFIX}:tpm:{tier}:{api_user.pk}", token_capacity, token_capacity / 60.0, charged),
+            ], now)
+            if not allowed:
+                self.store.release_slot(slot_key, slot)
+                return None, {
+                    'limit': 'requests' if worst == 0 else 'tokens',
+                    'retry_after': max(1, math.ceil(wait)),
+                }
+        except Exception as e:
+            logger.warning('Rate limit store unavailable, admitting request: %s', e)
+            return RateLimitPermit(self, api_user.pk, None, 0), None
+
+        return RateLimitPermit(self, api_user.pk, tier, charged, slot), None
+
+    def _slot_key(self, user_id):
+        return f"{self.KEY_PREFIX}:slots:{user_id}"
+
+    def release(self, permit, tokens_used=None):
+        if permit.tier is None:
+            return
+        try:
+            self.store.release_slot(self._slot_key(permit.user_id), permit.slot)
+            unused = permit.charged_tokens - (tokens_used or 0)
+            if unused > 0:
+                capacity = self.limits_for_tier(permit.tier)['tokens_per_minute']
+                self.store.take([
+                    (f"{self.KEY_PREFIX}:tpm:{permit.tier}:{permit.user_id}", capacity, capacity / 60.0, -unused),
+                ], time.time())
+        except Exception as e:
+            logger.warning('Rate limit release failed: %s', e)
+
+
+ai_rate_limiter = AIRateLimiter()
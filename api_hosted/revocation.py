@@ -0,0 +1,192 @@
+"""
+JWT denylist for the hosted API
+
+/api/auth tokens are stateless: nothing is stored per login, so revoking one
+needs a denylist instead of a token column. Entries are rows of the
+jwt_revocations table (JWTRevocation), which nothing evicts:
+
+    - jti:<jti>      one token, until that token's exp
+    - user:<userId>  every token of a user issued at or before revoked_before
+                     (epoch seconds, sub-second like the tokens' iat), for
+                     JWT_TOKEN_LIFETIME_DAYS
+
+Rows past expires_at cover no valid token and are deleted by
+`manage.py purge_jwt_revocations`.
+
+Checks read a user's revocation state (cutoff and revoked jtis) from the
+default cache, loading it from the table on a miss, so authenticated
+requests stay query-free while an evicted entry only costs a re-read, never
+a missed revocation. Revoking drops the cached state; with a per-process
+local memory cache other workers only see it once theirs expires, so there
+the TTL is capped to JWT_DENYLIST_LOCAL_TTL (5s). Tokens minted before jti
+existed can only be revoked per user.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from api_hosted.models import JWTRevocation
+
+logger = logging.getLogger('provokely.api_hosted')
+
+CACHE_PREFIX = 'jwt_revocations'
+TOKEN_PREFIX = 'jti'
+USER_PREFIX = 'user'
+
+
+class TokenDenylist:
+    """Revoked token ids and per-user revocation cutoffs"""
+
+    def __init__(self, alias='default'):
+        """
+        Args:
+            alias: Django cache alias holding the per-user revocation state
+        """
+        self.alias = alias
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'JWT_DENYLIST_ENABLED', True)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(user_id):
+        return f"{CACHE_PREFIX}:{user_id}"
+
+    def _ttl(self):
+        ttl = getattr(settings, 'JWT_DENYLIST_CACHE_TTL', 300)
+        if isinstance(self.cache, LocMemCache):
+            # Per process: other workers never see this worker's invalidations
+            return min(ttl, getattr(settings, 'JWT_DENYLIST_LOCAL_TTL', 5))
+        return ttl
+
+    @staticmethod
+    def _rows(user_id):
+        return JWTRevocation.objects.filter(user_id=user_id, expires_at__gt=timezone.now()).values_list(
+            'key', 'revoked_before'
+        )
+
+    @staticmethod
+    def _state(rows):
+        state = {'revoked_before': None, 'jtis': set()}
+        for key, revoked_before in rows:
+            if key.startswith(f"{TOKEN_PREFIX}:"):
+                state['jtis'].add(key[len(TOKEN_PREFIX) + 1:])
+            elif revoked_before is not None:
+                state['revoked_before'] = revoked_before
+        return state
+
+    @staticmethod
+    def _revoked(payload, state):
+        if payload.get('jti') and payload['jti'] in state['jtis']:
+            return True
+        revoked_before = state['revoked_before']
+        return revoked_before is not None and payload.get('iat', 0) <= revoked_before
+
+    def is_revoked(self, payload) -> bool:
+        """
+        Whether a verified token's payload has been revoked
+
+        Args:
+            payload: Decoded JWT payload (userId, iat, optional jti)
+
+        Returns:
+            bool: True if the token or all of its user's earlier tokens were revoked
+        """
+        if not self.enabled():
+            return False
+        cache_key = self._cache_key(payload.get('userId'))
+        try:
+            state = self.cache.get(cache_key)
+        except Exception as e:
+            # A cache outage falls back to the table
+            logger.warning('JWT denylist cache read failed: %s', e)
+            state = None
+        if state is None:
+            try:
+                state = self._state(self._rows(payload.get('userId')))
+            except Exception as e:
+                # Fail open: a database outage must not log every user out
+                logger.warning('JWT denylist read failed: %s', e)
+                return False
+            try:
+                self.cache.set(cache_key, state, timeout=self._ttl())
+            except Exception as e:
+                logger.warning('JWT denylist cache write failed: %s', e)
+        return self._revoked(payload, state)
+
+    async def ais_revoked(self, payload) -> bool:
+        """Async is_revoked()"""
+        if not self.enabled():
+            return False
+        cache_key = self._cache_key(payload.get('userId'))
+        try:
+            state = await self.cache.aget(cache_key)
+        except Exception as e:
+            logger.warning('JWT denylist cache read failed: %s', e)
+            state = None
+        if state is None:
+            try:
+                state = self._state([row async for row in self._rows(payload.get('userId'))])
+            except Exception as e:
+                logger.warning('JWT denylist read failed: %s', e)
+                return False
+            try:
+                await self.cache.aset(cache_key, state, timeout=self._ttl())
+            except Exception as e:
+                logger.warning('JWT denylist cache write failed: %s', e)
+        return self._revoked(payload, state)
+
+    def revoke_token(self, payload):
+        """
+        Revoke one token until it expires
+
+        Args:
+            payload: Decoded JWT payload; tokens without a jti revoke their user instead
+        """
+        if not payload.get('jti'):
+            self.revoke_user(payload.get('userId'))
+            return
+        expires_at = datetime.fromtimestamp(payload.get('exp', time.time()), tz=dt_timezone.utc)
+        JWTRevocation.objects.update_or_create(
+            key=f"{TOKEN_PREFIX}:{payload['jti']}",
+            defaults={'user_id': payload.get('userId'), 'expires_at': expires_at},
+        )
+        self._invalidate(payload.get('userId'))
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to a user so far"""
+        lifetime = timedelta(days=getattr(settings, 'JWT_TOKEN_LIFETIME_DAYS', 30))
+        JWTRevocation.objects.update_or_create(
+            key=f"{USER_PREFIX}:{user_id}",
+            defaults={'user_id': user_id, 'revoked_before': time.time(), 'expires_at': timezone.now() + lifetime},
+        )
+        self._invalidate(user_id)
+
+    def _invalidate(self, user_id):
+        try:
+            self.cache.delete(self._cache_key(user_id))
+        except Exception as e:
+            logger.warning('JWT denylist cache invalidation failed: %s', e)
+
+    @staticmethod
+    def purge() -> int:
+        """
+        Delete entries that no longer cover a valid token
+
+        Returns:
+            int: Rows deleted
+        """
+        deleted, _ = JWTRevocation.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+token_denylist = TokenDenylist()
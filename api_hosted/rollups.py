@@ -0,0 +1,187 @@
+"""
+Incremental usage rollups
+
+UsageLog grows with every AI call, so analytics and billing read
+UsageHourlyRollup (user x model x hour) and UsageDailyRollup (user x day)
+instead. The aggregator folds UsageLog rows into both tables and flags them
+rolled_up in the same transaction, so each run only reads rows not folded yet
+and a crashed run simply resumes.
+
+Rows are flagged rather than tracked by a high-water id or timestamp: with
+concurrent writers a transaction can commit a lower id after a higher one is
+already visible, and write-behind flushes insert rows with their (earlier)
+event time. Either would leave late rows below the mark forever.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from api_hosted.models import RollupWatermark, UsageDailyRollup, UsageHourlyRollup, UsageLog
+
+WATERMARK_NAME = 'usage_rollups'
+
+
+class UsageRollupAggregator:
+    """Fold new UsageLog rows into the hourly and daily rollups"""
+
+    def __init__(self, batch_size=5000):
+        """
+        Args:
+            batch_size: Max UsageLog rows folded per transaction
+        """
+        self.batch_size = batch_size
+
+    def run(self):
+        """
+        Aggregate until caught up
+
+        Returns:
+            int: Number of UsageLog rows folded in
+        """
+        total = 0
+        while True:
+            folded = self.run_once()
+            if not folded:
+                return total
+            total += folded
+
+    def run_once(self):
+        """
+        Fold the next batch of rows not rolled up yet
+
+        Returns:
+            int: Number of UsageLog rows folded in
+        """
+        with transaction.atomic():
+            RollupWatermark.objects.get_or_create(name=WATERMARK_NAME)
+            # Row lock serialises concurrent aggregators (no-op on SQLite, which locks the DB)
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK_NAME)
+
+            # Explicit ids: rows committed while this batch runs are left for the next one
+            ids = list(
+                UsageLog.objects.filter(rolled_up=False).order_by('id').values_list('id', flat=True)[:self.batch_size]
+            )
+            if not ids:
+                return 0
+
+            groups = list(
+                UsageLog.objects.filter(id__in=ids)
+                .annotate(bucket=TruncHour('timestamp'))
+                .values('api_user_id', 'model', 'bucket')
+                .annotate(n=Sum('requests'), tokens=Sum('tokens_used'), spent=Sum('cost'))
+                .order_by()
+            )
+            self._apply_hourly(groups)
+            self._apply_daily(groups)
+
+            UsageLog.objects.filter(id__in=ids).update(rolled_up=True)
+            watermark.last_id = max(watermark.last_id, ids[-1])
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        return len(ids)
+
+    @staticmethod
+    def _apply_hourly(groups):
+        deltas = {(g['api_user_id'], g['model'], g['bucket']): g for g in groups}
+        existing = UsageHourlyRollup.objects.filter(
+            api_user_id__in={key[0] for key in deltas},
+            hour__in={key[2] for key in deltas},
+        )
+        updated = []
+        for row in existing:
+            group = deltas.pop((row.api_user_id, row.model, row.hour), None)
+            if group is None:
+                continue
+            row.requests += group['n']
+            row.tokens_used += group['tokens'] or 0
+            row.cost += group['spent'] or Decimal('0')
+            updated.append(row)
+        UsageHourlyRollup.objects.bulk_update(updated, ['requests', 'tokens_used', 'cost'])
+        UsageHourlyRollup.objects.bulk_create([
+            UsageHourlyRollup(
+                api_user_id=user_id, model=model, hour=hour,
+                requests=group['n'], tokens_used=group['tokens'] or 0, cost=group['spent'] or Decimal('0'),
+            )
+            for (user_id, model, hour), group in deltas.items()
+        ])
+
+    @staticmethod
+    def _apply_daily(groups):
+        deltas = defaultdict(lambda: {'n': 0, 'tokens': 0, 'spent': Decimal('0')})
+        for group in groups:
+            delta = deltas[(group['api_user_id'], group['bucket'].date())]
+            delta['n'] += group['n']
+            delta['tokens'] += group['tokens'] or 0
+            delta['spent'] += group['spent'] or Decimal('0')
+
+        existing = UsageDailyRollup.objects.filter(
+            api_user_id__in={key[0] for key in deltas},
+            day__in={key[1] for key in deltas},
+        )
+        updated = []
+        for row in existing:
+            delta = deltas.pop((row.api_user_id, row.day), None)
+            if delta is None:
+                continue
+            row.requests += delta['n']
+            row.tokens_used += delta['tokens']
+            row.cost += delta['spent']
+            updated.append(row)
+        UsageDailyRollup.objects.bulk_update(updated, ['requests', 'tokens_used', 'cost'])
+        UsageDailyRollup.objects.bulk_create([
+            UsageDailyRollup(api_user_id=user_id, day=day, requests=delta['n'],
+                             tokens_used=delta['tokens'], cost=delta['spent'])
+            for (user_id, day), delta in deltas.items()
+        ])
+
+
+def month_bounds(now=None):
+    """First day of the current UTC month and of the next one"""
+    now = now or timezone.now()
+    start = now.date().replace(day=1)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def usage_this_month(api_user, now=None):
+    """
+    Month-to-date usage for a user
+
+    Reads at most one daily rollup per day of the month, plus the UsageLog
+    rows not rolled up yet (the aggregator's lag).
+
+    Args:
+        api_user: APIUser instance
+        now: Reference time (defaults to now)
+
+    Returns:
+        dict: month, requests, tokens_used, cost and per-day rows
+    """
+    start, end = month_bounds(now)
+    days = {
+        row['day']: {'requests': row['requests'], 'tokens_used': row['tokens_used'], 'cost': row['cost']}
+        for row in UsageDailyRollup.objects.filter(api_user=api_user, day__gte=start, day__lt=end)
+        .values('day', 'requests', 'tokens_used', 'cost')
+    }
+
+    start_dt = datetime.datetime.combine(start, datetime.time.min, tzinfo=datetime.timezone.utc)
+    end_dt = datetime.datetime.combine(end, datetime.time.min, tzinfo=datetime.timezone.utc)
+    for row in UsageLog.objects.filter(api_user=api_user, rolled_up=False,
+                                       timestamp__gte=start_dt, timestamp__lt=end_dt
+                                       ).values('timestamp', 'requests', 'tokens_used', 'cost'):
+        day = days.setdefault(row['timestamp'].date(), {'requests': 0, 'tokens_used': 0, 'cost': Decimal('0')})
+        day['requests'] += row['requests']
+        day['tokens_used'] += row['tokens_used']
+        day['cost'] += row['cost']
+
+    return {
+        'month': start.strftime('%Y-%m'),
+        'requests': sum(day['requests'] for day in days.values()),
+        'tokens_used': sum(day['tokens_used'] for day in days.values()),
+        'cost': sum((day['cost'] for day in days.values()), Decimal('0')),
+        'days': [dict(day=d, **days[d]) for d in sorted(days)],
+    }
@@ -0,0 +1,249 @@
+"""
+Model routing for the AI proxy
+
+Requests used to go to `options.model` or gpt-4o-mini whatever their size or
+task. A routing policy now picks the model per request, first matching rule
+wins (settings.AI_ROUTING_RULES), keyed on:
+    - estimated prompt tokens (min_prompt_tokens / max_prompt_tokens)
+    - action: the client's `options.action` task label ('generation' if absent)
+    - user tier: 'free' or 'pro'
+
+A rule names the model and fallback models tried in order when an attempt
+times out or fails with a 5xx/connection error, at most
+AI_ROUTING_MAX_ATTEMPTS models in all (the SDK itself does not retry, so
+the worst case stays below the worker timeout). A fallback may repeat the
+model (a plain retry); fallbacks priced above the model they replace
+(MODEL_PRICING) are dropped, so a free-tier request never lands on a larger
+model. A model the client pins with `options.model` is kept; the matching
+rule still supplies its fallbacks and hedging.
+
+`hedge_after_ms` hedges the slow tail: when the first attempt has not
+answered by then, a second request is sent to the same model and whichever
+answers first is used. Only requests whose max_tokens is at most the rule's
+`hedge_max_tokens` (default 256) are hedged, so a duplicate is cheap and a
+long generation that is merely slow is not paid for twice. The discarded
+attempt is billed upstream but never reported back (the async path cancels
+it, the sync path drops its answer), so its usage is estimated as the
+winner's: same model, prompt and max_tokens.
+
+Every decision (rule, requested model, model served, fallback, hedge and the
+hedge's estimated tokens, latency) is recorded on the request's UsageLog row.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+logger = logging.getLogger('provokely.api_hosted')
+
+DEFAULT_RULES = [
+    # Long Pro validations: the larger model, falling back to the small one
+    {'name': 'pro_long_validation', 'tiers': ['pro'], 'actions': ['validate'], 'min_prompt_tokens': 2000,
+     'model': 'gpt-4o', 'fallbacks': ['gpt-4o-mini']},
+    # Short prompts with short answers are cheap to duplicate: hedge the slow tail
+    {'name': 'short', 'max_prompt_tokens': 1000, 'model': 'gpt-4o-mini', 'fallbacks': ['gpt-4o-mini'],
+     'hedge_after_ms': 4000, 'hedge_max_tokens': 256},
+    {'name': 'default', 'model': 'gpt-4o-mini', 'fallbacks': ['gpt-4o-mini']},
+]
+
+DEFAULT_ACTION = 'generation'
+DEFAULT_HEDGE_MAX_TOKENS = 256
+
+# Runs hedged attempts; bounded so a latency spike cannot spawn unbounded threads
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='ai-route')
+
+
+def is_retryable(error):
+    """Timeouts, connection errors and 5xx responses are worth another model"""
+    try:
+        import openai
+    except ImportError:
+        openai = None
+    if openai is not None and isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and status_code >= 500
+
+
+class ModelRouter:
+    """Pick a model per request and run it with fallback and hedging"""
+
+    def rules(self):
+        return getattr(settings, 'AI_ROUTING_RULES', None) or DEFAULT_RULES
+
+    def route(self, prompt_tokens, action=None, tier='free', requested_model=None, max_tokens=None):
+        """
+        Choose the model for a request
+
+        Args:
+            prompt_tokens: Estimated prompt tokens
+            action: Client task label (options.action)
+            tier: 'free' or 'pro'
+            requested_model: Model pinned by the client (options.model), if any
+            max_tokens: Requested completion tokens; larger than the rule's
+                hedge_max_tokens (or unknown) disables hedging
+
+        Returns:
+            dict: rule, requested_model, model, fallbacks, hedge_after_ms
+        """
+        from api_hosted.services import DEFAULT_MODEL_LIMITS, MODEL_LIMITS, MODEL_PRICING
+
+        action = action or DEFAULT_ACTION
+        rule = {'name': 'default', 'model': getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini'), 'fallbacks': []}
+        if getattr(settings, 'AI_ROUTING_ENABLED', True):
+            for candidate in self.rules():
+                if self._matches(candidate, prompt_tokens, action, tier):
+                    rule = candidate
+                    break
+
+        model = requested_model or rule['model']
+        price = MODEL_PRICING.get(model, 0.15)
+        fallbacks = [
+            name for name in rule.get('fallbacks', [])
+            # Stay within the request's price class
+            if MODEL_PRICING.get(name, 0.15) <= price
+            # Skip fallbacks whose context window cannot hold the prompt
+            and MODEL_LIMITS.get(name, DEFAULT_MODEL_LIMITS)[0] > prompt_tokens + 16
+        ]
+        hedge_after_ms = rule.get('hedge_after_ms')
+        if max_tokens is None or max_tokens > rule.get('hedge_max_tokens', DEFAULT_HEDGE_MAX_TOKENS):
+            hedge_after_ms = None
+        return {
+            'rule': rule['name'],
+            'requested_model': requested_model or '',
+            'model': model,
+            'fallbacks': fallbacks,
+            'hedge_after_ms': hedge_after_ms,
+        }
+
+    @staticmethod
+    def _matches(rule, prompt_tokens, action, tier):
+        if rule.get('tiers') and tier not in rule['tiers']:
+            return False
+        if rule.get('actions') and action not in rule['actions']:
+            return False
+        if prompt_tokens < rule.get('min_prompt_tokens', 0):
+            return False
+        if rule.get('max_prompt_tokens') is not None and prompt_tokens > rule['max_prompt_tokens']:
+            return False
+        return True
+
+    def execute(self, route, call):
+        """
+        Run call(model) for the route with fallback and hedging
+
+        Args:
+            route: Decision from route()
+            call: Callable(model) performing one completion and returning its result dict
+
+        Returns:
+            dict: The winning result plus `routing`: rule, requested_model,
+                fallback_used, hedged, hedge_tokens, latency_ms
+        """
+        started = time.perf_counter()
+        # Bounded so the worst case stays within the worker timeout (see settings)
+        models = ([route['model']] + route['fallbacks'])[:getattr(settings, 'AI_ROUTING_MAX_ATTEMPTS', 2)]
+        hedged = False
+        error = None
+
+        for position, model in enumerate(models):
+            try:
+                if position == 0 and route.get('hedge_after_ms'):
+                    result, hedged = self._hedged(call, model, route['hedge_after_ms'] / 1000.0)
+                else:
+                    result = call(model)
+            except Exception as e:
+                error = e
+                if not is_retryable(e):
+                    raise
+                logger.warning('Model %s failed (%s); falling back', model, e)
+                continue
+            return self._annotate(result, route, started, position, hedged)
+        raise error
+
+    @staticmethod
+    def _hedged(call, model, hedge_after):
+        """(result, hedged): first answer of call(model) and, if slow, of a second call(model)"""
+        primary = _executor.submit(call, model)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result(), False
+
+        hedge = _executor.submit(call, model)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The loser keeps running in the background; its answer is
+                    # dropped and its usage estimated by _annotate()
+                    return future.result(), True
+                first_error = first_error or future.exception()
+        raise first_error
+
+    async def aexecute(self, route, call):
+        """Async execute(): call(model) is a coroutine function"""
+        started = time.perf_counter()
+        # Bounded so the worst case stays within the worker timeout (see settings)
+        models = ([route['model']] + route['fallbacks'])[:getattr(settings, 'AI_ROUTING_MAX_ATTEMPTS', 2)]
+        hedged = False
+        error = None
+
+        for position, model in enumerate(models):
+            try:
+                if position == 0 and route.get('hedge_after_ms'):
+                    result, hedged = await self._ahedged(call, model, route['hedge_after_ms'] / 1000.0)
+                else:
+                    result = await call(model)
+            except Exception as e:
+                error = e
+                if not is_retryable(e):
+                    raise
+                logger.warning('Model %s failed (%s); falling back', model, e)
+                continue
+            return self._annotate(result, route, started, position, hedged)
+        raise error
+
+    @staticmethod
+    async def _ahedged(call, model, hedge_after):
+        tasks = [asyncio.ensure_future(call(model))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                return tasks[0].result(), False
+
+            tasks.append(asyncio.ensure_future(call(model)))
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), True
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            # Cancelling the loser (or both, if the request went away) closes its HTTP request
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    def _annotate(result, route, started, position, hedged):
+        return dict(result, routing={
+            'rule': route['rule'],
+            'requested_model': route['requested_model'],
+            'fallback_used': position > 0,
+            'hedged': hedged,
+            # The discarded attempt ran the same model on the same prompt
+            'hedge_tokens': result.get('tokens_used', 0) if hedged else 0,
+            'latency_ms': int((time.perf_counter() - started) * 1000),
+        })
+
+
+model_router = ModelRouter()
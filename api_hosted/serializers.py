@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -32,3 +33,23 @@ class AIResponseSerializer(serializers.Serializer):
     tokensUsed = serializers.IntegerField()
     cost = serializers.FloatField()
 
+
+
+class AIBatchItemSerializer(serializers.Serializer):
+    """One prompt of an AI batch request"""
+    prompt = serializers.CharField(required=True)
+    options = serializers.DictField(required=False, default=dict)
+
+
+class AIBatchRequestSerializer(serializers.Serializer):
+    """Serializer for AI batch request"""
+    userEmail = serializers.EmailField(required=True)
+    items = AIBatchItemSerializer(many=True, allow_empty=False)
+    isNewProject = serializers.BooleanField(required=False, default=False)
+    
+    def validate_items(self, value):
+        """Limit the number of prompts per batch"""
+        max_items = getattr(settings, 'AI_BATCH_MAX_ITEMS', 10)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f'At most {max_items} items per batch')
+        return value
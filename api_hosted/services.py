@@ -1,8 +1,18 @@
+import re
+import uuid
 import jwt
-from datetime import datetime, timedelta
-from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from api_hosted.models import APIUser, UsageLog
+from api_hosted.models import APIUser
+from api_hosted.cache import AIResponseCache
+from api_hosted.coalescing import request_coalescer
+from api_hosted.routing import model_router
+from api_hosted.usage import usage_recorder
+from shared.exceptions import PromptTooLargeError
+from shared.openai_client import get_async_openai_client, get_openai_client
+from shared.prompts import ASSISTANT
 import stripe
 from stripe import StripeError, SignatureVerificationError
 
@@ -15,11 +25,30 @@ class JWTService:
         """Get JWT secret key from settings"""
         return getattr(settings, 'JWT_SECRET_KEY', settings.SECRET_KEY)
     
+    @staticmethod
+    def get_signing_keys():
+        """
+        Keys tokens may be signed and verified with, by key id
+        
+        Returns:
+            dict: {kid: secret}; settings.JWT_SIGNING_KEYS, or the JWT_SECRET_KEY as 'default'
+        """
+        return getattr(settings, 'JWT_SIGNING_KEYS', None) or {'default': JWTService.get_secret_key()}
+    
+    @staticmethod
+    def get_active_key_id():
+        """Key id new tokens are signed with (JWT_ACTIVE_KEY_ID, else the first configured key)"""
+        return getattr(settings, 'JWT_ACTIVE_KEY_ID', None) or next(iter(JWTService.get_signing_keys()))
+    
     @staticmethod
     def generate_token(user_id, email):
         """
         Generate JWT token for user
         
+        The token is stateless: its kid header names the signing key (so keys
+        can rotate while older tokens stay valid) and its jti lets it be
+        revoked through the denylist (api_hosted/revocation.py).
+        
         Args:
             user_id: User ID
             email: User email
@@ -27,17 +56,22 @@ class JWTService:
         Returns:
             str: JWT token
         """
+        now = datetime.now(timezone.utc)
         payload = {
             'userId': user_id,
             'email': email,
-            'exp': datetime.utcnow() + timedelta(days=30),
-            'iat': datetime.utcnow()
+            'jti': uuid.uuid4().hex,
+            'exp': now + timedelta(days=getattr(settings, 'JWT_TOKEN_LIFETIME_DAYS', 30)),
+            # Sub-second, unlike a datetime: a token issued right after a revocation is not caught by its cutoff
+            'iat': now.timestamp()
         }
+        kid = JWTService.get_active_key_id()
         
         token = jwt.encode(
             payload,
-            JWTService.get_secret_key(),
-            algorithm='HS256'
+            JWTService.get_signing_keys()[kid],
+            algorithm='HS256',
+            headers={'kid': kid}
         )
         
         return token
@@ -55,12 +89,20 @@ class JWTService:
         
         Raises:
             jwt.ExpiredSignatureError: If token expired
-            jwt.InvalidTokenError: If token invalid
+            jwt.InvalidTokenError: If token invalid or signed with an unknown key id
         """
         try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            if kid is None:
+                # Tokens issued before key ids were introduced
+                key = JWTService.get_secret_key()
+            else:
+                key = JWTService.get_signing_keys().get(kid)
+                if key is None:
+                    raise jwt.InvalidTokenError(f'Unknown key id {kid}')
             payload = jwt.decode(
                 token,
-                JWTService.get_secret_key(),
+                key,
                 algorithms=['HS256']
             )
             return payload
@@ -70,6 +112,193 @@ class JWTService:
             raise jwt.InvalidTokenError('Invalid token')
 
 
+# Default system message; prompt templates (shared/prompts.py) supply others
+SYSTEM_PROMPT = ASSISTANT.prefix
+
+# Pricing per 1M tokens (as of 2024)
+MODEL_PRICING = {
+    'gpt-4o-mini': 0.15,  # $0.15 per 1M tokens
+    'gpt-4o': 2.50,       # $2.50 per 1M tokens
+    'gpt-4': 30.00,       # $30 per 1M tokens
+    'gpt-3.5-turbo': 0.50 # $0.50 per 1M tokens
+}
+
+# (context window, max output tokens) per model
+MODEL_LIMITS = {
+    'gpt-4o-mini': (128000, 16384),
+    'gpt-4o': (128000, 16384),
+    'gpt-4': (8192, 8192),
+    'gpt-3.5-turbo': (16385, 4096),
+}
+DEFAULT_MODEL_LIMITS = (8192, 4096)
+
+_PRETOKEN_RE = re.compile(r"\s?[A-Za-z]+|\s?\d{1,3}|\s?[^\sA-Za-z\d]+|\s+")
+
+
+class TokenEstimator:
+    """
+    Predict prompt tokens and cost locally, before any network call
+    
+    Uses tiktoken when installed (exact counts); otherwise approximates BPE
+    by splitting text into word/number/punctuation pieces the way the GPT
+    pre-tokenizer does: a word is one token plus one per further 6 letters,
+    up to 3 digits are one token, and punctuation costs one token per 2
+    characters. On English text this errs slightly high, the safe side
+    for clamping.
+    """
+    
+    # Chat format overhead: per message (role, separators) and reply priming
+    TOKENS_PER_MESSAGE = 3
+    REPLY_PRIMING_TOKENS = 3
+    # Refuse prompts that leave less room than this for the completion
+    MIN_COMPLETION_TOKENS = 16
+    
+    def __init__(self):
+        self._encodings = {}
+    
+    def _encoding(self, model):
+        # Keyed by encoding name, not the client-supplied model, so the cache stays a handful of entries
+        try:
+            import tiktoken
+            name = tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            name = 'o200k_base'
+        except Exception:
+            return None
+        if name not in self._encodings:
+            try:
+                self._encodings[name] = tiktoken.get_encoding(name)
+            except Exception:
+                self._encodings[name] = None
+        return self._encodings[name]
+    
+    def count(self, text, model='gpt-4o-mini'):
+        """
+        Count (or estimate) the tokens of a text
+        
+        Args:
+            text: Text to count
+            model: Model whose tokenizer to use
+        
+        Returns:
+            int: Token count
+        """
+        encoding = self._encoding(model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return sum(self._piece_tokens(piece) for piece in _PRETOKEN_RE.findall(text))
+    
+    @staticmethod
+    def _piece_tokens(piece):
+        body = piece.lstrip()
+        if not body:
+            return 1
+        if body[0].isalpha():
+            return 1 + (len(body) - 1) // 6
+        if body[0].isdigit():
+            return 1
+        return (len(body) + 1) // 2
+    
+    def prompt_tokens(self, prompt, model='gpt-4o-mini', system=SYSTEM_PROMPT):
+        """Tokens of the chat request (system + user message and format overhead)"""
+        return (
+            self.count(system, model) + self.count(prompt, model)
+            + 2 * self.TOKENS_PER_MESSAGE + self.REPLY_PRIMING_TOKENS
+        )
+    
+    def truncate(self, prompt, model, max_prompt_tokens, system=SYSTEM_PROMPT):
+        """Cut the prompt so prompt_tokens() fits max_prompt_tokens, keeping its beginning"""
+        budget = max_prompt_tokens - (self.prompt_tokens('', model, system))
+        if budget <= 0:
+            return ''
+        encoding = self._encoding(model)
+        if encoding is not None:
+            return encoding.decode(encoding.encode(prompt, disallowed_special=())[:budget])
+        kept, used = [], 0
+        for piece in _PRETOKEN_RE.findall(prompt):
+            cost = self._piece_tokens(piece)
+            if used + cost > budget:
+                break
+            kept.append(piece)
+            used += cost
+        return ''.join(kept)
+    
+    def prepare(self, prompt, model='gpt-4o-mini', max_tokens=4000, truncate=False, system=SYSTEM_PROMPT):
+        """
+        Size a request to fit the model before sending it
+        
+        max_tokens is clamped to the model's output limit and to whatever the
+        context window leaves after the prompt.
+        
+        Args:
+            prompt: User prompt
+            model: Model name
+            max_tokens: Requested completion tokens
+            truncate: Cut an oversize prompt instead of rejecting it
+            system: System message sent with the prompt (a template's prefix)
+        
+        Returns:
+            dict: prompt (possibly truncated), prompt_tokens, max_tokens,
+                requested_max_tokens, estimated_cost (upper bound), truncated, exact
+        
+        Raises:
+            PromptTooLargeError: If the prompt does not fit and truncate is False
+        """
+        context_window, max_output = MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)
+        requested = max_tokens
+        prompt_tokens = self.prompt_tokens(prompt, model, system)
+        truncated = False
+        
+        room = context_window - prompt_tokens
+        if room < self.MIN_COMPLETION_TOKENS:
+            if not truncate:
+                raise PromptTooLargeError(
+                    f'Prompt is about {prompt_tokens} tokens; {model} accepts at most '
+                    f'{context_window - self.MIN_COMPLETION_TOKENS}',
+                    estimate={'promptTokens': prompt_tokens, 'contextWindow': context_window}
+                )
+            # Keep room for a useful answer: at least the smaller of the request and a quarter window
+            reserve = max(self.MIN_COMPLETION_TOKENS, min(requested, max_output, context_window // 4))
+            prompt = self.truncate(prompt, model, context_window - reserve, system)
+            prompt_tokens = self.prompt_tokens(prompt, model, system)
+            room = context_window - prompt_tokens
+            truncated = True
+        
+        max_tokens = max(1, min(requested, max_output, room))
+        rate = MODEL_PRICING.get(model, 0.15)
+        return {
+            'prompt': prompt,
+            'prompt_tokens': prompt_tokens,
+            'max_tokens': max_tokens,
+            'requested_max_tokens': requested,
+            'estimated_cost': round((prompt_tokens + max_tokens) / 1_000_000 * rate, 6),
+            'truncated': truncated,
+            'exact': self._encoding(model) is not None,
+        }
+
+
+token_estimator = TokenEstimator()
+
+
+def clamp_max_tokens(model, max_tokens):
+    """max_tokens capped at the model's output limit (fallback models may allow fewer)"""
+    return max(1, min(max_tokens, MODEL_LIMITS.get(model, DEFAULT_MODEL_LIMITS)[1]))
+
+
+def template_variant(template):
+    """Cache/coalescing key part for a prompt template ('' for the default one)"""
+    return '' if template is None or template.prefix == SYSTEM_PROMPT else template.prefix_hash
+
+
+def usage_counts(usage):
+    """(prompt_tokens, cached_tokens) from a completion's `usage` (cached: provider prompt cache)"""
+    if usage is None:
+        return 0, 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None) if details is not None else None
+    return getattr(usage, 'prompt_tokens', None) or 0, cached or 0
+
+
 class AIProxyService:
     """Handle AI API calls and usage tracking"""
     
@@ -80,46 +309,199 @@ class AIProxyService:
         if not self.api_key:
             raise ValueError('OPENAI_API_KEY not configured in settings')
         
-        try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=self.api_key)
-        except ImportError:
-            raise ImportError('openai package not installed')
+        # Long-lived per-process client: keeps its HTTP connection pool across requests
+        self.client = get_openai_client(self.api_key)
+        
+        self.response_cache = AIResponseCache()
     
-    def call_openai(self, prompt, model=None, max_tokens=4000):
+    @staticmethod
+    def route(prompt_tokens, action=None, tier='free', requested_model=None, max_tokens=None):
+        """
+        Pick the model for a request from the routing policy (see api_hosted/routing.py)
+        
+        Args:
+            prompt_tokens: Estimated prompt tokens
+            action: Client task label (options.action)
+            tier: 'free' or 'pro'
+            requested_model: Model pinned by the client, if any
+            max_tokens: Requested completion tokens (bounds hedging)
+        
+        Returns:
+            dict: Routing decision to pass to call_openai()
+        """
+        return model_router.route(prompt_tokens, action=action, tier=tier, requested_model=requested_model,
+                                  max_tokens=max_tokens)
+    
+    def call_openai(self, prompt, model=None, max_tokens=4000, use_cache=True, user_id=None, route=None,
+                    template=None):
         """
         Call OpenAI API
         
+        Args:
+            prompt: User prompt (the variable part, sent after the template's prefix)
+            model: Model name (optional; ignored when route is given)
+            max_tokens: Max tokens to generate
+            use_cache: Serve/store the result in the response cache
+            user_id: When given, concurrent identical requests from this user
+                share a single upstream call
+            route: Decision from route(); adds fallback and hedging
+            template: PromptTemplate supplying the system prefix (default: assistant)
+        
+        Returns:
+            dict: Response with content, tokens_used, prompt_tokens, cached_tokens,
+                model and cached/coalesced flags (plus `routing` when routed).
+                Cache hits and coalesced followers report 0 tokens since they
+                made no upstream call.
+        """
+        model = route['model'] if route else (model or self.default_model)
+        template = template or ASSISTANT
+        variant = template_variant(template)
+        
+        if use_cache:
+            cached = self.response_cache.get(prompt, model, max_tokens, variant=variant)
+            if cached is not None:
+                return self._cache_hit(cached)
+        
+        def upstream():
+            if route:
+                try:
+                    result = model_router.execute(route, lambda routed: self._complete(
+                        prompt, routed, clamp_max_tokens(routed, max_tokens), template
+                    ))
+                except Exception as e:
+                    raise Exception(f"OpenAI API error: {str(e)}")
+            else:
+                result = self._create_completion(prompt, model, max_tokens, template)
+            if use_cache:
+                self.response_cache.set(prompt, model, max_tokens, result, variant=variant)
+            return result
+        
+        if user_id is None:
+            return upstream()
+        
+        key = f"{user_id}:{model}:{max_tokens}:{variant}:{AIResponseCache.prompt_hash(prompt)}"
+        result, shared = request_coalescer.run(key, upstream)
+        if shared:
+            return dict(result, tokens_used=0, prompt_tokens=0, cached_tokens=0, coalesced=True)
+        return result
+    
+    @staticmethod
+    def _cache_hit(cached):
+        return {
+            'response': cached['response'],
+            'tokens_used': 0,
+            'prompt_tokens': 0,
+            'cached_tokens': 0,
+            'model': cached['model'],
+            'cached': True,
+            'coalesced': False
+        }
+    
+    def call_openai_batch(self, items, max_workers=4, use_cache=True, user_id=None):
+        """
+        Run several prompts concurrently on a bounded thread pool
+        
+        Workers only talk to OpenAI and the caches; nothing touches the
+        database, so accounting stays with the caller.
+        
+        Args:
+            items: Dicts with prompt, model, max_tokens and optionally route and template
+            max_workers: Max concurrent upstream calls
+            use_cache: Serve/store results in the response cache
+            user_id: Coalesce identical in-flight requests of this user
+        
+        Returns:
+            list: Per item, in input order, the call_openai() result dict or
+                the exception it raised
+        """
+        def run(item):
+            try:
+                return self.call_openai(
+                    prompt=item['prompt'],
+                    model=item['model'],
+                    max_tokens=item['max_tokens'],
+                    use_cache=use_cache,
+                    user_id=user_id,
+                    route=item.get('route'),
+                    template=item.get('template')
+                )
+            except Exception as e:
+                return e
+        
+        if len(items) <= 1:
+            return [run(item) for item in items]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+            return list(pool.map(run, items))
+    
+    def _create_completion(self, prompt, model, max_tokens, template=ASSISTANT):
+        """Single upstream chat completion"""
+        try:
+            return self._complete(prompt, model, max_tokens, template)
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    def _complete(self, prompt, model, max_tokens, template=ASSISTANT):
+        """Single upstream chat completion; SDK errors propagate unchanged for the router"""
+        completion = self.client.chat.completions.create(
+            model=model,
+            messages=template.messages(prompt),
+            max_tokens=max_tokens
+        )
+        return self._completion_result(completion, model)
+    
+    @staticmethod
+    def _completion_result(completion, model):
+        prompt_tokens, cached_tokens = usage_counts(completion.usage)
+        return {
+            'response': completion.choices[0].message.content,
+            'tokens_used': completion.usage.total_tokens,
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'model': model,
+            'cached': False,
+            'coalesced': False
+        }
+    
+    def stream_openai(self, prompt, model=None, max_tokens=4000, use_cache=True, template=None):
+        """
+        Start a streamed OpenAI completion
+        
         Args:
             prompt: User prompt
             model: Model name (optional)
             max_tokens: Max tokens to generate
+            use_cache: Serve a cached response / cache the completed stream
+            template: PromptTemplate supplying the system prefix (default: assistant)
         
         Returns:
-            dict: Response with content, tokens_used
+            AIStream: Iterator of text deltas with a running token count
         """
         model = model or self.default_model
+        template = template or ASSISTANT
+        variant = template_variant(template)
+        
+        if use_cache:
+            cached = self.response_cache.get(prompt, model, max_tokens, variant=variant)
+            if cached is not None:
+                return AIStream(iter([cached['response']]), prompt, cached['model'], cached=True)
         
         try:
-            completion = self.client.chat.completions.create(
+            upstream = self.client.chat.completions.create(
                 model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens
+                messages=template.messages(prompt),
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True}
             )
-            
-            response_text = completion.choices[0].message.content
-            tokens_used = completion.usage.total_tokens
-            
-            return {
-                'response': response_text,
-                'tokens_used': tokens_used,
-                'model': model
-            }
         except Exception as e:
             raise Exception(f"OpenAI API error: {str(e)}")
+        
+        on_complete = None
+        if use_cache:
+            def on_complete(result):
+                self.response_cache.set(prompt, model, max_tokens, result, variant=variant)
+        
+        return AIStream(upstream, prompt, model, on_complete=on_complete)
     
     def calculate_cost(self, tokens_used, model='gpt-4o-mini'):
         """
@@ -132,22 +514,18 @@ class AIProxyService:
         Returns:
             float: Cost in USD
         """
-        # Pricing per 1M tokens (as of 2024)
-        pricing = {
-            'gpt-4o-mini': 0.15,  # $0.15 per 1M tokens
-            'gpt-4o': 2.50,       # $2.50 per 1M tokens
-            'gpt-4': 30.00,       # $30 per 1M tokens
-            'gpt-3.5-turbo': 0.50 # $0.50 per 1M tokens
-        }
-        
-        rate = pricing.get(model, 0.15)
+        rate = MODEL_PRICING.get(model, 0.15)
         cost = (tokens_used / 1_000_000) * rate
         
         return round(cost, 4)
     
-    def track_usage(self, api_user, action, tokens_used, cost, model, prompt_length):
+    def track_usage(self, api_user, action, tokens_used, cost, model, prompt_length, routing=None,
+                    prompt_tokens=0, cached_tokens=0, prompt_template=''):
         """
-        Track API usage in database
+        Track API usage
+        
+        The event is buffered and written in batches by the usage flusher
+        (see api_hosted/usage.py); user totals are incremented atomically there.
         
         Args:
             api_user: APIUser instance
@@ -156,22 +534,224 @@ class AIProxyService:
             cost: Cost in USD
             model: Model name
             prompt_length: Length of prompt
+            routing: Routing decision of the request (rule, requested_model,
+                fallback_used, hedged, hedge_tokens, latency_ms), if routed
+            prompt_tokens: Prompt tokens billed upstream
+            cached_tokens: Of those, tokens served from the provider's prompt cache
+            prompt_template: Name of the prompt template used
         """
-        # Create usage log
-        UsageLog.objects.create(
+        usage_recorder.record(
             api_user=api_user,
             action=action,
             tokens_used=tokens_used,
             cost=cost,
             model=model,
-            prompt_length=prompt_length
+            prompt_length=prompt_length,
+            routing=routing,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            prompt_template=prompt_template
         )
+    
+    def track_usage_batch(self, api_user, entries):
+        """
+        Track the usage of several AI calls with one accounting write
+        
+        Args:
+            api_user: APIUser instance
+            entries: Dicts with action, tokens_used, cost, model and prompt_length
+                (and optionally requests, routing, prompt_tokens, cached_tokens, prompt_template)
+        """
+        usage_recorder.record_many(api_user, entries)
+
+
+class AsyncAIProxyService(AIProxyService):
+    """
+    AIProxyService for async views (ASGI)
+    
+    The OpenAI call is awaited on the event loop's shared AsyncOpenAI client,
+    so a waiting request costs a coroutine instead of a worker. Cache, quota
+    and usage writes are sync code run via sync_to_async: cache lookups in
+    the thread pool, database writes on Django's thread-sensitive executor.
+    """
+    
+    def __init__(self):
+        self.api_key = getattr(settings, 'OPENAI_API_KEY', None)
+        self.default_model = getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini')
         
-        # Update user totals
-        api_user.total_requests += 1
-        api_user.total_tokens_used += tokens_used
-        api_user.total_cost += Decimal(str(cost))
-        api_user.save()
+        if not self.api_key:
+            raise ValueError('OPENAI_API_KEY not configured in settings')
+        
+        # Must be built inside the running event loop (see OpenAIClientRegistry.get_async)
+        self.client = get_async_openai_client(self.api_key)
+        
+        self.response_cache = AIResponseCache()
+    
+    async def call_openai(self, prompt, model=None, max_tokens=4000, use_cache=True, user_id=None, route=None,
+                          template=None):
+        """
+        Async call_openai(); same arguments and result as AIProxyService.call_openai
+        """
+        model = route['model'] if route else (model or self.default_model)
+        template = template or ASSISTANT
+        variant = template_variant(template)
+        
+        if use_cache:
+            cached = await sync_to_async(self.response_cache.get, thread_sensitive=False)(
+                prompt, model, max_tokens, variant=variant
+            )
+            if cached is not None:
+                return self._cache_hit(cached)
+        
+        async def upstream():
+            if route:
+                async def complete(routed):
+                    return await self._complete(prompt, routed, clamp_max_tokens(routed, max_tokens), template)
+                try:
+                    result = await model_router.aexecute(route, complete)
+                except Exception as e:
+                    raise Exception(f"OpenAI API error: {str(e)}")
+            else:
+                result = await self._create_completion(prompt, model, max_tokens, template)
+            if use_cache:
+                await sync_to_async(self.response_cache.set, thread_sensitive=False)(
+                    prompt, model, max_tokens, result, variant=variant
+                )
+            return result
+        
+        if user_id is None:
+            return await upstream()
+        
+        key = f"{user_id}:{model}:{max_tokens}:{variant}:{AIResponseCache.prompt_hash(prompt)}"
+        result, shared = await request_coalescer.arun(key, upstream)
+        if shared:
+            return dict(result, tokens_used=0, prompt_tokens=0, cached_tokens=0, coalesced=True)
+        return result
+    
+    async def _create_completion(self, prompt, model, max_tokens, template=ASSISTANT):
+        """Single upstream chat completion"""
+        try:
+            return await self._complete(prompt, model, max_tokens, template)
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+    
+    async def _complete(self, prompt, model, max_tokens, template=ASSISTANT):
+        """Single upstream chat completion; SDK errors propagate unchanged for the router"""
+        completion = await self.client.chat.completions.create(
+            model=model,
+            messages=template.messages(prompt),
+            max_tokens=max_tokens
+        )
+        return self._completion_result(completion, model)
+    
+    async def track_usage(self, api_user, action, tokens_used, cost, model, prompt_length, routing=None,
+                          prompt_tokens=0, cached_tokens=0, prompt_template=''):
+        """Async track_usage(); the write (or buffer append) runs off the event loop"""
+        await sync_to_async(usage_recorder.record)(
+            api_user=api_user,
+            action=action,
+            tokens_used=tokens_used,
+            cost=cost,
+            model=model,
+            prompt_length=prompt_length,
+            routing=routing,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            prompt_template=prompt_template
+        )
+
+
+class AIStream:
+    """
+    Iterate the text deltas of a streamed completion while counting tokens
+    
+    Each content delta OpenAI streams is one generated token, so
+    completion_tokens is exact up to the point the stream stops. When the
+    final usage chunk arrives (stream_options.include_usage) its counts
+    replace the running estimate.
+    """
+    
+    def __init__(self, chunks, prompt, model, cached=False, on_complete=None):
+        """
+        Args:
+            chunks: Upstream chat.completions stream, or an iterable of text when cached
+            prompt: Prompt sent upstream (for the prompt token estimate)
+            model: Model name
+            cached: True when replaying a cached response (no tokens billed)
+            on_complete: Optional callback receiving the result dict once the stream finished
+        """
+        self.upstream = chunks
+        self.prompt = prompt
+        self.model = model
+        self.cached = cached
+        self.on_complete = on_complete
+        self.parts = []
+        self.prompt_tokens = None
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.usage_reported = False
+        self.finished = False
+    
+    def __iter__(self):
+        if self.cached:
+            for text in self.upstream:
+                self.parts.append(text)
+                yield text
+            self.finished = True
+            return
+        
+        try:
+            for chunk in self.upstream:
+                usage = getattr(chunk, 'usage', None)
+                if usage is not None:
+                    self.prompt_tokens, self.cached_tokens = usage_counts(usage)
+                    self.completion_tokens = usage.completion_tokens
+                    self.usage_reported = True
+                for choice in getattr(chunk, 'choices', None) or []:
+                    text = getattr(choice.delta, 'content', None)
+                    if text:
+                        self.parts.append(text)
+                        if not self.usage_reported:
+                            self.completion_tokens += 1
+                        yield text
+        except Exception as e:
+            raise Exception(f"OpenAI API error: {str(e)}")
+        
+        self.finished = True
+        if self.on_complete is not None:
+            self.on_complete(self.result())
+    
+    @property
+    def tokens_used(self):
+        """Tokens to bill: 0 for cache replays, else prompt + streamed completion tokens"""
+        if self.cached:
+            return 0
+        prompt_tokens = self.prompt_tokens
+        if prompt_tokens is None:
+            # Usage chunk never arrived (client went away first): ~4 chars per token
+            prompt_tokens = max(1, len(self.prompt) // 4)
+        return prompt_tokens + self.completion_tokens
+    
+    def result(self):
+        """Result dict in the same shape as AIProxyService.call_openai"""
+        return {
+            'response': ''.join(self.parts),
+            'tokens_used': self.tokens_used,
+            'prompt_tokens': 0 if self.cached else (self.prompt_tokens or 0),
+            'cached_tokens': 0 if self.cached else self.cached_tokens,
+            'model': self.model,
+            'cached': self.cached,
+            'coalesced': False
+        }
+    
+    def close(self):
+        """Close the upstream HTTP stream so OpenAI stops generating"""
+        close = getattr(self.upstream, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
 
 
 class StripeService:
@@ -283,7 +863,7 @@ class StripeService:
             api_user.is_pro = True
             api_user.subscription_id = subscription_id
             api_user.stripe_customer_id = customer_id
-            api_user.save()
+            api_user.save(update_fields=['is_pro', 'subscription_id', 'stripe_customer_id'])
             
             return api_user
         except APIUser.DoesNotExist:
@@ -304,7 +884,7 @@ class StripeService:
         try:
             api_user = APIUser.objects.get(subscription_id=subscription_id)
             api_user.is_pro = False
-            api_user.save()
+            api_user.save(update_fields=['is_pro'])
             
             return api_user
         except APIUser.DoesNotExist:
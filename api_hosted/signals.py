@@ -0,0 +1,15 @@
+"""
+Model signal handlers for the hosted API (connected in ApiHostedConfig.ready)
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api_hosted.models import APIUser
+from api_hosted.principals import principal_cache
+
+
+@receiver(post_save, sender=APIUser)
+@receiver(post_delete, sender=APIUser)
+def invalidate_principal(sender, instance, **kwargs):
+    """Saved (e.g. Stripe upgrade/cancellation) or deleted users re-authenticate from the database"""
+    principal_cache.invalidate(instance.pk)
@@ -0,0 +1,26 @@
+from celery import shared_task
+
+from api_hosted.rollups import UsageRollupAggregator
+from api_hosted.usage import usage_recorder
+
+
+@shared_task
+def flush_usage_events():
+    """
+    Flush buffered usage events to UsageLog and APIUser totals
+    
+    Returns:
+        int: Number of events flushed
+    """
+    return usage_recorder.flush_all()
+
+
+@shared_task
+def aggregate_usage_rollups():
+    """
+    Fold new UsageLog rows into the hourly and daily rollups
+    
+    Returns:
+        int: Number of UsageLog rows folded in
+    """
+    return UsageRollupAggregator().run()
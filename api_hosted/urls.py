@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.urls import path
 from api_hosted.views import (
     AuthAPIView,
+    AuthLogoutView,
     AIProxyView,
+    AsyncAIProxyView,
+    AIBatchView,
+    UsageView,
     saas_validator_privacy,
     CreateCheckoutSessionView,
     StripeWebhookView,
@@ -18,7 +23,11 @@ app_name = 'api_hosted'
 
 urlpatterns = [
     path('auth', AuthAPIView.as_view(), name='auth'),
-    path('ai', AIProxyView.as_view(), name='ai'),
+    path('auth/logout', AuthLogoutView.as_view(), name='auth_logout'),
+    # Under an ASGI server (AI_PROXY_ASYNC=true) /api/ai awaits OpenAI instead of blocking a worker
+    path('ai', (AsyncAIProxyView if settings.AI_PROXY_ASYNC else AIProxyView).as_view(), name='ai'),
+    path('ai/batch', AIBatchView.as_view(), name='ai_batch'),
+    path('usage', UsageView.as_view(), name='usage'),
     path('saas-validator-privacy', saas_validator_privacy, name='saas_validator_privacy'),
     path('create-checkout-session', CreateCheckoutSessionView.as_view(), name='create_checkout_session'),
     path('stripe-webhook/', StripeWebhookView.as_view(), name='stripe_webhook'),
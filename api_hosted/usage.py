@@ -0,0 +1,442 @@
+"""
+Write-behind usage accounting for the hosted API
+
+`track_usage` used to insert a UsageLog row and read-modify-write the user's
+totals on every request: a hot-row write that also loses updates when two
+requests of one user race. Usage events are now appended to a buffer and a
+flusher writes them in batches: one bulk UsageLog insert plus one atomic
+F() increment per user per flush.
+
+Buffers:
+    RedisUsageBuffer: a Redis stream read through a consumer group. Events a
+        flusher read but never acknowledged (it crashed) stay pending and are
+        re-claimed by the next flusher once idle for USAGE_CLAIM_IDLE_MS.
+        Used when USAGE_REDIS_URL (default: CACHE_REDIS_URL) is set.
+    LocalUsageBuffer: in-process queue for single-process/dev setups, flushed
+        by a background timer and at interpreter exit. Not durable, so
+        write-behind is off by default without USAGE_REDIS_URL.
+
+Every event carries an event_id stored (unique) on UsageLog, so replaying a
+batch whose DB transaction already committed inserts and counts nothing.
+Unflushed per-user deltas are kept next to the buffer so reads can merge
+them with the stored totals (see UsageRecorder.totals).
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api_hosted.models import APIUser, UsageLog
+
+logger = logging.getLogger('provokely.api_hosted')
+
+# Costs are kept as integer units of 1/10000 USD (UsageLog.cost has 4 decimal places)
+COST_SCALE = Decimal('10000')
+
+
+def _empty_deltas():
+    return {'requests': 0, 'tokens': 0, 'cost_e4': 0}
+
+
+def _cost_e4(cost):
+    return int((Decimal(str(cost)) * COST_SCALE).to_integral_value())
+
+
+def aggregate_deltas(events):
+    """Sum events into {user_id: {'requests', 'tokens', 'cost_e4'}}"""
+    deltas = defaultdict(_empty_deltas)
+    for event in events:
+        delta = deltas[event['user_id']]
+        delta['requests'] += event.get('requests', 1)
+        delta['tokens'] += event['tokens_used']
+        delta['cost_e4'] += _cost_e4(event['cost'])
+    return deltas
+
+
+class LocalUsageBuffer:
+    """
+    In-process usage buffer
+
+    Not durable: events still queued when the process is killed are lost.
+    Batches handed to a flusher stay in-flight until acked and are handed
+    out again if the flush failed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = OrderedDict()
+        self._inflight = OrderedDict()
+        self._pending = defaultdict(_empty_deltas)
+
+    def append(self, event):
+        with self._lock:
+            self._queue[event['event_id']] = event
+            delta = self._pending[event['user_id']]
+            delta['requests'] += event.get('requests', 1)
+            delta['tokens'] += event['tokens_used']
+            delta['cost_e4'] += _cost_e4(event['cost'])
+
+    def read_batch(self, count):
+        with self._lock:
+            if not self._inflight:
+                while self._queue and len(self._inflight) < count:
+                    event_id, event = self._queue.popitem(last=False)
+                    self._inflight[event_id] = event
+            return list(self._inflight.items())
+
+    def ack(self, ids, deltas):
+        with self._lock:
+            for event_id in ids:
+                self._inflight.pop(event_id, None)
+            for user_id, delta in deltas.items():
+                pending = self._pending[user_id]
+                for field, value in delta.items():
+                    pending[field] -= value
+                if not any(pending.values()):
+                    del self._pending[user_id]
+
+    def pending(self, user_id):
+        with self._lock:
+            return dict(self._pending.get(user_id) or _empty_deltas())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._queue) + len(self._inflight)
+
+
+class RedisUsageBuffer:
+    """Usage buffer on a Redis stream with a consumer group for crash-safe replay"""
+
+    STREAM = 'usage:events'
+    GROUP = 'usage-flushers'
+    PENDING_PREFIX = 'usage:pending:'
+
+    def __init__(self, url, claim_idle_ms=60000):
+        """
+        Args:
+            url: Redis URL
+            claim_idle_ms: Re-claim events read but not acked for this long (crashed flusher)
+        """
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self._group_ready = False
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        import redis
+        try:
+            self.redis.xgroup_create(self.STREAM, self.GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def append(self, event):
+        key = self.PENDING_PREFIX + event['user_id']
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.xadd(self.STREAM, {'e': json.dumps(event)})
+        pipe.hincrby(key, 'requests', event.get('requests', 1))
+        pipe.hincrby(key, 'tokens', event['tokens_used'])
+        pipe.hincrby(key, 'cost_e4', _cost_e4(event['cost']))
+        pipe.execute()
+
+    def read_batch(self, count):
+        self._ensure_group()
+        # Replay batches abandoned by crashed flushers before reading new events
+        claimed = self.redis.xautoclaim(self.STREAM, self.GROUP, self.consumer,
+                                        min_idle_time=self.claim_idle_ms, start_id='0-0', count=count)
+        messages = claimed[1]
+        if not messages:
+            response = self.redis.xreadgroup(self.GROUP, self.consumer, {self.STREAM: '>'}, count=count)
+            messages = response[0][1] if response else []
+        # Entries deleted from the stream come back without fields: drop them from the pending list
+        empty = [message_id for message_id, fields in messages if not fields]
+        if empty:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.xack(self.STREAM, self.GROUP, *empty)
+            pipe.xdel(self.STREAM, *empty)
+            pipe.execute()
+        return [(message_id, json.loads(fields[b'e'])) for message_id, fields in messages if fields]
+
+    def ack(self, ids, deltas):
+        pipe = self.redis.pipeline(transaction=True)
+        if ids:
+            pipe.xack(self.STREAM, self.GROUP, *ids)
+            pipe.xdel(self.STREAM, *ids)
+        for user_id, delta in deltas.items():
+            key = self.PENDING_PREFIX + user_id
+            for field, value in delta.items():
+                pipe.hincrby(key, field, -value)
+        pipe.execute()
+
+    def pending(self, user_id):
+        raw = self.redis.hgetall(self.PENDING_PREFIX + user_id)
+        deltas = _empty_deltas()
+        for field, value in raw.items():
+            deltas[field.decode()] = int(value)
+        return deltas
+
+    def __len__(self):
+        return self.redis.xlen(self.STREAM)
+
+
+class UsageRecorder:
+    """Buffer usage events and flush them to the database in batches"""
+
+    def __init__(self, buffer=None):
+        """
+        Args:
+            buffer: LocalUsageBuffer/RedisUsageBuffer; chosen from settings on first use when omitted
+        """
+        self._buffer = buffer
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            with self._buffer_lock:
+                if self._buffer is None:
+                    url = getattr(settings, 'USAGE_REDIS_URL', None)
+                    if url:
+                        self._buffer = RedisUsageBuffer(url, getattr(settings, 'USAGE_CLAIM_IDLE_MS', 60000))
+                    else:
+                        self._buffer = LocalUsageBuffer()
+                        atexit.register(self.flush_all)
+        return self._buffer
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'USAGE_WRITE_BEHIND', bool(getattr(settings, 'USAGE_REDIS_URL', None)))
+
+    def record(self, api_user, action, tokens_used, cost, model, prompt_length, routing=None,
+               prompt_tokens=0, cached_tokens=0, prompt_template=''):
+        """
+        Record one usage event
+
+        Args:
+            api_user: APIUser instance
+            action: Action name
+            tokens_used: Tokens used
+            cost: Cost in USD
+            model: Model name
+            prompt_length: Length of prompt
+            routing: Optional routing decision (rule, requested_model, fallback_used, hedged,
+                hedge_tokens, latency_ms)
+            prompt_tokens: Prompt tokens billed upstream
+            cached_tokens: Of those, tokens served from the provider's prompt cache
+            prompt_template: Name of the prompt template used
+        """
+        self.record_many(api_user, [{
+            'action': action,
+            'tokens_used': tokens_used,
+            'cost': cost,
+            'model': model,
+            'prompt_length': prompt_length,
+            'routing': routing,
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'prompt_template': prompt_template,
+        }])
+
+    def record_many(self, api_user, entries):
+        """
+        Record several usage events of one user together
+
+        When write-behind is off they are written in a single transaction
+        (one bulk insert and one totals update).
+
+        Args:
+            api_user: APIUser instance
+            entries: Dicts with action, tokens_used, cost, model, prompt_length
+                and optionally requests (AI calls the entry sums, default 1),
+                routing, prompt_tokens, cached_tokens, prompt_template
+        """
+        now = timezone.now().isoformat()
+        events = [dict({
+            'event_id': str(uuid.uuid4()),
+            'user_id': api_user.pk,
+            'action': entry['action'],
+            'requests': int(entry.get('requests') or 1),
+            'tokens_used': int(entry['tokens_used']),
+            'cost': str(entry['cost']),
+            'model': entry['model'],
+            'prompt_length': entry['prompt_length'],
+            'prompt_tokens': int(entry.get('prompt_tokens') or 0),
+            'cached_tokens': int(entry.get('cached_tokens') or 0),
+            'prompt_template': entry.get('prompt_template') or '',
+            'timestamp': now,
+        }, **self._routing_fields(entry.get('routing'))) for entry in entries]
+        if not events:
+            return
+        if not self.enabled():
+            self._write(events)
+            return
+
+        try:
+            for event in events:
+                self.buffer.append(event)
+        except Exception as e:
+            # Buffer unavailable: account synchronously rather than drop events
+            # (already buffered ones are skipped by event_id when flushed)
+            logger.warning('Usage buffer append failed, writing directly: %s', e)
+            self._write(events)
+            return
+        if isinstance(self.buffer, LocalUsageBuffer):
+            self._schedule_local_flush()
+
+    @staticmethod
+    def _routing_fields(routing):
+        if not routing:
+            return {}
+        return {
+            'route': routing['rule'],
+            'requested_model': routing.get('requested_model') or '',
+            'fallback_used': bool(routing.get('fallback_used')),
+            'hedged': bool(routing.get('hedged')),
+            'hedge_tokens': int(routing.get('hedge_tokens') or 0),
+            'latency_ms': routing.get('latency_ms'),
+        }
+
+    def flush(self, max_events=None):
+        """
+        Write one batch of buffered events to the database
+
+        Args:
+            max_events: Batch size (defaults to settings.USAGE_FLUSH_BATCH_SIZE)
+
+        Returns:
+            int: Number of events taken from the buffer
+        """
+        max_events = max_events or getattr(settings, 'USAGE_FLUSH_BATCH_SIZE', 1000)
+        with self._flush_lock:
+            batch = self.buffer.read_batch(max_events)
+            if not batch:
+                return 0
+            events = [event for _, event in batch]
+            self._write(events)
+            self.buffer.ack([message_id for message_id, _ in batch], aggregate_deltas(events))
+            return len(batch)
+
+    def flush_all(self, max_events=None):
+        """Flush until the buffer is empty; returns the number of events flushed"""
+        total = 0
+        while True:
+            flushed = self.flush(max_events)
+            if not flushed:
+                return total
+            total += flushed
+
+    @staticmethod
+    def _write(events):
+        """Insert UsageLog rows and bump user totals; idempotent per event_id"""
+        by_id = {event['event_id']: event for event in events}
+        with transaction.atomic():
+            done = set(UsageLog.objects.filter(event_id__in=list(by_id)).values_list('event_id', flat=True))
+            new = [event for event_id, event in by_id.items() if event_id not in done]
+            users = set(APIUser.objects.filter(pk__in={e['user_id'] for e in new}).values_list('pk', flat=True))
+            new = [event for event in new if event['user_id'] in users]
+            if not new:
+                return
+
+            UsageLog.objects.bulk_create([
+                UsageLog(
+                    event_id=event['event_id'],
+                    api_user_id=event['user_id'],
+                    action=event['action'],
+                    requests=event.get('requests', 1),
+                    tokens_used=event['tokens_used'],
+                    cost=Decimal(event['cost']),
+                    model=event['model'],
+                    prompt_length=event['prompt_length'],
+                    prompt_tokens=event.get('prompt_tokens', 0),
+                    cached_tokens=event.get('cached_tokens', 0),
+                    prompt_template=event.get('prompt_template', ''),
+                    timestamp=parse_datetime(event['timestamp']),
+                    route=event.get('route', ''),
+                    requested_model=event.get('requested_model', ''),
+                    fallback_used=event.get('fallback_used', False),
+                    hedged=event.get('hedged', False),
+                    hedge_tokens=event.get('hedge_tokens', 0),
+                    latency_ms=event.get('latency_ms'),
+                )
+                for event in new
+            ], batch_size=500)
+
+            for user_id, delta in aggregate_deltas(new).items():
+                APIUser.objects.filter(pk=user_id).update(
+                    total_requests=F('total_requests') + delta['requests'],
+                    total_tokens_used=F('total_tokens_used') + delta['tokens'],
+                    total_cost=F('total_cost') + Decimal(delta['cost_e4']) / COST_SCALE,
+                )
+
+    def _schedule_local_flush(self):
+        interval = getattr(settings, 'USAGE_FLUSH_INTERVAL', 2.0)
+        if interval <= 0:
+            return
+        with self._buffer_lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        with self._buffer_lock:
+            self._timer = None
+        try:
+            self.flush_all()
+        except Exception as e:
+            logger.error('Usage flush failed: %s', e)
+        finally:
+            close_old_connections()
+        if len(self.buffer):
+            self._schedule_local_flush()
+
+    def pending(self, user_id):
+        """Unflushed deltas for a user: {'requests', 'tokens', 'cost'}"""
+        try:
+            deltas = self.buffer.pending(user_id)
+        except Exception as e:
+            logger.warning('Usage buffer read failed: %s', e)
+            deltas = _empty_deltas()
+        return {
+            'requests': deltas['requests'],
+            'tokens': deltas['tokens'],
+            'cost': Decimal(deltas['cost_e4']) / COST_SCALE,
+        }
+
+    def totals(self, api_user):
+        """
+        Stored totals plus unflushed deltas
+
+        Args:
+            api_user: APIUser instance (its total_* fields are read as-is)
+
+        Returns:
+            dict: total_requests, total_tokens_used, total_cost
+        """
+        pending = self.pending(api_user.pk)
+        return {
+            'total_requests': api_user.total_requests + pending['requests'],
+            'total_tokens_used': api_user.total_tokens_used + pending['tokens'],
+            'total_cost': api_user.total_cost + pending['cost'],
+        }
+
+
+usage_recorder = UsageRecorder()
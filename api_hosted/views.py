@@ -1,6 +1,10 @@
 import jwt as pyjwt
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework import status
@@ -10,13 +14,33 @@ from api_hosted.serializers import (
     AuthRequestSerializer,
     AuthResponseSerializer,
     AIRequestSerializer,
-    AIResponseSerializer
+    AIResponseSerializer,
+    AIBatchRequestSerializer
 )
-from api_hosted.services import JWTService, AIProxyService, StripeService
+from api_hosted.services import JWTService, AIProxyService, AsyncAIProxyService, StripeService, token_estimator
+from shared.exceptions import IdempotencyConflictError, PromptTooLargeError, QuotaExceededError
+from shared.prompts import get_template
 from api_hosted.authentication import JWTAuthentication
+from api_hosted.idempotency import MAX_KEY_LENGTH as MAX_IDEMPOTENCY_KEY_LENGTH, idempotency_store, request_fingerprint
+from api_hosted.quota import ProjectReservation
+from api_hosted.ratelimit import ai_rate_limiter
+from api_hosted.revocation import token_denylist
+from api_hosted.rollups import usage_this_month
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import json
+import logging
+
+logger = logging.getLogger('provokely.api_hosted')
+
+# Fields /api/auth reads from a returning user
+LOGIN_FIELDS = ('id', 'email', 'is_pro', 'projects_remaining')
+
+# Quota reservation failed for another reason than an exhausted quota (e.g. database locked)
+QUOTA_UNAVAILABLE = {
+    'message': 'Could not reserve a project right now. Please retry later.',
+    'error': 'QUOTA_UNAVAILABLE'
+}
 
 
 class AuthAPIView(APIView):
@@ -39,21 +63,19 @@ class AuthAPIView(APIView):
         email = serializer.validated_data['email']
         
         try:
-            # Find or create user
-            api_user, created = APIUser.objects.get_or_create(
-                email=email,
-                defaults={
-                    'id': APIUser.generate_user_id()
-                }
-            )
+            # Returning users: a read-only lookup; only new emails write a row
+            api_user = APIUser.objects.only(*LOGIN_FIELDS).filter(email=email).first()
+            if api_user is None:
+                api_user, created = APIUser.objects.get_or_create(
+                    email=email,
+                    defaults={
+                        'id': APIUser.generate_user_id()
+                    }
+                )
             
-            # Generate JWT token
+            # Stateless JWT: nothing is stored, revocation goes through the denylist
             auth_token = JWTService.generate_token(api_user.id, api_user.email)
             
-            # Update user's token in database
-            api_user.auth_token = auth_token
-            api_user.save()
-            
             # Prepare response with subscription info
             response_data = {
                 'authToken': auth_token,
@@ -72,6 +94,23 @@ class AuthAPIView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class AuthLogoutView(APIView):
+    """
+    POST /api/auth/logout - Revoke the calling token
+    With {"all": true}, revokes every token issued to the user so far
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = []
+    
+    def post(self, request):
+        payload = JWTService.verify_token(request.auth)
+        if isinstance(request.data, dict) and request.data.get('all'):
+            token_denylist.revoke_user(payload['userId'])
+        else:
+            token_denylist.revoke_token(payload)
+        return Response({'message': 'Logged out'}, status=status.HTTP_200_OK)
+
+
 class AIProxyView(APIView):
     """
     POST /api/ai - AI proxy endpoint with usage tracking
@@ -81,55 +120,95 @@ class AIProxyView(APIView):
     permission_classes = []
     
     def post(self, request):
-        # Validate request
-        serializer = AIRequestSerializer(data=request.data)
+        # Retries carrying the same Idempotency-Key replay the first result
+        # (streamed responses are not stored)
+        idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        # Non-object bodies are rejected by the serializer in proxy()
+        options = (request.data.get('options') if isinstance(request.data, dict) else None) or {}
+        if not idempotency_key or (isinstance(options, dict) and options.get('stream')):
+            return self.proxy(request)
         
-        if not serializer.is_valid():
+        if len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
             return Response({
-                'message': 'Invalid request',
-                'errors': serializer.errors
+                'message': f'Idempotency-Key must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        prompt = serializer.validated_data['prompt']
-        user_email = serializer.validated_data['userEmail']
-        options = serializer.validated_data.get('options', {})
-        is_new_project = request.data.get('isNewProject', False)
+        first = {}
+        
+        def run():
+            first['response'] = self.proxy(request)
+            return first['response'].status_code, first['response'].data
+        
+        try:
+            status_code, data, replayed = idempotency_store.run(
+                request.user.pk,
+                idempotency_key,
+                request_fingerprint(request.data),
+                run
+            )
+        except IdempotencyConflictError as e:
+            return Response({
+                'message': str(e),
+                'error': 'IDEMPOTENCY_CONFLICT'
+            }, status=e.status_code)
         
+        if not replayed:
+            return first['response']
+        response = Response(data, status=status_code)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+    
+    def proxy(self, request):
+        """Validate, admit and run one AI request"""
         # Get authenticated user from request (set by JWTAuthentication)
         api_user = request.user
         
-        # Verify email matches
-        if api_user.email != user_email:
-            return Response({
-                'message': 'Email mismatch with authenticated user'
-            }, status=status.HTTP_403_FORBIDDEN)
+        prepared, error = self._prepare(request.data, api_user)
+        if error is not None:
+            return Response(error[0], status=error[1])
+        prompt = prepared['prompt']
+        model = prepared['model']
+        route = prepared['route']
+        max_tokens = prepared['max_tokens']
+        options = prepared['options']
+        estimate = prepared['estimate']
+        template = prepared['template']
         
-        # Check if user has projects remaining (unless Pro)
-        if not api_user.is_pro and is_new_project:
-            if api_user.projects_remaining <= 0:
-                return Response({
-                    'message': 'No free validations remaining. Please upgrade to Pro.',
-                    'error': 'LIMIT_REACHED'
-                }, status=status.HTTP_403_FORBIDDEN)
-            
-            # Decrement projects remaining
-            api_user.projects_remaining -= 1
-            api_user.save()
+        permit, reservation, error = self._admit(api_user, estimate, prepared['is_new_project'])
+        if error is not None:
+            return self._error_response(Response, error)
         
+        # The stream releases the permit itself once it closes
+        streaming = False
         try:
             # Initialize AI service
             ai_service = AIProxyService()
             
-            # Get model and max tokens from options
-            model = options.get('model', 'gpt-4o-mini')
-            max_tokens = options.get('maxTokens', 4000)
+            # Opt-in: relay deltas as server-sent events instead of blocking
+            if options.get('stream'):
+                stream = ai_service.stream_openai(
+                    prompt=prompt,
+                    model=model,
+                    max_tokens=max_tokens,
+                    use_cache=api_user.ai_cache_enabled,
+                    template=template
+                )
+                streaming = True
+                return self._stream_response(ai_service, api_user, stream, reservation, estimate, permit, route,
+                                             template)
             
-            # Call OpenAI API
+            # Call OpenAI API (or serve an identical earlier prompt from cache)
             result = ai_service.call_openai(
                 prompt=prompt,
-                model=model,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                use_cache=api_user.ai_cache_enabled,
+                user_id=api_user.id,
+                route=route,
+                template=template
             )
+            if reservation is not None:
+                reservation.commit()
+            permit.release(tokens_used=result['tokens_used'])
             
             # Calculate cost
             cost = ai_service.calculate_cost(
@@ -140,31 +219,623 @@ class AIProxyView(APIView):
             # Track usage
             ai_service.track_usage(
                 api_user=api_user,
-                action='ai_generation',
+                action=self._usage_action(result),
                 tokens_used=result['tokens_used'],
                 cost=cost,
                 model=result['model'],
-                prompt_length=len(prompt)
+                prompt_length=len(prompt),
+                routing=self._routing(result, route),
+                **self._prompt_usage(result, template)
             )
             
-            # Return response
-            response_data = {
-                'response': result['response'],
-                'tokensUsed': result['tokens_used'],
-                'cost': float(cost)
+            return Response(self._result_data(result, cost, estimate), status=status.HTTP_200_OK)
+            
+        except ValueError as e:
+            if reservation is not None:
+                reservation.refund()
+            return Response({
+                'message': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            if reservation is not None:
+                reservation.refund()
+            return Response({
+                'message': 'AI request failed',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if not streaming:
+                permit.release()
+    
+    @staticmethod
+    def _prepare(data, api_user):
+        """
+        Validate a request body and size it locally, before any quota is
+        reserved or network call made
+        
+        maxTokens is clamped and oversize prompts are rejected (or truncated).
+        
+        Args:
+            data: Parsed request body
+            api_user: Authenticated APIUser
+        
+        Returns:
+            tuple: (prepared, None) with prompt, model, route, template, max_tokens,
+                options, estimate and is_new_project, or (None, (error_data, status_code))
+        """
+        serializer = AIRequestSerializer(data=data)
+        
+        if not serializer.is_valid():
+            return None, ({
+                'message': 'Invalid request',
+                'errors': serializer.errors
+            }, status.HTTP_400_BAD_REQUEST)
+        
+        prompt = serializer.validated_data['prompt']
+        user_email = serializer.validated_data['userEmail']
+        options = serializer.validated_data.get('options', {})
+        
+        # Verify email matches
+        if api_user.email != user_email:
+            return None, ({
+                'message': 'Email mismatch with authenticated user'
+            }, status.HTTP_403_FORBIDDEN)
+        
+        try:
+            requested_max_tokens = int(options.get('maxTokens', 4000))
+        except (TypeError, ValueError):
+            return None, ({
+                'message': 'Invalid request',
+                'errors': {'options': ['maxTokens must be an integer']}
+            }, status.HTTP_400_BAD_REQUEST)
+        
+        template, error = AIProxyView._template(options)
+        if error is not None:
+            return None, (error, status.HTTP_400_BAD_REQUEST)
+        
+        # Pick the model from the routing policy (options.model pins it)
+        requested_model = options.get('model')
+        route = AIProxyService.route(
+            token_estimator.prompt_tokens(prompt, requested_model or 'gpt-4o-mini', template.prefix),
+            action=options.get('action'),
+            tier='pro' if api_user.is_pro else 'free',
+            requested_model=requested_model,
+            max_tokens=requested_max_tokens
+        )
+        model = route['model']
+        try:
+            estimate = token_estimator.prepare(
+                prompt,
+                model=model,
+                max_tokens=requested_max_tokens,
+                truncate=bool(options.get('truncate', False)),
+                system=template.prefix
+            )
+        except PromptTooLargeError as e:
+            return None, ({
+                'message': str(e),
+                'error': 'PROMPT_TOO_LARGE',
+                'estimate': e.estimate
+            }, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        return {
+            'prompt': estimate['prompt'],
+            'model': model,
+            'route': route,
+            'template': template,
+            'max_tokens': estimate['max_tokens'],
+            'options': options,
+            'estimate': estimate,
+            'is_new_project': data.get('isNewProject', False)
+        }, None
+    
+    @staticmethod
+    def _template(options):
+        """
+        Resolve options.template (and options.brandVoice) to a PromptTemplate
+        
+        options.brandVoice names one of settings.AI_BRAND_VOICES; clients
+        cannot put their own text into the system prompt.
+        
+        Returns:
+            tuple: (template, None), or (None, error_data) for an unknown template or voice
+        """
+        name = options.get('template')
+        voice = options.get('brandVoice')
+        brand_voice = None
+        if voice is not None:
+            voices = getattr(settings, 'AI_BRAND_VOICES', None) or {}
+            if not isinstance(voice, str) or voice not in voices:
+                return None, {
+                    'message': 'Invalid request',
+                    'errors': {'options': [f'Unknown brand voice: {voice}']}
+                }
+            brand_voice = voices[voice]
+        try:
+            return get_template(name, brand_voice), None
+        except (KeyError, TypeError):
+            return None, {
+                'message': 'Invalid request',
+                'errors': {'options': [f'Unknown prompt template: {name}']}
             }
+    
+    @staticmethod
+    def _admit(api_user, estimate, is_new_project):
+        """
+        Apply the per-user rate limits and reserve a free project (unless Pro)
+        
+        Returns:
+            tuple: (permit, reservation or None, None) when admitted, else
+                (None, None, (error_data, status_code, headers))
+        """
+        # Per-user concurrency and requests/tokens-per-minute limits
+        permit, rejection = ai_rate_limiter.acquire(
+            api_user,
+            estimated_tokens=estimate['prompt_tokens'] + estimate['max_tokens']
+        )
+        if permit is None:
+            return None, None, ({
+                'message': 'Rate limit exceeded. Please retry later.',
+                'error': 'RATE_LIMITED',
+                'limit': rejection['limit'],
+                'retryAfter': rejection['retry_after']
+            }, status.HTTP_429_TOO_MANY_REQUESTS, {'Retry-After': str(rejection['retry_after'])})
+        
+        # Atomically reserve a free project; refunded if the AI call fails
+        reservation = None
+        if not api_user.is_pro and is_new_project:
+            try:
+                reservation = ProjectReservation.reserve(api_user)
+            except QuotaExceededError:
+                permit.release(tokens_used=0)
+                return None, None, ({
+                    'message': 'No free validations remaining. Please upgrade to Pro.',
+                    'error': 'LIMIT_REACHED'
+                }, status.HTTP_403_FORBIDDEN, {})
+            except Exception as e:
+                # Never leave the concurrency slot held by a request that is not going to run
+                permit.release(tokens_used=0)
+                logger.warning('Project reservation for %s failed: %s', api_user.pk, e)
+                return None, None, (QUOTA_UNAVAILABLE, status.HTTP_503_SERVICE_UNAVAILABLE, {'Retry-After': '1'})
+        return permit, reservation, None
+    
+    @staticmethod
+    def _error_response(response_class, error):
+        """Build an error response from _admit()'s (data, status, headers)"""
+        data, status_code, headers = error
+        response = response_class(data, status=status_code)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    
+    def _stream_response(self, ai_service, api_user, stream, reservation=None, estimate=None, permit=None,
+                         route=None, template=None):
+        """
+        Relay an AIStream as text/event-stream
+        
+        Events: `delta` ({"content"}) per chunk, then `done` ({"tokensUsed",
+        "cost", "cached"}) or `error`. Usage is tracked exactly once when the
+        generator is closed, which Django does on completion and when the
+        client disconnects mid-stream. A reserved project is refunded only
+        when nothing was streamed.
+        """
+        def events():
+            try:
+                for text in stream:
+                    yield sse_event('delta', {'content': text})
+                cost = ai_service.calculate_cost(stream.tokens_used, model=stream.model)
+                yield sse_event('done', {
+                    'tokensUsed': stream.tokens_used,
+                    'cost': float(cost),
+                    'cached': stream.cached,
+                    'estimate': self._estimate_data(estimate) if estimate else None
+                })
+            except Exception as e:
+                yield sse_event('error', {'message': 'AI request failed', 'error': str(e)})
+            finally:
+                stream.close()
+                if permit is not None:
+                    permit.release(tokens_used=stream.tokens_used)
+                if reservation is not None:
+                    if stream.parts:
+                        reservation.commit()
+                    else:
+                        reservation.refund()
+                if stream.cached:
+                    action = 'ai_generation_cached'
+                elif stream.finished:
+                    action = 'ai_generation_stream'
+                else:
+                    action = 'ai_generation_stream_aborted'
+                ai_service.track_usage(
+                    api_user=api_user,
+                    action=action,
+                    tokens_used=stream.tokens_used,
+                    cost=ai_service.calculate_cost(stream.tokens_used, model=stream.model),
+                    model=stream.model,
+                    prompt_length=len(stream.prompt),
+                    routing=self._routing({}, route),
+                    **self._prompt_usage(stream.result(), template)
+                )
+        
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @staticmethod
+    def _estimate_data(estimate):
+        """Pre-flight token estimate as returned to clients"""
+        return {
+            'promptTokens': estimate['prompt_tokens'],
+            'maxTokens': estimate['max_tokens'],
+            'requestedMaxTokens': estimate['requested_max_tokens'],
+            'estimatedMaxCost': estimate['estimated_cost'],
+            'truncated': estimate['truncated']
+        }
+    
+    @classmethod
+    def _result_data(cls, result, cost, estimate):
+        """Response body for a completed (non-streamed) AI request"""
+        return {
+            'response': result['response'],
+            'tokensUsed': result['tokens_used'],
+            'cost': float(cost),
+            'cached': result['cached'],
+            'coalesced': result['coalesced'],
+            'estimate': cls._estimate_data(estimate)
+        }
+    
+    @staticmethod
+    def _routing(result, route):
+        """Routing decision to log: the router's record, or just the rule for cache hits and streams"""
+        if result.get('routing') and not result.get('cached'):
+            return result['routing']
+        if route is None:
+            return None
+        return {'rule': route['rule'], 'requested_model': route['requested_model']}
+    
+    @staticmethod
+    def _prompt_usage(result, template):
+        """track_usage() kwargs for provider prompt caching (prompt_cache_stats reads them)"""
+        return {
+            'prompt_tokens': result.get('prompt_tokens', 0),
+            'cached_tokens': result.get('cached_tokens', 0),
+            'prompt_template': template.name if template is not None else ''
+        }
+    
+    @staticmethod
+    def _usage_action(result):
+        """UsageLog action for a proxy result (served from cache, shared or generated)"""
+        if result['cached']:
+            return 'ai_generation_cached'
+        if result['coalesced']:
+            return 'ai_generation_coalesced'
+        return 'ai_generation'
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAIProxyView(View):
+    """
+    POST /api/ai - Async AI proxy for ASGI deployments (AI_PROXY_ASYNC=true)
+    Same contract as AIProxyView, but the OpenAI call is awaited on the event
+    loop, so one process serves many in-flight requests. Streamed and
+    Idempotency-Key requests are handed to AIProxyView.
+    """
+    authentication = JWTAuthentication()
+    
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as e:
+            return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            data = {}
+        
+        options = data.get('options') or {}
+        if request.META.get('HTTP_IDEMPOTENCY_KEY') or (isinstance(options, dict) and options.get('stream')):
+            return await sync_to_async(AIProxyView.as_view())(request)
+        
+        try:
+            api_user, _ = await self.authentication.aauthenticate(request)
+        except AuthenticationFailed as e:
+            response = JsonResponse({'detail': str(e.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+            response['WWW-Authenticate'] = self.authentication.authenticate_header(request)
+            return response
+        
+        prepared, error = AIProxyView._prepare(data, api_user)
+        if error is not None:
+            return JsonResponse(error[0], status=error[1])
+        prompt = prepared['prompt']
+        estimate = prepared['estimate']
+        
+        permit, reservation, error = await sync_to_async(AIProxyView._admit)(
+            api_user, estimate, prepared['is_new_project']
+        )
+        if error is not None:
+            return AIProxyView._error_response(JsonResponse, error)
+        
+        try:
+            ai_service = AsyncAIProxyService()
+            result = await ai_service.call_openai(
+                prompt=prompt,
+                max_tokens=prepared['max_tokens'],
+                use_cache=api_user.ai_cache_enabled,
+                user_id=api_user.id,
+                route=prepared['route'],
+                template=prepared['template']
+            )
+            if reservation is not None:
+                reservation.commit()
+            await sync_to_async(permit.release, thread_sensitive=False)(tokens_used=result['tokens_used'])
             
-            return Response(response_data, status=status.HTTP_200_OK)
+            cost = ai_service.calculate_cost(
+                tokens_used=result['tokens_used'],
+                model=result['model']
+            )
+            await ai_service.track_usage(
+                api_user=api_user,
+                action=AIProxyView._usage_action(result),
+                tokens_used=result['tokens_used'],
+                cost=cost,
+                model=result['model'],
+                prompt_length=len(prompt),
+                routing=AIProxyView._routing(result, prepared['route']),
+                **AIProxyView._prompt_usage(result, prepared['template'])
+            )
+            
+            return JsonResponse(AIProxyView._result_data(result, cost, estimate), status=status.HTTP_200_OK)
             
         except ValueError as e:
-            return Response({
+            if reservation is not None:
+                await sync_to_async(reservation.refund)()
+            return JsonResponse({
                 'message': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
+            if reservation is not None:
+                await sync_to_async(reservation.refund)()
+            return JsonResponse({
+                'message': 'AI request failed',
+                'error': str(e)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            if not permit.released:
+                await sync_to_async(permit.release, thread_sensitive=False)()
+
+
+class AIBatchView(APIView):
+    """
+    POST /api/ai/batch - Run several AI prompts in one request
+    Items run concurrently upstream (bounded by AI_BATCH_CONCURRENCY); the whole
+    batch is authenticated, rate limited, quota-reserved and accounted once
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = []
+    
+    def post(self, request):
+        serializer = AIBatchRequestSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response({
+                'message': 'Invalid request',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        user_email = serializer.validated_data['userEmail']
+        items = serializer.validated_data['items']
+        is_new_project = serializer.validated_data['isNewProject']
+        api_user = request.user
+        
+        if api_user.email != user_email:
+            return Response({
+                'message': 'Email mismatch with authenticated user'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        # Size every item locally; oversize prompts fail on their own without
+        # failing the batch
+        results = [None] * len(items)
+        calls = []
+        for index, item in enumerate(items):
+            options = item.get('options') or {}
+            try:
+                requested_max_tokens = int(options.get('maxTokens', 4000))
+            except (TypeError, ValueError):
+                return Response({
+                    'message': 'Invalid request',
+                    'errors': {'items': {index: {'options': ['maxTokens must be an integer']}}}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            template, error = AIProxyView._template(options)
+            if error is not None:
+                return Response({
+                    'message': 'Invalid request',
+                    'errors': {'items': {index: error['errors']}}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            route = AIProxyService.route(
+                token_estimator.prompt_tokens(item['prompt'], options.get('model') or 'gpt-4o-mini', template.prefix),
+                action=options.get('action'),
+                tier='pro' if api_user.is_pro else 'free',
+                requested_model=options.get('model'),
+                max_tokens=requested_max_tokens
+            )
+            model = route['model']
+            try:
+                estimate = token_estimator.prepare(
+                    item['prompt'],
+                    model=model,
+                    max_tokens=requested_max_tokens,
+                    truncate=bool(options.get('truncate', False)),
+                    system=template.prefix
+                )
+            except PromptTooLargeError as e:
+                results[index] = {
+                    'index': index,
+                    'message': str(e),
+                    'error': 'PROMPT_TOO_LARGE',
+                    'estimate': e.estimate
+                }
+                continue
+            calls.append({
+                'index': index,
+                'prompt': estimate['prompt'],
+                'model': model,
+                'route': route,
+                'template': template,
+                'max_tokens': estimate['max_tokens'],
+                'estimate': estimate
+            })
+        
+        if not calls:
+            return Response({
+                'results': results,
+                'tokensUsed': 0,
+                'cost': 0.0
+            }, status=status.HTTP_200_OK)
+        
+        # One admission for the batch: a single concurrency slot, one request
+        # per upstream call and the summed token estimate
+        permit, rejection = ai_rate_limiter.acquire(
+            api_user,
+            estimated_tokens=sum(c['estimate']['prompt_tokens'] + c['max_tokens'] for c in calls),
+            requests=len(calls)
+        )
+        if permit is None:
+            response = Response({
+                'message': 'Rate limit exceeded. Please retry later.',
+                'error': 'RATE_LIMITED',
+                'limit': rejection['limit'],
+                'retryAfter': rejection['retry_after']
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(rejection['retry_after'])
+            return response
+        
+        # One free project covers the whole batch; refunded if every item failed
+        reservation = None
+        if not api_user.is_pro and is_new_project:
+            try:
+                reservation = ProjectReservation.reserve(api_user)
+            except QuotaExceededError:
+                permit.release(tokens_used=0)
+                return Response({
+                    'message': 'No free validations remaining. Please upgrade to Pro.',
+                    'error': 'LIMIT_REACHED'
+                }, status=status.HTTP_403_FORBIDDEN)
+            except Exception as e:
+                permit.release(tokens_used=0)
+                logger.warning('Project reservation for %s failed: %s', api_user.pk, e)
+                response = Response(QUOTA_UNAVAILABLE, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = '1'
+                return response
+        
+        tokens_used = 0
+        try:
+            ai_service = AIProxyService()
+            outcomes = ai_service.call_openai_batch(
+                calls,
+                max_workers=getattr(settings, 'AI_BATCH_CONCURRENCY', 4),
+                use_cache=api_user.ai_cache_enabled,
+                user_id=api_user.id
+            )
+        except Exception as e:
+            if reservation is not None:
+                reservation.refund()
+            permit.release()
             return Response({
                 'message': 'AI request failed',
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # Aggregate accounting: one usage entry per model, template and action (generated,
+        # cached or coalesced, as for /api/ai), each counting its items; written together
+        usage = {}
+        total_cost = 0.0
+        for call, outcome in zip(calls, outcomes):
+            index = call['index']
+            if isinstance(outcome, Exception):
+                results[index] = {
+                    'index': index,
+                    'message': 'AI request failed',
+                    'error': str(outcome)
+                }
+                continue
+            cost = ai_service.calculate_cost(outcome['tokens_used'], model=outcome['model'])
+            tokens_used += outcome['tokens_used']
+            total_cost += cost
+            action = AIProxyView._usage_action(outcome).replace('ai_generation', 'ai_batch')
+            entry = usage.setdefault((outcome['model'], call['template'].name, action), {
+                'action': action,
+                'requests': 0,
+                'tokens_used': 0,
+                'cost': 0.0,
+                'model': outcome['model'],
+                'prompt_length': 0,
+                'prompt_tokens': 0,
+                'cached_tokens': 0,
+                'prompt_template': call['template'].name
+            })
+            entry['requests'] += 1
+            entry['tokens_used'] += outcome['tokens_used']
+            entry['cost'] += cost
+            entry['prompt_length'] += len(call['prompt'])
+            entry['prompt_tokens'] += outcome.get('prompt_tokens', 0)
+            entry['cached_tokens'] += outcome.get('cached_tokens', 0)
+            results[index] = {
+                'index': index,
+                'response': outcome['response'],
+                'tokensUsed': outcome['tokens_used'],
+                'cost': float(cost),
+                'cached': outcome['cached'],
+                'coalesced': outcome['coalesced'],
+                'model': outcome['model'],
+                'estimate': AIProxyView._estimate_data(call['estimate'])
+            }
+        
+        permit.release(tokens_used=tokens_used)
+        if reservation is not None:
+            if usage:
+                reservation.commit()
+            else:
+                reservation.refund()
+        if usage:
+            ai_service.track_usage_batch(api_user, [
+                dict(entry, cost=round(entry['cost'], 4)) for entry in usage.values()
+            ])
+        
+        return Response({
+            'results': results,
+            'tokensUsed': tokens_used,
+            'cost': round(total_cost, 4)
+        }, status=status.HTTP_200_OK)
+
+
+class UsageView(APIView):
+    """
+    GET /api/usage - Month-to-date usage for the authenticated user
+    Served from the daily rollups (see api_hosted/rollups.py)
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = []
+    
+    def get(self, request):
+        usage = usage_this_month(request.user)
+        return Response({
+            'month': usage['month'],
+            'requests': usage['requests'],
+            'tokensUsed': usage['tokens_used'],
+            'cost': float(usage['cost']),
+            'days': [{
+                'date': day['day'].isoformat(),
+                'requests': day['requests'],
+                'tokensUsed': day['tokens_used'],
+                'cost': float(day['cost'])
+            } for day in usage['days']]
+        }, status=status.HTTP_200_OK)
+
+
+def sse_event(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 def saas_validator_privacy(request):
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 import logging
 
@@ -186,7 +188,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -232,13 +234,20 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Session Configuration
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Use database-backed sessions
+# Cache-first sessions with DB fallback (core/sessions.py) need a cache shared by all workers
+# (CACHE_REDIS_URL, see Cache Configuration): with per-process caches a worker could serve a
+# stale session changed elsewhere, so the database engine stays the default without one
+SESSION_ENGINE = os.getenv('SESSION_ENGINE') or (
+    'core.sessions' if os.getenv('CACHE_REDIS_URL') else 'django.contrib.sessions.backends.db'
+)
 SESSION_COOKIE_NAME = 'provokely_sessionid'  # Custom session cookie name
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_COOKIE_SECURE = True  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'  # Lax allows cookies to be sent on redirects from OAuth providers
 SESSION_SAVE_EVERY_REQUEST = True  # Save session on every request to keep it alive
+# core.sessions only rewrites an unchanged session once this fraction of SESSION_COOKIE_AGE has elapsed
+SESSION_REFRESH_THRESHOLD = float(os.getenv('SESSION_REFRESH_THRESHOLD', '0.1'))
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
 """Instagram / Facebook Login Configuration"""
@@ -255,9 +264,79 @@ FACEBOOK_WEBHOOK_VERIFY_TOKEN = os.getenv('FACEBOOK_WEBHOOK_VERIFY_TOKEN', 'prov
 # OpenAI configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+# Shared per-process OpenAI client (shared/openai_client.py): HTTP pool and timeouts
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv('OPENAI_HTTP_MAX_CONNECTIONS', '100'))
+OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv('OPENAI_HTTP_MAX_KEEPALIVE', '20'))
+OPENAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_HTTP_KEEPALIVE_EXPIRY', '30'))
+# Sync gunicorn workers are killed after GUNICORN_TIMEOUT (gunicorn.conf.py), so a routed /api/ai
+# call must give up first or the worker dies mid-request (leaking its in-flight rate-limit slot).
+# The SDK does not retry by default (OPENAI_MAX_RETRIES=0): api_hosted/routing.py owns retries and
+# fallback, trying at most AI_ROUTING_MAX_ATTEMPTS models. The worst case, OPENAI_TIMEOUT x
+# (OPENAI_MAX_RETRIES + 1) x AI_ROUTING_MAX_ATTEMPTS, is checked against GUNICORN_TIMEOUT below
+GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '25'))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '0'))
+AI_ROUTING_MAX_ATTEMPTS = max(1, int(os.getenv('AI_ROUTING_MAX_ATTEMPTS', '2')))
+_OPENAI_WORST_CASE = OPENAI_TIMEOUT * (OPENAI_MAX_RETRIES + 1) * AI_ROUTING_MAX_ATTEMPTS
+if _OPENAI_WORST_CASE >= GUNICORN_TIMEOUT:
+    raise ImproperlyConfigured(
+        f'OPENAI_TIMEOUT ({OPENAI_TIMEOUT}s) x (OPENAI_MAX_RETRIES ({OPENAI_MAX_RETRIES}) + 1) x '
+        f'AI_ROUTING_MAX_ATTEMPTS ({AI_ROUTING_MAX_ATTEMPTS}) = {_OPENAI_WORST_CASE}s must be below '
+        f'GUNICORN_TIMEOUT ({GUNICORN_TIMEOUT}s)'
+    )
+
+# Comment sentiment: local lexicon results below this confidence escalate to the LLM
+SENTIMENT_ESCALATION_THRESHOLD = float(os.getenv('SENTIMENT_ESCALATION_THRESHOLD', '0.6'))
+# Escalated comments are classified in batches of up to N per chat completion; a single
+# comment waits at most SENTIMENT_LLM_MAX_WAIT_MS for others to share its request
+SENTIMENT_LLM_MODEL = os.getenv('SENTIMENT_LLM_MODEL', OPENAI_MODEL)
+SENTIMENT_LLM_BATCH_SIZE = int(os.getenv('SENTIMENT_LLM_BATCH_SIZE', '20'))
+SENTIMENT_LLM_MAX_WAIT_MS = float(os.getenv('SENTIMENT_LLM_MAX_WAIT_MS', '50'))
+
+# Brand voice for comment replies (shared/prompts.py COMMENT_REPLY). Part of the cached
+# prompt prefix: keep it stable, every change starts a cold provider prompt cache
+REPLY_BRAND_VOICE = os.getenv('REPLY_BRAND_VOICE', '')
+
+# Named brand voices /api/ai clients may pick with options.brandVoice, as a JSON object
+# of name -> voice text. Only these reach the system prompt, never client-supplied text
+AI_BRAND_VOICES = json.loads(os.getenv('AI_BRAND_VOICES', '') or '{}')
+
+# Near-duplicate comment clusters (core/dedup.py) reuse a cluster's label and reply for
+# COMMENT_DEDUP_WINDOW seconds after its last match; THRESHOLD is the min Jaccard similarity
+COMMENT_DEDUP_ENABLED = os.getenv('COMMENT_DEDUP_ENABLED', 'true').lower() == 'true'
+COMMENT_DEDUP_WINDOW = int(os.getenv('COMMENT_DEDUP_WINDOW', '3600'))
+COMMENT_DEDUP_THRESHOLD = float(os.getenv('COMMENT_DEDUP_THRESHOLD', '0.7'))
 
 # JWT Secret for Hosted API
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)
+# Key rotation: JWT_SIGNING_KEYS="2025b:secret,2025a:old-secret" signs with the first key (or
+# JWT_ACTIVE_KEY_ID) and verifies tokens by their kid header; unset signs with JWT_SECRET_KEY
+JWT_SIGNING_KEYS = dict(
+    item.strip().split(':', 1) for item in os.getenv('JWT_SIGNING_KEYS', '').split(',') if ':' in item
+)
+JWT_ACTIVE_KEY_ID = os.getenv('JWT_ACTIVE_KEY_ID')
+if JWT_ACTIVE_KEY_ID and JWT_ACTIVE_KEY_ID not in (JWT_SIGNING_KEYS or {'default': None}):
+    raise ImproperlyConfigured(f"JWT_ACTIVE_KEY_ID {JWT_ACTIVE_KEY_ID!r} is not a key id of JWT_SIGNING_KEYS")
+JWT_TOKEN_LIFETIME_DAYS = int(os.getenv('JWT_TOKEN_LIFETIME_DAYS', '30'))
+# Revoked tokens / users are rows of jwt_revocations (api_hosted/revocation.py; purge expired ones
+# with `manage.py purge_jwt_revocations`). Per-user state is cached for JWT_DENYLIST_CACHE_TTL,
+# capped to JWT_DENYLIST_LOCAL_TTL without a shared cache
+JWT_DENYLIST_ENABLED = os.getenv('JWT_DENYLIST_ENABLED', 'true').lower() == 'true'
+JWT_DENYLIST_CACHE_TTL = int(os.getenv('JWT_DENYLIST_CACHE_TTL', '300'))
+JWT_DENYLIST_LOCAL_TTL = int(os.getenv('JWT_DENYLIST_LOCAL_TTL', '5'))
+# JWTAuthentication resolves users through a principal cache (api_hosted/principals.py):
+# a per-process LRU (short TTL, bounds cross-worker staleness) in front of the default cache
+# (TTL capped to LOCAL_TTL when the default cache is the per-process LocMemCache)
+AUTH_PRINCIPAL_CACHE_ENABLED = os.getenv('AUTH_PRINCIPAL_CACHE_ENABLED', 'true').lower() == 'true'
+AUTH_PRINCIPAL_CACHE_TTL = int(os.getenv('AUTH_PRINCIPAL_CACHE_TTL', '300'))
+AUTH_PRINCIPAL_LOCAL_TTL = float(os.getenv('AUTH_PRINCIPAL_LOCAL_TTL', '5'))
+AUTH_PRINCIPAL_LOCAL_MAX_ENTRIES = int(os.getenv('AUTH_PRINCIPAL_LOCAL_MAX_ENTRIES', '10000'))
+# Mobile API token -> user snapshots (core/authentication.py), dropped on logout/token delete.
+# Without a shared cache invalidations only reach one worker: TTL is capped to LOCAL_TTL
+TOKEN_AUTH_CACHE_ENABLED = os.getenv('TOKEN_AUTH_CACHE_ENABLED', 'true').lower() == 'true'
+TOKEN_AUTH_CACHE_TTL = int(os.getenv('TOKEN_AUTH_CACHE_TTL', '300'))
+TOKEN_AUTH_LOCAL_TTL = int(os.getenv('TOKEN_AUTH_LOCAL_TTL', '5'))
 
 # Stripe Payment Configuration
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
@@ -290,6 +369,103 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Cache Configuration
+# Set CACHE_REDIS_URL to share caches across gunicorn workers/hosts; without it each
+# process uses its own in-memory cache.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+AI_RESPONSE_CACHE_TTL = int(os.getenv('AI_RESPONSE_CACHE_TTL', '86400'))
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESPONSE_CACHE_MAX_ENTRIES', '5000'))
+# Identical concurrent /api/ai requests (same user, model, prompt) share one upstream call
+AI_COALESCE_LOCK_TTL = int(os.getenv('AI_COALESCE_LOCK_TTL', '120'))
+AI_COALESCE_WAIT_TIMEOUT = int(os.getenv('AI_COALESCE_WAIT_TIMEOUT', '90'))
+AI_COALESCE_RESULT_TTL = int(os.getenv('AI_COALESCE_RESULT_TTL', '15'))
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'provokely',
+        },
+        # Size is bounded by the Redis maxmemory / allkeys-lru policy
+        'ai_responses': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'provokely',
+            'TIMEOUT': AI_RESPONSE_CACHE_TTL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'provokely-default',
+        },
+        'ai_responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'provokely-ai-responses',
+            'TIMEOUT': AI_RESPONSE_CACHE_TTL,
+            'OPTIONS': {'MAX_ENTRIES': AI_RESPONSE_CACHE_MAX_ENTRIES},
+        },
+    }
+
+# Idempotency-Key replays for /api/ai (stored in the default cache)
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', '120'))
+IDEMPOTENCY_WAIT_TIMEOUT = int(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', '90'))
+
+# Serve /api/ai with the async view (AsyncAIProxyView); enable when running under an ASGI
+# server, e.g. `gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker`
+AI_PROXY_ASYNC = os.getenv('AI_PROXY_ASYNC', 'false').lower() == 'true'
+
+# Model routing for /api/ai (api_hosted/routing.py): first matching rule picks the model,
+# its fallbacks (tried on timeout/5xx, never pricier than the model) and hedge_after_ms /
+# hedge_max_tokens (same-model hedging of short completions). None uses routing.DEFAULT_RULES.
+# At most AI_ROUTING_MAX_ATTEMPTS models are tried per request (see OpenAI configuration).
+AI_ROUTING_ENABLED = os.getenv('AI_ROUTING_ENABLED', 'true').lower() == 'true'
+AI_ROUTING_RULES = None
+
+# POST /api/ai/batch: max prompts per request and concurrent upstream calls per batch
+AI_BATCH_MAX_ITEMS = int(os.getenv('AI_BATCH_MAX_ITEMS', '10'))
+AI_BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', '4'))
+
+# Per-user /api/ai rate limits (api_hosted/ratelimit.py), shared across workers through Redis
+AI_RATE_LIMIT_ENABLED = os.getenv('AI_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', CACHE_REDIS_URL)
+AI_RATE_LIMITS = {
+    'free': {
+        'concurrency': int(os.getenv('AI_RATE_FREE_CONCURRENCY', '2')),
+        'requests_per_minute': int(os.getenv('AI_RATE_FREE_RPM', '20')),
+        'tokens_per_minute': int(os.getenv('AI_RATE_FREE_TPM', '40000')),
+    },
+    'pro': {
+        'concurrency': int(os.getenv('AI_RATE_PRO_CONCURRENCY', '8')),
+        'requests_per_minute': int(os.getenv('AI_RATE_PRO_RPM', '120')),
+        'tokens_per_minute': int(os.getenv('AI_RATE_PRO_TPM', '400000')),
+    },
+}
+
+# Write-behind usage accounting (api_hosted/usage.py): /api/ai usage events are buffered
+# and flushed in batches. With USAGE_REDIS_URL the buffer is a Redis stream flushed by the
+# flush_usage_events Celery task (or `manage.py flush_usage --loop`). Without it events would be
+# queued in-process (flushed every USAGE_FLUSH_INTERVAL seconds) and lost with a killed worker,
+# so write-behind only defaults on with USAGE_REDIS_URL; otherwise usage is written per request
+USAGE_REDIS_URL = os.getenv('USAGE_REDIS_URL', CACHE_REDIS_URL)
+USAGE_WRITE_BEHIND = os.getenv('USAGE_WRITE_BEHIND', 'true' if USAGE_REDIS_URL else 'false').lower() == 'true'
+USAGE_FLUSH_INTERVAL = float(os.getenv('USAGE_FLUSH_INTERVAL', '2'))
+USAGE_FLUSH_BATCH_SIZE = int(os.getenv('USAGE_FLUSH_BATCH_SIZE', '1000'))
+USAGE_CLAIM_IDLE_MS = int(os.getenv('USAGE_CLAIM_IDLE_MS', '60000'))
+CELERY_BEAT_SCHEDULE = {
+    'flush-usage-events': {
+        'task': 'api_hosted.tasks.flush_usage_events',
+        'schedule': USAGE_FLUSH_INTERVAL,
+    },
+    'aggregate-usage-rollups': {
+        'task': 'api_hosted.tasks.aggregate_usage_rollups',
+        'schedule': float(os.getenv('USAGE_ROLLUP_INTERVAL', '60')),
+    },
+}
+
 # Basic logging configuration
 LOGGING = {
     'version': 1,
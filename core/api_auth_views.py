@@ -2,11 +2,11 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework import serializers
 
+from core.authentication import CachedTokenAuthentication
 from shared.api_responses import success_response, error_response
 
 
@@ -83,7 +83,7 @@ class LoginView(APIView):
 
 
 class MeView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -101,4 +101,15 @@ class MeView(APIView):
         )
 
 
+class LogoutView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
 
+    def post(self, request):
+        # Deleting the token revokes it everywhere, including the auth cache
+        Token.objects.filter(key=request.auth.key).delete()
+        return success_response(
+            data=None,
+            message='Logout successful',
+            status_code=status.HTTP_200_OK,
+        )
@@ -1,15 +1,15 @@
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 from rest_framework import status
 
+from core.authentication import CachedTokenAuthentication
 from core.models import UserSettings
 from core.serializers import UserSettingsSerializer
 from shared.api_responses import success_response, error_response
 
 
 class InstagramSettingsView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
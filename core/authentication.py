@@ -0,0 +1,98 @@
+"""
+Cache-backed DRF token authentication for the mobile API
+
+TokenAuthentication joins authtoken_token to auth_user on every request.
+CachedTokenAuthentication resolves the key from a snapshot of the user in
+the default cache (Redis when CACHE_REDIS_URL is set) for
+TOKEN_AUTH_CACHE_TTL seconds and only queries on a miss.
+
+Entries are dropped when the token is deleted (logout, revocation in the
+admin) and when its user is saved or deleted, so a deactivated user or a
+changed password never outlives the cache. Those invalidations only reach
+every worker through a shared cache: with the per-process local memory
+cache the TTL is capped to TOKEN_AUTH_LOCAL_TTL (5s), which bounds how long
+another worker keeps accepting a revoked token. The snapshot holds the fields the
+API reads (id, username, email, names and the active/staff flags); others
+are deferred and loaded on access.
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+logger = logging.getLogger('provokely.core')
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+
+
+def token_cache_key(key: str) -> str:
+    # Keys are credentials: never store them in the cache key space as-is
+    return 'authtoken:' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def invalidate_token(key: str):
+    """Drop a token's cached user (no-op when the cache is unavailable)"""
+    try:
+        caches['default'].delete(token_cache_key(key))
+    except Exception as e:
+        logger.warning('Token cache invalidation failed: %s', e)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in TokenAuthentication that caches token -> user snapshots"""
+
+    def authenticate_credentials(self, key):
+        if not getattr(settings, 'TOKEN_AUTH_CACHE_ENABLED', True):
+            return super().authenticate_credentials(key)
+
+        cache = caches['default']
+        cache_key = token_cache_key(key)
+        try:
+            snapshot = cache.get(cache_key)
+        except Exception as e:
+            # A cache outage falls back to the database
+            logger.warning('Token cache read failed: %s', e)
+            snapshot = None
+
+        if snapshot is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').only(
+                    'key', 'user_id', *(f'user__{field}' for field in USER_FIELDS)
+                ).get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            snapshot = {field: getattr(token.user, field) for field in USER_FIELDS}
+            try:
+                cache.set(cache_key, snapshot, timeout=self._ttl(cache))
+            except Exception as e:
+                logger.warning('Token cache write failed: %s', e)
+            user = token.user
+        else:
+            user = self._user(snapshot)
+            token = self.get_model()(key=key, user_id=snapshot['id'])
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, token)
+
+    @staticmethod
+    def _ttl(cache):
+        ttl = getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 300)
+        if isinstance(cache, LocMemCache):
+            # Per process: other workers never see this worker's invalidations
+            return min(ttl, getattr(settings, 'TOKEN_AUTH_LOCAL_TTL', 5))
+        return ttl
+
+    @staticmethod
+    def _user(snapshot):
+        user_model = get_user_model()
+        # from_db() takes the loaded values in model field order; the rest stay deferred
+        names = [f.attname for f in user_model._meta.concrete_fields if f.attname in snapshot]
+        return user_model.from_db('default', names, [snapshot[name] for name in names])
@@ -0,0 +1,189 @@
+"""
+Near-duplicate comment clustering
+
+Spam waves and giveaway posts bring thousands of near-identical comments
+("🔥🔥🔥", "@anna @ben 🔥", "price??"). NearDuplicateIndex clusters them per
+account so a comment that lands in a recent cluster reuses that cluster's
+sentiment label and reply instead of another LLM call.
+
+Comments are normalised (mentions, repeated characters, emoji variants),
+shingled into character 3-grams and hashed into a MinHash signature whose
+bands are indexed (LSH): comments sharing a band are candidates, and a
+candidate matches when the signatures estimate a Jaccard similarity of at
+least `threshold`. Clusters live in the Django cache and expire `window`
+seconds after they were last matched, which makes the index a sliding time
+window that is shared by all workers when CACHE_REDIS_URL is set.
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+import uuid
+import zlib
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger('provokely.core')
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_MENTIONS_RE = re.compile(r'(?:@[\w.]+\s*)+')
+_URL_RE = re.compile(r'https?://\S+')
+# Emoji variation selectors, zero-width joiners and skin tone modifiers
+_STRIP_RE = re.compile('[\ufe0e\ufe0f\u200d\U0001F3FB-\U0001F3FF]')
+# ASCII punctuation except "@"; emoji carry the meaning of short comments, "!!" and "?" do not
+_PUNCTUATION_RE = re.compile(r'[!-/:-?\[-`{-~]')
+_REPEATED_SYMBOL_RE = re.compile(r'([^\w\s])\1+')
+_REPEATED_LETTER_RE = re.compile(r'(\w)\1{2,}')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_comment(text: str) -> str:
+    """
+    Canonical form of a comment for near-duplicate detection
+
+    Tagged accounts collapse to a single "@", links to "url", punctuation is
+    dropped, runs of a repeated emoji collapse to one and runs of 3+ letters
+    to one ("soooo").
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = _STRIP_RE.sub('', text)
+    text = _URL_RE.sub(' url ', text)
+    text = _MENTIONS_RE.sub('@ ', text)
+    text = _PUNCTUATION_RE.sub(' ', text)
+    text = _REPEATED_SYMBOL_RE.sub(r'\1', text)
+    text = _REPEATED_LETTER_RE.sub(r'\1', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Character n-grams of a normalised comment (the whole text when shorter)"""
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of recent comment clusters per account"""
+
+    KEY_PREFIX = 'ndup'
+
+    def __init__(self, alias: str = 'default', window: Optional[int] = None, threshold: Optional[float] = None,
+                 num_perm: int = 64, bands: int = 16, seed: int = 1):
+        """
+        Args:
+            alias: Django cache alias holding the index
+            window: Seconds a cluster stays matchable after its last match
+                (defaults to settings.COMMENT_DEDUP_WINDOW)
+            threshold: Minimum estimated Jaccard similarity of a match
+                (defaults to settings.COMMENT_DEDUP_THRESHOLD)
+            num_perm: MinHash signature length
+            bands: LSH bands; num_perm / bands rows each
+            seed: Seed of the hash permutations (must match across workers)
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.cache = caches[alias]
+        self.window = window if window is not None else getattr(settings, 'COMMENT_DEDUP_WINDOW', 3600)
+        self.threshold = threshold if threshold is not None else getattr(settings, 'COMMENT_DEDUP_THRESHOLD', 0.7)
+        self.bands = bands
+        self.rows = num_perm // bands
+        state = np.random.RandomState(seed)
+        self._a = state.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = state.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a comment"""
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode('utf-8')) % _MERSENNE_PRIME for shingle in shingles(normalize_comment(text))),
+            dtype=np.uint64,
+        )
+        # (a * x + b) mod p per permutation; a, x < 2**31 keeps the product within uint64
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, account_id, signature: np.ndarray) -> list:
+        return [
+            f"{self.KEY_PREFIX}:{account_id}:b{band}:"
+            + hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()
+            for band in range(self.bands)
+        ]
+
+    def _cluster_key(self, account_id, cluster_id: str) -> str:
+        return f"{self.KEY_PREFIX}:{account_id}:c:{cluster_id}"
+
+    def match(self, account_id, text: str, signature: Optional[np.ndarray] = None) -> Optional[dict]:
+        """
+        Find the recent cluster a comment belongs to
+
+        A match refreshes the cluster's expiry and counts the comment in it.
+
+        Args:
+            account_id: Account the comment was posted to (clusters never cross accounts)
+            text: Comment text
+            signature: Precomputed signature(text)
+
+        Returns:
+            dict or None: cluster_id, sentiment, reply, size and similarity on a match
+        """
+        signature = self.signature(text) if signature is None else signature
+        band_keys = self._band_keys(account_id, signature)
+        try:
+            candidates = set(self.cache.get_many(band_keys).values())
+            if not candidates:
+                return None
+            clusters = self.cache.get_many([self._cluster_key(account_id, c) for c in candidates])
+        except Exception as e:
+            # An index outage only costs the LLM call it would have saved
+            logger.warning('Near-duplicate index read failed: %s', e)
+            return None
+
+        best, similarity = None, 0.0
+        for cluster in clusters.values():
+            estimate = float(np.mean(np.asarray(cluster['signature'], dtype=np.uint64) == signature))
+            if estimate > similarity:
+                best, similarity = cluster, estimate
+        if best is None or similarity < self.threshold:
+            return None
+
+        best['size'] += 1
+        try:
+            self.cache.set(self._cluster_key(account_id, best['cluster_id']), best, timeout=self.window)
+            # Point this comment's bands at the cluster too: later variants of it match directly
+            self.cache.set_many({key: best['cluster_id'] for key in band_keys}, timeout=self.window)
+        except Exception as e:
+            logger.warning('Near-duplicate index write failed: %s', e)
+        return {
+            'cluster_id': best['cluster_id'],
+            'sentiment': best['sentiment'],
+            'reply': best['reply'],
+            'size': best['size'],
+            'similarity': round(similarity, 4),
+        }
+
+    def add(self, account_id, text: str, sentiment: dict, reply: Optional[str],
+            signature: Optional[np.ndarray] = None) -> Optional[str]:
+        """
+        Start a cluster from a comment whose sentiment and reply were just generated
+
+        Returns:
+            str or None: New cluster id (None when the index is unavailable)
+        """
+        signature = self.signature(text) if signature is None else signature
+        cluster_id = uuid.uuid4().hex[:16]
+        cluster = {
+            'cluster_id': cluster_id,
+            'signature': signature.tolist(),
+            'sentiment': {'label': sentiment.get('label'), 'confidence': sentiment.get('confidence')},
+            'reply': reply,
+            'size': 1,
+        }
+        try:
+            self.cache.set(self._cluster_key(account_id, cluster_id), cluster, timeout=self.window)
+            self.cache.set_many({key: cluster_id for key in self._band_keys(account_id, signature)},
+                                timeout=self.window)
+        except Exception as e:
+            logger.warning('Near-duplicate index write failed: %s', e)
+            return None
+        return cluster_id
@@ -0,0 +1,175 @@
+"""
+Sentiment and reply-generation evaluation harness
+
+Runs any SentimentAnalyzerInterface or ResponseGeneratorInterface over a
+labelled corpus of Instagram comments (core/data/instagram_comments_eval.jsonl,
+one {"text", "label"} object per line) and reports throughput, latency,
+per-label accuracy and, for LLM-backed implementations, tokens and cost per
+1k comments. Used by `manage.py bench_sentiment`.
+"""
+import json
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+from core.sentiment import LABELS
+from shared.interfaces import ResponseGeneratorInterface, SentimentAnalyzerInterface
+from shared.stats import percentile
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / 'data' / 'instagram_comments_eval.jsonl'
+
+
+def load_corpus(path=None, limit: Optional[int] = None) -> list:
+    """
+    Read a labelled comment corpus
+
+    Args:
+        path: JSONL file of {"text", "label"} objects (defaults to the bundled corpus)
+        limit: Keep the first `limit` comments
+
+    Returns:
+        list: Comment dicts
+
+    Raises:
+        ValueError: On an unknown label or when no comments are left
+    """
+    with open(path or DEFAULT_CORPUS, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    for row in corpus:
+        if row.get('label') not in LABELS:
+            raise ValueError(f"Unknown label {row.get('label')!r} for comment {row.get('text')!r}")
+    corpus = corpus[:limit] if limit is not None else corpus
+    if not corpus:
+        raise ValueError(f"No comments in corpus {path or DEFAULT_CORPUS}")
+    return corpus
+
+
+class MeteredClient:
+    """
+    Wrap an OpenAI client and count chat completions and their token usage
+
+    Pass it as the `client` of an LLM analyzer or generator to measure what a
+    run would cost.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        completion = self._client.chat.completions.create(**kwargs)
+        usage = getattr(completion, 'usage', None)
+        with self._lock:
+            self.calls += 1
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+                self.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+        return completion
+
+    def usage(self, comments: int, price_per_million: float) -> dict:
+        """Requests, tokens and cost, in total and per 1k comments"""
+        tokens = self.prompt_tokens + self.completion_tokens
+        per_1k = 1000 / comments if comments else 0.0
+        return {
+            'requests': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_per_1k_comments': round(tokens * per_1k, 1),
+            'cost_per_1k_comments_usd': round(tokens / 1_000_000 * price_per_million * per_1k, 6),
+        }
+
+
+def _timings(latencies_ms: list, elapsed: float, comments: int) -> dict:
+    return {
+        'comments': comments,
+        'elapsed_s': round(elapsed, 4),
+        'comments_per_s': round(comments / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+    }
+
+
+def evaluate_analyzer(analyzer: SentimentAnalyzerInterface, corpus: list, batch_size: int = 20) -> dict:
+    """
+    Classify the corpus and score it against its labels
+
+    Comments are sent `batch_size` at a time through batch_analyze() (one
+    analyze() call each when batch_size is 1); every comment of a batch is
+    charged the batch's latency.
+
+    Returns:
+        dict: comments, elapsed_s, comments_per_s, p50_ms, p99_ms, accuracy,
+            per_label {support, accuracy, precision} and analyzers (results per
+            analyzer that answered, e.g. lexicon vs llm)
+    """
+    texts = [row['text'] for row in corpus]
+    predictions, latencies = [], []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        chunk = texts[start:start + batch_size]
+        chunk_started = time.perf_counter()
+        if batch_size == 1:
+            results = [analyzer.analyze(chunk[0])]
+        else:
+            results = analyzer.batch_analyze(chunk)
+        latencies.extend([(time.perf_counter() - chunk_started) * 1000] * len(chunk))
+        predictions.extend(results)
+    elapsed = time.perf_counter() - started
+
+    expected = [row['label'] for row in corpus]
+    predicted = [result.get('label') for result in predictions]
+    per_label = {}
+    for label in LABELS:
+        support = sum(1 for e in expected if e == label)
+        predicted_count = sum(1 for p in predicted if p == label)
+        correct = sum(1 for e, p in zip(expected, predicted) if e == p == label)
+        per_label[label] = {
+            'support': support,
+            'accuracy': round(correct / support, 4) if support else None,
+            'precision': round(correct / predicted_count, 4) if predicted_count else None,
+        }
+
+    report = _timings(latencies, elapsed, len(texts))
+    report.update({
+        'accuracy': round(sum(1 for e, p in zip(expected, predicted) if e == p) / len(texts), 4) if texts else None,
+        'per_label': per_label,
+        'analyzers': dict(Counter(result.get('analyzer', 'unknown') for result in predictions)),
+    })
+    return report
+
+
+def evaluate_generator(generator: ResponseGeneratorInterface, corpus: list, platform: str = 'instagram') -> dict:
+    """
+    Generate a reply per comment (from its reference label) and check the replies
+
+    Returns:
+        dict: comments, elapsed_s, comments_per_s, p50_ms, p99_ms, plus
+            hate_left_unanswered (share of hate comments with an empty reply),
+            answered (share of other comments with a reply) and mean_reply_chars
+    """
+    latencies, replies = [], []
+    started = time.perf_counter()
+    for row in corpus:
+        call_started = time.perf_counter()
+        reply = generator.generate({'label': row['label'], 'confidence': 1.0}, platform, row['text'])
+        latencies.append((time.perf_counter() - call_started) * 1000)
+        replies.append((reply or '').strip())
+    elapsed = time.perf_counter() - started
+
+    hate = [reply for row, reply in zip(corpus, replies) if row['label'] == 'hate']
+    other = [reply for row, reply in zip(corpus, replies) if row['label'] != 'hate']
+    answered = [reply for reply in replies if reply]
+    report = _timings(latencies, elapsed, len(corpus))
+    report.update({
+        'hate_left_unanswered': round(sum(1 for r in hate if not r) / len(hate), 4) if hate else None,
+        'answered': round(sum(1 for r in other if r) / len(other), 4) if other else None,
+        'mean_reply_chars': round(sum(len(r) for r in answered) / len(answered), 1) if answered else 0.0,
+    })
+    return report
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api_hosted.services import MODEL_PRICING
+from core.evaluation import MeteredClient, evaluate_analyzer, evaluate_generator, load_corpus
+from core.replies import LLMResponseGenerator
+from core.sentiment import EscalatingSentimentAnalyzer, LexiconSentimentAnalyzer, LLMBatchSentimentAnalyzer
+from shared.openai_client import openai_clients
+
+ANALYZERS = ('lexicon', 'escalating', 'llm')
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """
+    chat.completions stub for LLM analyzers and generators
+
+    JSON-mode requests (sentiment batches) are labelled with the lexicon, other
+    requests get a canned reply (empty for hate). Latency, not the answers,
+    is what the stub is for: judge LLM accuracy with --base-url.
+    """
+    protocol_version = 'HTTP/1.1'
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+    latency = 0.3
+    lexicon = LexiconSentimentAnalyzer()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        request = json.loads(body or b'{}')
+        user_message = request['messages'][-1]['content']
+        if (request.get('response_format') or {}).get('type') == 'json_object':
+            comments = json.loads(user_message)['comments']
+            labels = self.lexicon.batch_analyze([c['text'] for c in comments])
+            content = json.dumps({'results': [
+                {'i': c['i'], 'label': result['label'], 'confidence': result['confidence']}
+                for c, result in zip(comments, labels)
+            ]})
+        else:
+            content = '' if 'Sentiment: hate' in user_message else 'Thanks so much for your comment! 💕'
+        time.sleep(StubChatHandler.latency)
+        payload = json.dumps({
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': request.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            # ~4 characters per token, like the proxy's fallback estimate
+            'usage': {
+                'prompt_tokens': len(body) // 4,
+                'completion_tokens': len(content) // 4 + 1,
+                'total_tokens': len(body) // 4 + len(content) // 4 + 1,
+            },
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmark and evaluate sentiment analyzers (and optionally the reply generator) on a labelled '
+            'comment corpus: comments/s, p50/p99 latency, accuracy per label and cost per 1k comments')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyzer', nargs='+', choices=ANALYZERS, default=['lexicon', 'escalating'],
+                            help='Analyzers to run')
+        parser.add_argument('--replies', action='store_true', help='Also run the LLM reply generator')
+        parser.add_argument('--batch-size', type=int, default=20, help='Comments per batch_analyze() call')
+        parser.add_argument('--corpus', default=None, help='JSONL corpus of {"text", "label"} (default: bundled)')
+        parser.add_argument('--limit', type=int, default=None, help='Use only the first N comments')
+        parser.add_argument('--model', default=None, help='Chat model (defaults to settings.SENTIMENT_LLM_MODEL)')
+        parser.add_argument('--base-url', default=None,
+                            help='OpenAI-compatible base URL; a local stub is started when omitted')
+        parser.add_argument('--upstream-ms', type=float, default=300.0, help='Stub completion latency')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            corpus = load_corpus(options['corpus'], options['limit'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        model = options['model'] or getattr(settings, 'SENTIMENT_LLM_MODEL', None) or 'gpt-4o-mini'
+        price = MODEL_PRICING.get(model, 0.15)
+        needs_llm = options['replies'] or any(name != 'lexicon' for name in options['analyzer'])
+
+        server = None
+        base_url = options['base_url']
+        if needs_llm and not base_url:
+            StubChatHandler.latency = options['upstream_ms'] / 1000.0
+            server = ThreadingHTTPServer(('127.0.0.1', 0), StubChatHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        previous_base_url = os.environ.get('OPENAI_BASE_URL')
+        if base_url:
+            os.environ['OPENAI_BASE_URL'] = base_url
+        report = {
+            'corpus': str(options['corpus'] or 'bundled'),
+            'model': model,
+            'upstream': 'stub' if server is not None else base_url,
+            'batch_size': options['batch_size'],
+            'analyzers': {},
+        }
+        try:
+            openai_clients.reset()
+            api_key = getattr(settings, 'OPENAI_API_KEY', None) or 'bench-key'
+            for name in options['analyzer']:
+                meter = MeteredClient(openai_clients.get(api_key)) if name != 'lexicon' else None
+                result = evaluate_analyzer(self._analyzer(name, meter, model, options), corpus, options['batch_size'])
+                if meter is not None:
+                    result.update(meter.usage(len(corpus), price))
+                else:
+                    result.update({'requests': 0, 'cost_per_1k_comments_usd': 0.0})
+                report['analyzers'][name] = result
+            if options['replies']:
+                meter = MeteredClient(openai_clients.get(api_key))
+                result = evaluate_generator(LLMResponseGenerator(client=meter, model=model), corpus)
+                result.update(meter.usage(len(corpus), price))
+                report['replies'] = result
+        finally:
+            openai_clients.reset()
+            if previous_base_url is None:
+                os.environ.pop('OPENAI_BASE_URL', None)
+            else:
+                os.environ['OPENAI_BASE_URL'] = previous_base_url
+            if server is not None:
+                server.shutdown()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{len(corpus)} comments, model {model}, upstream {report['upstream'] or '-'}")
+        for name, result in report['analyzers'].items():
+            self.stdout.write(
+                f"{name:>12}: {result['comments_per_s']} comments/s  p50 {result['p50_ms']}ms  "
+                f"p99 {result['p99_ms']}ms  accuracy {result['accuracy']:.2%}  "
+                f"${result['cost_per_1k_comments_usd']}/1k  ({result['requests']} requests)"
+            )
+            for label, scores in result['per_label'].items():
+                accuracy = '-' if scores['accuracy'] is None else f"{scores['accuracy']:.2%}"
+                self.stdout.write(f"{'':>14}{label:<16} n={scores['support']:<4} accuracy {accuracy}")
+        if 'replies' in report:
+            result = report['replies']
+            self.stdout.write(
+                f"{'replies':>12}: {result['comments_per_s']} comments/s  p50 {result['p50_ms']}ms  "
+                f"p99 {result['p99_ms']}ms  answered {result['answered']:.2%}  "
+                f"hate unanswered {result['hate_left_unanswered']:.2%}  ${result['cost_per_1k_comments_usd']}/1k"
+            )
+
+    @staticmethod
+    def _analyzer(name, meter, model, options):
+        if name == 'lexicon':
+            return LexiconSentimentAnalyzer()
+        llm = LLMBatchSentimentAnalyzer(client=meter, model=model, batch_size=options['batch_size'])
+        if name == 'llm':
+            return llm
+        return EscalatingSentimentAnalyzer(fallback=llm)
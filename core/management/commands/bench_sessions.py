@@ -0,0 +1,126 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from shared.stats import percentile
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached': 'core.sessions',
+}
+HOST = 'reviewsocial.testserver'
+
+
+class SessionWriteCounter:
+    """execute_wrapper counting queries and INSERT/UPDATEs of django_session"""
+
+    def __init__(self):
+        self.queries = 0
+        self.session_writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        statement = sql.lstrip().upper()
+        if statement.startswith(('INSERT', 'UPDATE')) and 'DJANGO_SESSION' in statement:
+            self.session_writes += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Dashboard requests/s with database sessions saved on every request vs the cache-first '
+            'core.sessions engine, counting django_session writes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', nargs='+', choices=sorted(ENGINES), default=['db', 'cached'],
+                            help='Session engines to compare')
+        parser.add_argument('--requests', type=int, default=500, help='Dashboard requests per engine')
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel logged-in users')
+        parser.add_argument('--path', default='/dashboard/', help='Page to request')
+        parser.add_argument('--refresh-threshold', type=float, default=0.1,
+                            help='SESSION_REFRESH_THRESHOLD for the cached engine')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        run_id = f"bench_sessions_{int(time.time() * 1000)}"
+        users = [
+            User.objects.create_user(username=f"{run_id}_{i}", email=f"{run_id}_{i}@bench.invalid")
+            for i in range(max(1, options['concurrency']))
+        ]
+        report = {'path': options['path'], 'requests': options['requests'], 'concurrency': len(users), 'engines': {}}
+        try:
+            for name in options['engine']:
+                with override_settings(SESSION_ENGINE=ENGINES[name], SESSION_SAVE_EVERY_REQUEST=True,
+                                       SESSION_COOKIE_SECURE=False, ALLOWED_HOSTS=[HOST],
+                                       SESSION_REFRESH_THRESHOLD=options['refresh_threshold']):
+                    report['engines'][name] = self._run(users, options)
+        finally:
+            # _run() deletes its sessions
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"GET {report['path']}: {report['requests']} requests, {report['concurrency']} users")
+        for name, result in report['engines'].items():
+            self.stdout.write(
+                f"{name:>7}: {result['requests_per_s']} req/s  p50 {result['p50_ms']}ms  p99 {result['p99_ms']}ms  "
+                f"session writes {result['session_writes']}  queries/request {result['queries_per_request']}  "
+                f"statuses {result['statuses']}"
+            )
+
+    def _run(self, users, options):
+        caches['default'].clear()
+        clients = []
+        for user in users:
+            client = Client(HTTP_HOST=HOST)
+            client.force_login(user)
+            client.get(options['path'])  # warm up: templates, cache entry
+            clients.append(client)
+
+        per_client = [options['requests'] // len(clients)] * len(clients)
+        for i in range(options['requests'] % len(clients)):
+            per_client[i] += 1
+
+        def run(args):
+            client, count = args
+            counter = SessionWriteCounter()
+            latencies, statuses = [], {}
+            try:
+                with connection.execute_wrapper(counter):
+                    for _ in range(count):
+                        started = time.perf_counter()
+                        status = client.get(options['path']).status_code
+                        latencies.append((time.perf_counter() - started) * 1000)
+                        statuses[status] = statuses.get(status, 0) + 1
+            finally:
+                connection.close()
+            return counter, latencies, statuses
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            results = list(pool.map(run, zip(clients, per_client)))
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for _, thread_latencies, _ in results for latency in thread_latencies]
+        statuses = {}
+        for _, _, thread_statuses in results:
+            for status, count in thread_statuses.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+        Session.objects.filter(session_key__in=[client.session.session_key for client in clients]).delete()
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'requests_per_s': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'session_writes': sum(counter.session_writes for counter, _, _ in results),
+            'queries_per_request': round(sum(counter.queries for counter, _, _ in results) / len(latencies), 2)
+            if latencies else None,
+            'statuses': statuses,
+        }
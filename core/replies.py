@@ -0,0 +1,130 @@
+"""
+Comment reply generation
+
+LLMResponseGenerator drafts a brand reply per comment from the COMMENT_REPLY
+prompt template (shared/prompts.py): instructions, brand voice and examples
+form a static system prefix the provider caches across requests, and only
+the final user message (sentiment and comment) changes per call.
+
+CommentReplyService adds sentiment analysis in front and a near-duplicate
+index (core/dedup.py) around both: comments from a spam wave or giveaway
+reuse the label and reply of their cluster instead of new LLM calls.
+"""
+from typing import Optional
+
+from django.conf import settings
+
+from core.dedup import NearDuplicateIndex
+from core.sentiment import get_sentiment_analyzer
+from shared.exceptions import ProvokelyException
+from shared.interfaces import ResponseGeneratorInterface, SentimentAnalyzerInterface
+from shared.openai_client import get_openai_client
+from shared.prompts import COMMENT_REPLY, PromptTemplate, get_template
+
+
+def reply_content(sentiment: dict, platform: str, comment_text: Optional[str]) -> str:
+    """Variable part of a reply request, in the same shape as the template's examples"""
+    label = (sentiment or {}).get('label', 'neutral')
+    content = f"Sentiment: {label}\nComment: {comment_text or ''}"
+    if platform and platform != 'instagram':
+        content = f"Platform: {platform}\n{content}"
+    return content
+
+
+class LLMResponseGenerator(ResponseGeneratorInterface):
+    """Generate comment replies with one chat completion per comment"""
+
+    def __init__(self, client=None, model: Optional[str] = None,
+                 template: Optional[PromptTemplate] = None, max_tokens: int = 120):
+        """
+        Args:
+            client: OpenAI client (created from settings.OPENAI_API_KEY when omitted)
+            model: Chat model (defaults to settings.OPENAI_MODEL)
+            template: Prompt template (defaults to comment_reply in settings.REPLY_BRAND_VOICE)
+            max_tokens: Max reply tokens
+        """
+        self._client = client
+        self.model = model or getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini')
+        self.template = template or get_template(COMMENT_REPLY.name)
+        self.max_tokens = max_tokens
+        self.last_usage = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            api_key = getattr(settings, 'OPENAI_API_KEY', None)
+            if not api_key:
+                raise ProvokelyException('OPENAI_API_KEY not configured in settings')
+            self._client = get_openai_client(api_key)
+        return self._client
+
+    def generate(self, sentiment: dict, platform: str, comment_text: str = None) -> str:
+        """Generate a reply; empty for comments that should not be answered"""
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.template.messages(reply_content(sentiment, platform, comment_text)),
+            max_tokens=self.max_tokens,
+        )
+        # usage.prompt_tokens_details.cached_tokens shows whether the prefix was served from cache
+        self.last_usage = completion.usage
+        return (completion.choices[0].message.content or '').strip()
+
+
+class CommentReplyService:
+    """Sentiment and reply per comment, shared by near-duplicate comments of an account"""
+
+    def __init__(self, analyzer: Optional[SentimentAnalyzerInterface] = None,
+                 generator: Optional[ResponseGeneratorInterface] = None,
+                 index: Optional[NearDuplicateIndex] = None):
+        """
+        Args:
+            analyzer: Sentiment analyzer (defaults to get_sentiment_analyzer())
+            generator: Reply generator (defaults to LLMResponseGenerator when OpenAI
+                is configured, else no replies)
+            index: Near-duplicate index (defaults to one per settings.COMMENT_DEDUP_*;
+                None when COMMENT_DEDUP_ENABLED is off)
+        """
+        self.analyzer = analyzer or get_sentiment_analyzer()
+        if generator is None and getattr(settings, 'OPENAI_API_KEY', None):
+            generator = LLMResponseGenerator()
+        self.generator = generator
+        if index is None and getattr(settings, 'COMMENT_DEDUP_ENABLED', True):
+            index = NearDuplicateIndex()
+        self.index = index
+
+    def process(self, account_id, comment_text: str, platform: str = 'instagram') -> dict:
+        """
+        Label a comment and draft its reply
+
+        Args:
+            account_id: Account the comment was posted to
+            comment_text: Comment text
+            platform: Platform name
+
+        Returns:
+            dict: sentiment, ai_response, cluster_id and reused (True when both
+                came from a near-duplicate cluster)
+        """
+        signature = None
+        if self.index is not None:
+            signature = self.index.signature(comment_text)
+            match = self.index.match(account_id, comment_text, signature)
+            if match is not None:
+                return {
+                    'sentiment': dict(match['sentiment'], analyzer='cluster'),
+                    'ai_response': match['reply'],
+                    'cluster_id': match['cluster_id'],
+                    'reused': True,
+                }
+
+        sentiment = self.analyzer.analyze(comment_text)
+        reply = self.generator.generate(sentiment, platform, comment_text) if self.generator is not None else None
+        cluster_id = None
+        if self.index is not None:
+            cluster_id = self.index.add(account_id, comment_text, sentiment, reply, signature)
+        return {
+            'sentiment': sentiment,
+            'ai_response': reply,
+            'cluster_id': cluster_id,
+            'reused': False,
+        }
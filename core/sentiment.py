@@ -0,0 +1,345 @@
+"""
+Comment sentiment analysis
+
+LexiconSentimentAnalyzer scores comments locally against a token/emoji
+lexicon. LLMBatchSentimentAnalyzer classifies many comments per chat
+completion. EscalatingSentimentAnalyzer puts the lexicon in front of the LLM
+and only forwards the comments the lexicon is not confident about.
+"""
+import json
+import re
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from shared.batching import MicroBatcher
+from shared.exceptions import SentimentAnalysisError
+from shared.openai_client import get_openai_client
+from shared.interfaces import SentimentAnalyzerInterface
+
+
+# Column order doubles as tie-break priority: np.argmax returns the first maximum
+LABELS = ['hate', 'purchase_intent', 'question', 'negative', 'positive', 'neutral']
+
+LEXICON = {
+    'positive': {
+        'love': 2.0, 'loved': 2.0, 'loving': 2.0, 'amazing': 2.0, 'awesome': 2.0, 'beautiful': 2.0,
+        'great': 1.5, 'good': 1.0, 'nice': 1.0, 'best': 1.5, 'perfect': 2.0, 'gorgeous': 2.0,
+        'stunning': 2.0, 'cute': 1.5, 'wow': 1.5, 'obsessed': 1.5, 'fantastic': 2.0, 'excellent': 2.0,
+        'thank': 1.0, 'thanks': 1.0, 'happy': 1.5, 'recommend': 1.5, 'fire': 1.0, 'lit': 1.0,
+        'keep it up': 1.5, 'well done': 1.5,
+        '😍': 2.0, '❤': 2.0, '🥰': 2.0, '🔥': 1.5, '👏': 1.5, '😊': 1.5, '💯': 1.5, '🙌': 1.5,
+        '👍': 1.0, '✨': 1.0, '💕': 1.5, '😁': 1.0, '🤩': 2.0, '💖': 1.5, '😘': 1.5,
+    },
+    'negative': {
+        'bad': 1.5, 'terrible': 2.0, 'awful': 2.0, 'worst': 2.0, 'poor': 1.5, 'disappointed': 2.0,
+        'disappointing': 2.0, 'broken': 1.5, 'refund': 1.5, 'never again': 2.0, 'waste': 1.5,
+        'scam': 2.0, 'fake': 1.5, 'late': 1.0, 'slow': 1.0, 'forever': 0.5, 'rude': 1.5,
+        'cheap': 1.0, 'overpriced': 1.5, 'meh': 1.0, 'boring': 1.5, 'hate': 1.5, 'sucks': 2.0,
+        'not worth': 2.0, 'complaint': 1.5, 'damaged': 1.5, 'missing': 1.0,
+        '😡': 2.0, '😠': 2.0, '👎': 2.0, '😞': 1.5, '😢': 1.0, '💩': 1.5, '🤮': 2.0, '😒': 1.5,
+    },
+    'hate': {
+        'idiot': 3.0, 'stupid': 2.5, 'moron': 3.0, 'loser': 3.0, 'pathetic': 2.5, 'trash': 2.0,
+        'garbage': 2.0, 'disgusting': 2.0, 'ugly': 2.0, 'shut up': 2.5, 'kill yourself': 4.0,
+        'kys': 4.0, 'die': 2.5, 'hate you': 3.5, 'dumb': 2.0, 'clown': 2.0,
+        '🖕': 4.0, '🤬': 3.0,
+    },
+    'question': {
+        '?': 1.5, 'how': 1.0, 'what': 1.0, 'when': 1.0, 'where': 1.0, 'why': 1.0, 'which': 1.0,
+        'does': 0.5, 'can you': 1.0, 'do you': 1.0, 'is it': 1.0, 'anyone': 0.5,
+    },
+    'purchase_intent': {
+        'price': 2.5, 'cost': 2.0, 'how much': 2.5, 'buy': 2.0, 'order': 1.5, 'link': 1.5,
+        'shop': 1.0, 'available': 1.5, 'in stock': 2.0, 'ship': 1.5, 'sizes': 1.5,
+        'size': 1.0, 'want one': 2.5, 'need this': 2.0, 'dm me': 1.0, 'purchase': 2.5, 'discount': 1.5,
+        'code': 1.0, '💰': 1.5, '🛒': 2.0, '💸': 1.5,
+    },
+}
+
+NEGATORS = {'not', 'no', 'never', "don't", 'dont', "isn't", 'isnt', "wasn't", 'wasnt', "can't", 'cant'}
+
+# Emoji variation selectors, zero-width joiners and skin tone modifiers carry no sentiment
+_STRIP_RE = re.compile('[\ufe0e\ufe0f\u200d\U0001F3FB-\U0001F3FF]')
+_TOKEN_RE = re.compile(r"[a-z0-9']+|[^\w\s]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word, emoji and punctuation tokens"""
+    return _TOKEN_RE.findall(_STRIP_RE.sub('', (text or '').lower()))
+
+
+class LexiconSentimentAnalyzer(SentimentAnalyzerInterface):
+    """
+    Local token/emoji lexicon scorer
+
+    Each batch is turned into term-count matrices (one for plain terms, one for
+    terms following a negator) and scored with a single matrix product against
+    the label weight matrix. Label probabilities are the label scores
+    normalised against a constant neutral prior; confidence is the winning
+    probability. Comments with no lexicon hits are neutral, with confidence
+    falling off once they are longer than `short_comment_tokens`.
+    """
+
+    def __init__(self, neutral_prior: float = 1.0, short_comment_tokens: int = 4):
+        """
+        Args:
+            neutral_prior: Score given to `neutral`; higher values demand more evidence per label
+            short_comment_tokens: Token count up to which an unmatched comment is confidently neutral
+        """
+        self.neutral_prior = neutral_prior
+        self.short_comment_tokens = short_comment_tokens
+        terms = sorted({term for weights in LEXICON.values() for term in weights})
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        self.weights = np.zeros((len(terms), len(LABELS)), dtype=np.float32)
+        for label, weights in LEXICON.items():
+            column = LABELS.index(label)
+            for term, weight in weights.items():
+                self.weights[self.vocabulary[term], column] = weight
+        # Negated terms count towards the opposite polarity ("not good" -> negative)
+        self.negated_weights = self.weights.copy()
+        pos, neg = LABELS.index('positive'), LABELS.index('negative')
+        self.negated_weights[:, [pos, neg]] = self.weights[:, [neg, pos]]
+
+    def _featurize(self, texts: list):
+        counts = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        negated = np.zeros_like(counts)
+        lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for position, term in enumerate(tokens + bigrams):
+                column = self.vocabulary.get(term)
+                if column is None:
+                    continue
+                start = position if position < len(tokens) else position - len(tokens)
+                window = tokens[max(0, start - 2):start]
+                if any(t in NEGATORS for t in window):
+                    negated[row, column] += 1
+                else:
+                    counts[row, column] += 1
+        return counts, negated, lengths
+
+    def score(self, texts: list) -> tuple:
+        """
+        Score a batch of texts
+
+        Args:
+            texts: Comment texts
+
+        Returns:
+            tuple: (len(texts), len(LABELS)) matrix of label probabilities and per-text token counts
+        """
+        counts, negated, lengths = self._featurize(texts)
+        raw = counts @ self.weights + negated @ self.negated_weights
+        # A question about buying ("price?", "how much?") is purchase intent, not a competing label
+        purchase, question = LABELS.index('purchase_intent'), LABELS.index('question')
+        buying = raw[:, purchase] > 0
+        raw[buying, purchase] += raw[buying, question]
+        raw[buying, question] = 0
+        raw[:, LABELS.index('neutral')] = self.neutral_prior
+        return raw / raw.sum(axis=1, keepdims=True), lengths
+
+    def batch_analyze(self, texts: list) -> list:
+        """Analyze sentiment for multiple texts in one vectorised pass"""
+        if not texts:
+            return []
+        probabilities, lengths = self.score(texts)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(texts)), best]
+        # No evidence at all: short comments ("ok", "👀") are neutral, long ones are just unknown
+        unmatched = probabilities[:, LABELS.index('neutral')] >= 1.0
+        confidence = np.where(
+            unmatched,
+            np.minimum(1.0, self.short_comment_tokens / np.maximum(lengths, 1)),
+            confidence,
+        )
+        results = []
+        for row in range(len(texts)):
+            results.append({
+                'label': LABELS[best[row]],
+                'confidence': round(float(confidence[row]), 4),
+                'scores': {label: round(float(p), 4) for label, p in zip(LABELS, probabilities[row])},
+                'analyzer': 'lexicon',
+            })
+        return results
+
+    def analyze(self, text: str) -> dict:
+        """Analyze sentiment of text"""
+        return self.batch_analyze([text])[0]
+
+
+class EscalatingSentimentAnalyzer(SentimentAnalyzerInterface):
+    """
+    Local-first analyzer that escalates only low-confidence comments
+
+    Comments the lexicon labels with confidence at or above `threshold` are
+    answered locally; the rest are sent to `fallback` in one batch.
+    """
+
+    def __init__(self, fallback: Optional[SentimentAnalyzerInterface] = None,
+                 threshold: Optional[float] = None, local: Optional[SentimentAnalyzerInterface] = None):
+        """
+        Args:
+            fallback: Analyzer for low-confidence comments (e.g. an LLM); None keeps everything local
+            threshold: Minimum local confidence (defaults to settings.SENTIMENT_ESCALATION_THRESHOLD)
+            local: Local analyzer (defaults to LexiconSentimentAnalyzer)
+        """
+        self.fallback = fallback
+        self.threshold = threshold if threshold is not None else getattr(settings, 'SENTIMENT_ESCALATION_THRESHOLD', 0.6)
+        self.local = local or LexiconSentimentAnalyzer()
+
+    def batch_analyze(self, texts: list) -> list:
+        """Analyze locally, then re-analyze low-confidence comments with the fallback"""
+        results = self.local.batch_analyze(texts)
+        if self.fallback is None:
+            return results
+        escalate = [i for i, r in enumerate(results) if r['confidence'] < self.threshold]
+        if not escalate:
+            return results
+        escalated = self.fallback.batch_analyze([texts[i] for i in escalate])
+        for i, result in zip(escalate, escalated):
+            results[i] = result
+        return results
+
+    def analyze(self, text: str) -> dict:
+        """Analyze sentiment of text"""
+        return self.batch_analyze([text])[0]
+
+
+class LLMBatchSentimentAnalyzer(SentimentAnalyzerInterface):
+    """
+    Classify up to `batch_size` comments in one JSON-mode chat completion
+
+    Comments are sent with their batch index and labels are mapped back by
+    that index. If the reply is missing or mangles some items, or the request
+    is rejected for its content, only the affected items are retried,
+    splitting the batch in half until single comments fail on their own.
+    Outages, auth and rate-limit errors are not item-specific: the batch falls
+    back to the lexicon instead of multiplying failing calls.
+
+    Single `analyze()` calls from concurrent callers are coalesced by a
+    MicroBatcher, adding at most `max_wait_ms` of latency.
+    """
+
+    SYSTEM_PROMPT = (
+        "You classify Instagram comments for a brand. For every comment return one label from: "
+        + ", ".join(LABELS) + ". Use purchase_intent for questions about price, availability or buying. "
+        'Reply with JSON only: {"results": [{"i": <index>, "label": "<label>", "confidence": <0-1>}]}'
+    )
+
+    def __init__(self, client=None, model: Optional[str] = None,
+                 batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None):
+        """
+        Args:
+            client: OpenAI client (created from settings.OPENAI_API_KEY when omitted)
+            model: Chat model (defaults to settings.SENTIMENT_LLM_MODEL)
+            batch_size: Max comments per request (defaults to settings.SENTIMENT_LLM_BATCH_SIZE)
+            max_wait_ms: Max time a single analyze() call waits for a batch to fill
+                (defaults to settings.SENTIMENT_LLM_MAX_WAIT_MS)
+        """
+        self._client = client
+        self.model = model or getattr(settings, 'SENTIMENT_LLM_MODEL', None) or getattr(settings, 'OPENAI_MODEL', 'gpt-4o-mini')
+        self.batch_size = batch_size or getattr(settings, 'SENTIMENT_LLM_BATCH_SIZE', 20)
+        if max_wait_ms is None:
+            max_wait_ms = getattr(settings, 'SENTIMENT_LLM_MAX_WAIT_MS', 50)
+        self.batcher = MicroBatcher(self.batch_analyze, max_batch_size=self.batch_size, max_wait_ms=max_wait_ms)
+        self._lexicon = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            api_key = getattr(settings, 'OPENAI_API_KEY', None)
+            if not api_key:
+                raise SentimentAnalysisError('OPENAI_API_KEY not configured in settings')
+            try:
+                self._client = get_openai_client(api_key)
+            except ImportError:
+                raise SentimentAnalysisError('openai package not installed')
+        return self._client
+
+    def _request(self, texts: list) -> dict:
+        """One chat completion for a batch; returns {index: result} for the items it labelled"""
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(
+                    {'comments': [{'i': i, 'text': text} for i, text in enumerate(texts)]},
+                    ensure_ascii=False,
+                )},
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=20 + 25 * len(texts),
+        )
+        content = json.loads(completion.choices[0].message.content or '{}')
+        labelled = {}
+        for item in content.get('results', []) if isinstance(content, dict) else []:
+            if not isinstance(item, dict):
+                continue
+            index, label = item.get('i'), item.get('label')
+            if isinstance(index, int) and 0 <= index < len(texts) and label in LABELS:
+                try:
+                    confidence = min(1.0, max(0.0, float(item.get('confidence', 1.0))))
+                except (TypeError, ValueError):
+                    confidence = 1.0
+                labelled[index] = {'label': label, 'confidence': confidence, 'analyzer': 'llm'}
+        return labelled
+
+    @staticmethod
+    def _item_specific(error) -> bool:
+        """Errors a smaller batch can avoid: unparseable replies and requests rejected for their content"""
+        if isinstance(error, ValueError):
+            return True
+        return getattr(error, 'status_code', None) in (400, 422)
+
+    def _lexicon_fallback(self, texts: list, error) -> list:
+        if self._lexicon is None:
+            self._lexicon = LexiconSentimentAnalyzer()
+        return [dict(result, error=str(error)) for result in self._lexicon.batch_analyze(texts)]
+
+    def _classify(self, texts: list) -> list:
+        error = None
+        try:
+            labelled = self._request(texts)
+        except Exception as e:
+            if not self._item_specific(e):
+                return self._lexicon_fallback(texts, e)
+            labelled, error = {}, e
+        missing = [i for i in range(len(texts)) if i not in labelled]
+        if not missing:
+            return [labelled[i] for i in range(len(texts))]
+        if len(texts) == 1:
+            return [{
+                'label': 'neutral',
+                'confidence': 0.0,
+                'analyzer': 'llm',
+                'error': str(error) if error else 'No label returned',
+            }]
+        if len(missing) == len(texts):
+            # Whole batch failed: halve it so one bad comment cannot sink the rest
+            mid = len(texts) // 2
+            return self._classify(texts[:mid]) + self._classify(texts[mid:])
+        retried = self._classify([texts[i] for i in missing])
+        for i, result in zip(missing, retried):
+            labelled[i] = result
+        return [labelled[i] for i in range(len(texts))]
+
+    def batch_analyze(self, texts: list) -> list:
+        """Analyze sentiment for multiple texts, `batch_size` comments per request"""
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            results.extend(self._classify(list(texts[start:start + self.batch_size])))
+        return results
+
+    def analyze(self, text: str) -> dict:
+        """Analyze sentiment of text, sharing a request with concurrent callers"""
+        return self.batcher.submit(text).result()
+
+
+def get_sentiment_analyzer() -> SentimentAnalyzerInterface:
+    """Lexicon-first analyzer, escalating to the batched LLM when OpenAI is configured"""
+    fallback = LLMBatchSentimentAnalyzer() if getattr(settings, 'OPENAI_API_KEY', None) else None
+    return EscalatingSentimentAnalyzer(fallback=fallback)
@@ -0,0 +1,122 @@
+"""
+Cache-first session engine with coalesced expiry refreshes
+
+With the db engine and SESSION_SAVE_EVERY_REQUEST every dashboard request
+rewrote its django_session row just to push expire_date forward, which
+serializes on SQLite. This engine (SESSION_ENGINE = 'core.sessions') reads
+sessions from the SESSION_CACHE_ALIAS cache (Redis when CACHE_REDIS_URL is
+set, local memory otherwise) and falls back to the database on a miss or a
+cache outage. The database row is still written, so sessions survive a
+cache flush, but only when:
+
+    - the session data changed (login, logout, messages, OAuth state), or
+    - more than SESSION_REFRESH_THRESHOLD of its age has elapsed since the
+      expiry was last extended (0.1 of the 24h SESSION_COOKIE_AGE: at most
+      one refresh write per ~2.4h of activity)
+
+Unchanged requests in between cost one cache read and no writes; the
+cookie's max-age is still renewed by SessionMiddleware. Several workers must
+share a cache (Redis): with local memory another worker can serve a stale
+copy of a session changed elsewhere until it expires from its cache, which
+is why settings only default to this engine when CACHE_REDIS_URL is set.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+logger = logging.getLogger('provokely.core')
+
+
+class SessionStore(CachedDBStore):
+    """cached_db store that skips saves of unchanged, recently refreshed sessions"""
+
+    cache_key_prefix = 'provokely.sessions.'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # Epoch seconds the loaded session expires at server side (None: unknown)
+        self._expires_at = None
+
+    def _entry(self, data, expires_at):
+        return {'data': data, 'expires_at': expires_at}
+
+    def _cache_set(self, data, expires_at):
+        try:
+            self._cache.set(self.cache_key, self._entry(data, expires_at), max(1, int(expires_at - time.time())))
+        except Exception as e:
+            logger.warning('Session cache write failed: %s', e)
+
+    def load(self):
+        try:
+            entry = self._cache.get(self.cache_key)
+        except Exception as e:
+            # A cache outage (or a key the backend rejects) falls back to the database
+            logger.warning('Session cache read failed: %s', e)
+            entry = None
+        if entry is not None:
+            self._expires_at = entry['expires_at']
+            return entry['data']
+
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        data = self.decode(s.session_data)
+        self._expires_at = s.expire_date.timestamp()
+        self._cache_set(data, self._expires_at)
+        return data
+
+    async def aload(self):
+        try:
+            entry = await self._cache.aget(await self.acache_key())
+        except Exception as e:
+            logger.warning('Session cache read failed: %s', e)
+            entry = None
+        if entry is not None:
+            self._expires_at = entry['expires_at']
+            return entry['data']
+
+        s = await self._aget_session_from_db()
+        if s is None:
+            return {}
+        data = self.decode(s.session_data)
+        self._expires_at = s.expire_date.timestamp()
+        try:
+            await self._cache.aset(await self.acache_key(), self._entry(data, self._expires_at),
+                                   max(1, int(self._expires_at - time.time())))
+        except Exception as e:
+            logger.warning('Session cache write failed: %s', e)
+        return data
+
+    def refresh_due(self) -> bool:
+        """True when more than SESSION_REFRESH_THRESHOLD of the session age has elapsed since the last extension"""
+        if self._expires_at is None:
+            return True
+        age = self.get_expiry_age()
+        elapsed = age - (self._expires_at - time.time())
+        return elapsed > age * getattr(settings, 'SESSION_REFRESH_THRESHOLD', 0.1)
+
+    def save(self, must_create=False):
+        if not must_create and not self.modified:
+            # Loads the session (and its expiry) if this request never read it
+            self._get_session()
+            if self.session_key is not None and not self.refresh_due():
+                return
+        # DBStore.save(), not cached_db's: the cache entry carries the expiry
+        super(CachedDBStore, self).save(must_create)
+        self._expires_at = self.get_expiry_date().timestamp()
+        self._cache_set(self._session, self._expires_at)
+
+    async def asave(self, must_create=False):
+        if not must_create and not self.modified:
+            await self._aget_session()
+            if self.session_key is not None and not self.refresh_due():
+                return
+        await super(CachedDBStore, self).asave(must_create)
+        self._expires_at = (await self.aget_expiry_date()).timestamp()
+        try:
+            await self._cache.aset(await self.acache_key(), self._entry(self._session, self._expires_at),
+                                   max(1, int(self._expires_at - time.time())))
+        except Exception as e:
+            logger.warning('Session cache write failed: %s', e)
@@ -0,0 +1,24 @@
+"""
+Model signal handlers for core (connected in CoreConfig.ready)
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_token
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Logout / revocation: the token stops authenticating immediately"""
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Deactivation, password or profile changes must not be served from a stale snapshot"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        invalidate_token(key)
@@ -24,6 +24,320 @@ class PublicPagesTests(TestCase):
         self.assertTrue(resp.headers.get('Location', '').startswith('/dashboard/'))
 
 
+class LexiconSentimentAnalyzerTests(TestCase):
+    def setUp(self):
+        from core.sentiment import LexiconSentimentAnalyzer
+        self.analyzer = LexiconSentimentAnalyzer()
+
+    def test_labels(self):
+        cases = {
+            'Love this! 😍': 'positive',
+            'This is terrible quality, never again': 'negative',
+            'you are an idiot': 'hate',
+            'price?': 'purchase_intent',
+            'Does it come in blue?': 'question',
+            'ok': 'neutral',
+        }
+        results = self.analyzer.batch_analyze(list(cases))
+        self.assertEqual([r['label'] for r in results], list(cases.values()))
+        for result in results:
+            self.assertGreaterEqual(result['confidence'], 0.6)
+
+    def test_negation_flips_polarity(self):
+        self.assertEqual(self.analyzer.analyze('not good')['label'], 'negative')
+
+    def test_mixed_comment_is_low_confidence(self):
+        self.assertLess(self.analyzer.analyze('Love it but shipping was slow')['confidence'], 0.6)
+
+
+class EscalatingSentimentAnalyzerTests(TestCase):
+    def test_only_low_confidence_comments_escalate(self):
+        from core.sentiment import EscalatingSentimentAnalyzer
+        from shared.interfaces import SentimentAnalyzerInterface
+
+        class StubLLM(SentimentAnalyzerInterface):
+            def __init__(self):
+                self.seen = []
+
+            def analyze(self, text):
+                return self.batch_analyze([text])[0]
+
+            def batch_analyze(self, texts):
+                self.seen.extend(texts)
+                return [{'label': 'neutral', 'confidence': 1.0, 'analyzer': 'stub'} for _ in texts]
+
+        stub = StubLLM()
+        analyzer = EscalatingSentimentAnalyzer(fallback=stub, threshold=0.6)
+        results = analyzer.batch_analyze(['Love this! 😍', 'Love it but shipping was slow', 'price?'])
+        self.assertEqual(stub.seen, ['Love it but shipping was slow'])
+        self.assertEqual([r['analyzer'] for r in results], ['lexicon', 'stub', 'lexicon'])
+
+
+class FakeChatClient:
+    """Minimal stand-in for the OpenAI client's chat.completions API"""
+
+    def __init__(self, respond):
+        from types import SimpleNamespace
+        self.respond = respond
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        import json
+        from types import SimpleNamespace
+        comments = json.loads(kwargs['messages'][-1]['content'])['comments']
+        self.calls.append([c['text'] for c in comments])
+        content = json.dumps({'results': self.respond(comments)})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class LLMBatchSentimentAnalyzerTests(TestCase):
+    def test_one_request_per_batch_mapped_by_index(self):
+        from core.sentiment import LLMBatchSentimentAnalyzer
+        client = FakeChatClient(lambda comments: [
+            {'i': c['i'], 'label': 'positive' if 'love' in c['text'] else 'negative'} for c in reversed(comments)
+        ])
+        analyzer = LLMBatchSentimentAnalyzer(client=client, batch_size=3)
+        results = analyzer.batch_analyze(['love', 'bad', 'love it', 'worst'])
+        self.assertEqual([r['label'] for r in results], ['positive', 'negative', 'positive', 'negative'])
+        self.assertEqual(len(client.calls), 2)
+
+    def test_failed_batches_are_split(self):
+        from core.sentiment import LLMBatchSentimentAnalyzer
+
+        class ContentRejected(Exception):
+            status_code = 400
+
+        def respond(comments):
+            if any(c['text'] == 'poison' for c in comments):
+                raise ContentRejected('rejected')
+            return [{'i': c['i'], 'label': 'neutral'} for c in comments if c['text'] != 'skip' or len(comments) == 1]
+
+        analyzer = LLMBatchSentimentAnalyzer(client=FakeChatClient(respond), batch_size=8)
+        results = analyzer.batch_analyze(['a', 'skip', 'b', 'poison', 'c'])
+        self.assertEqual([r['label'] for r in results], ['neutral'] * 5)
+        self.assertEqual([r['confidence'] for r in results], [1.0, 1.0, 1.0, 0.0, 1.0])
+        self.assertIn('error', results[3])
+
+    def test_outage_falls_back_to_the_lexicon_without_splitting(self):
+        from core.sentiment import LLMBatchSentimentAnalyzer
+
+        class Overloaded(Exception):
+            status_code = 503
+
+        def respond(comments):
+            raise Overloaded('overloaded')
+
+        client = FakeChatClient(respond)
+        analyzer = LLMBatchSentimentAnalyzer(client=client, batch_size=8)
+        results = analyzer.batch_analyze(['love it', 'worst ever', 'ok', 'price?'])
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual({r['analyzer'] for r in results}, {'lexicon'})
+        self.assertTrue(all('error' in r for r in results))
+
+    def test_concurrent_analyze_calls_share_a_request(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from core.sentiment import LLMBatchSentimentAnalyzer
+        client = FakeChatClient(lambda comments: [{'i': c['i'], 'label': 'question'} for c in comments])
+        analyzer = LLMBatchSentimentAnalyzer(client=client, batch_size=4, max_wait_ms=1000)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(analyzer.analyze, ['a?', 'b?', 'c?', 'd?']))
+        self.assertEqual([r['label'] for r in results], ['question'] * 4)
+        self.assertEqual(len(client.calls), 1)
+
+
+class NearDuplicateIndexTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from core.dedup import NearDuplicateIndex
+        caches['default'].clear()
+        self.index = NearDuplicateIndex(window=60)
+
+    def add(self, account_id, text, label='positive', reply='Thank you!'):
+        return self.index.add(account_id, text, {'label': label, 'confidence': 0.9}, reply)
+
+    def test_spam_variants_join_the_cluster(self):
+        from core.dedup import normalize_comment
+        self.assertEqual(normalize_comment('@anna @ben.k 🔥🔥🔥'), normalize_comment('@carl 🔥'))
+        cluster_id = self.add('acct_1', '@anna @ben 🔥🔥🔥')
+        for variant in ['@carl 🔥🔥', '@dana @eve @frank 🔥', '@gus 🔥🔥🔥🔥!!']:
+            match = self.index.match('acct_1', variant)
+            self.assertIsNotNone(match, variant)
+            self.assertEqual((match['cluster_id'], match['reply']), (cluster_id, 'Thank you!'))
+        self.assertEqual(self.index.match('acct_1', '@hal 🔥')['size'], 5)
+
+    def test_different_comments_and_accounts_do_not_match(self):
+        self.add('acct_1', 'how much is the blue one??', label='purchase_intent', reply='Link in bio!')
+        self.assertIsNotNone(self.index.match('acct_1', 'how much is the blue one?'))
+        self.assertIsNone(self.index.match('acct_1', 'the blue one arrived broken'))
+        self.assertIsNone(self.index.match('acct_2', 'how much is the blue one??'))
+
+    def test_clusters_expire_after_the_window(self):
+        import time
+        from unittest import mock
+        self.add('acct_1', 'giveaway entry done ✅')
+        later = time.time() + 61
+        with mock.patch('time.time', return_value=later):
+            self.assertIsNone(self.index.match('acct_1', 'giveaway entry done ✅'))
+
+
+class CommentReplyServiceTests(TestCase):
+    def test_near_duplicates_reuse_label_and_reply(self):
+        from django.core.cache import caches
+        from core.dedup import NearDuplicateIndex
+        from core.replies import CommentReplyService
+        from shared.interfaces import ResponseGeneratorInterface
+        caches['default'].clear()
+
+        class StubGenerator(ResponseGeneratorInterface):
+            def __init__(self):
+                self.calls = 0
+
+            def generate(self, sentiment, platform, comment_text=None):
+                self.calls += 1
+                return f"reply {self.calls}"
+
+        generator = StubGenerator()
+        service = CommentReplyService(generator=generator, index=NearDuplicateIndex(window=60))
+        first = service.process('acct_1', 'Love this!! 😍😍')
+        second = service.process('acct_1', 'love this 😍')
+        other = service.process('acct_1', 'when does it ship?')
+        self.assertEqual((first['reused'], second['reused'], other['reused']), (False, True, False))
+        self.assertEqual(second['ai_response'], 'reply 1')
+        self.assertEqual(second['sentiment']['label'], first['sentiment']['label'])
+        self.assertEqual(generator.calls, 2)
+
+
+class SentimentEvaluationTests(TestCase):
+    def test_bundled_corpus_report(self):
+        import json
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('bench_sentiment', '--analyzer', 'lexicon', '--json', stdout=out)
+        report = json.loads(out.getvalue())['analyzers']['lexicon']
+        self.assertEqual(report['comments'], 120)
+        self.assertGreaterEqual(report['accuracy'], 0.85)
+        self.assertEqual({scores['support'] for scores in report['per_label'].values()}, {20})
+        self.assertEqual(report['cost_per_1k_comments_usd'], 0.0)
+
+    def test_llm_usage_is_metered_per_1k_comments(self):
+        from core.evaluation import MeteredClient, evaluate_analyzer
+        from core.sentiment import LLMBatchSentimentAnalyzer
+        client = FakeChatClient(lambda comments: [{'i': c['i'], 'label': 'question'} for c in comments])
+        meter = MeteredClient(client)
+        corpus = [{'text': 'when?', 'label': 'question'}, {'text': 'price?', 'label': 'purchase_intent'}]
+        report = evaluate_analyzer(LLMBatchSentimentAnalyzer(client=meter), corpus, batch_size=2)
+        self.assertEqual((report['accuracy'], meter.calls), (0.5, 1))
+        self.assertEqual(report['per_label']['question'], {'support': 1, 'accuracy': 1.0, 'precision': 0.5})
+
+    def test_empty_corpus_is_rejected(self):
+        import tempfile
+        from core.evaluation import load_corpus
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.write('\n')
+            f.flush()
+            with self.assertRaises(ValueError):
+                load_corpus(f.name)
+
+
+@override_settings(ALLOWED_HOSTS=['reviewsocial.testserver'], TOKEN_AUTH_CACHE_ENABLED=True, TOKEN_AUTH_CACHE_TTL=300)
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import caches
+        from rest_framework.authtoken.models import Token
+        caches['default'].clear()
+        self.user = User.objects.create_user(username='mobile', email='m@example.com', password='pw-123456')
+        self.token = Token.objects.create(user=self.user)
+        self.client = Client(HTTP_HOST='reviewsocial.testserver')
+
+    def authenticate(self):
+        from core.authentication import CachedTokenAuthentication
+        return CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+    def test_cache_hit_needs_no_queries(self):
+        user, token = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.email), (self.user.pk, 'mobile', 'm@example.com'))
+        self.assertTrue(user.is_authenticated)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_me_endpoint_uses_the_cache(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/v1/auth/me', **headers).status_code, 200)
+        with self.assertNumQueries(0):
+            resp = self.client.get('/api/v1/auth/me', **headers)
+        self.assertEqual(resp.json()['data']['username'], 'mobile')
+
+    def test_logout_revokes_the_cached_token(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        self.assertEqual(self.client.get('/api/v1/auth/me', **headers).status_code, 200)
+        self.assertEqual(self.client.post('/api/v1/auth/logout/', **headers).status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/auth/me', **headers).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        from rest_framework.exceptions import AuthenticationFailed
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(TOKEN_AUTH_LOCAL_TTL=5)
+    def test_local_cache_caps_the_ttl(self):
+        from unittest import mock
+        from django.core.cache import caches
+        with mock.patch.object(caches['default'], 'set', wraps=caches['default'].set) as cache_set:
+            self.authenticate()
+        self.assertEqual(cache_set.call_args.kwargs['timeout'], 5)
+
+
+@override_settings(SESSION_ENGINE='core.sessions', SESSION_COOKIE_AGE=1000, SESSION_REFRESH_THRESHOLD=0.1)
+class CachedSessionStoreTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from core.sessions import SessionStore
+        caches['default'].clear()
+        self.store = SessionStore()
+        self.store['cart'] = 'abc'
+        self.store.create()
+
+    def reload(self):
+        from core.sessions import SessionStore
+        store = SessionStore(self.store.session_key)
+        store.load()
+        return store
+
+    def test_unchanged_recent_session_is_not_rewritten(self):
+        with self.assertNumQueries(0):
+            store = self.reload()
+            self.assertEqual(store['cart'], 'abc')
+            store.save()
 
+    def test_refresh_after_threshold_and_on_change(self):
+        import time
+        from django.contrib.sessions.models import Session
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        store = self.reload()
+        # 20% of the age elapsed since the last extension
+        store._cache_set(store._session, time.time() + 800)
+        store = self.reload()
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertEqual(sum(1 for q in queries if q['sql'].startswith('UPDATE "django_session"')), 1)
+        self.assertGreater(self.reload()._expires_at, time.time() + 990)
 
+        store = self.reload()
+        store['cart'] = 'xyz'
+        store.save()
+        self.assertIn('xyz', str(Session.objects.get(session_key=store.session_key).get_decoded()))
 
+    def test_falls_back_to_the_database(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.reload()['cart'], 'abc')
@@ -1,5 +1,6 @@
 # Gunicorn configuration file
 import multiprocessing
+import os
 
 # Server socket
 bind = "127.0.0.1:8000"
@@ -7,9 +8,13 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# Sync workers serve one request at a time. For the async AI proxy run the ASGI app instead:
+#   GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker AI_PROXY_ASYNC=true \
+#   gunicorn config.asgi:application -c gunicorn.conf.py
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
 worker_connections = 1000
-timeout = 30
+# Keep above the worst-case routed OpenAI call (config/settings.py checks this at startup)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
 keepalive = 2
 
 # Restart workers after this many requests, to help prevent memory leaks
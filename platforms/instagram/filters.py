@@ -0,0 +1,19 @@
+import django_filters
+
+from platforms.instagram.models import InstagramWebhook
+
+
+class InstagramWebhookFilter(django_filters.FilterSet):
+    """
+    Filters for the webhook listing
+
+    ?processed=false&event_type=comments&since=2025-01-01T00:00:00Z&until=2025-02-01T00:00:00Z
+    """
+    processed = django_filters.BooleanFilter()
+    event_type = django_filters.CharFilter()
+    since = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = InstagramWebhook
+        fields = ['processed', 'event_type', 'since', 'until']
@@ -0,0 +1,116 @@
+"""
+Synthetic Meta webhook deliveries for load testing the Instagram webhook endpoints
+"""
+import random
+import time
+from typing import Dict, List, Optional
+
+
+SAMPLE_COMMENTS = [
+    "Love this! 😍",
+    "🔥🔥🔥",
+    "How much is this?",
+    "price?",
+    "link?",
+    "Where can I buy it?",
+    "This is terrible quality, never again",
+    "Shipping took forever 😡",
+    "Does it come in blue?",
+    "Amazing work, keep it up!",
+    "meh",
+    "Giveaway! Tag 3 friends 🎁",
+]
+
+
+class WebhookLoadGenerator:
+    """
+    Build realistic Meta webhook delivery bodies
+
+    Each delivery follows the shape Meta posts for Instagram subscriptions:
+    {"object": "instagram", "entry": [{"id": "<ig_ba_id>", "time": ..., "changes": [...]}]}
+    """
+
+    def __init__(self, ig_user_ids: List[str], entries_per_delivery: int = 1,
+                 changes_per_entry: int = 1, duplicate_ratio: float = 0.0,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            ig_user_ids: Instagram business account IDs to draw entries from
+            entries_per_delivery: Number of entries in each delivery body
+            changes_per_entry: Number of changes in each entry
+            duplicate_ratio: Fraction (0-1) of changes that re-send an already emitted comment
+            seed: Optional RNG seed for reproducible runs
+        """
+        if not ig_user_ids:
+            raise ValueError('At least one Instagram account is required')
+        if not 0.0 <= duplicate_ratio <= 1.0:
+            raise ValueError('duplicate_ratio must be between 0 and 1')
+        self.ig_user_ids = list(ig_user_ids)
+        self.entries_per_delivery = max(1, entries_per_delivery)
+        self.changes_per_entry = max(1, changes_per_entry)
+        self.duplicate_ratio = duplicate_ratio
+        self.random = random.Random(seed)
+        self.run_id = f"lg{int(time.time() * 1000)}"
+        self._counter = 0
+        self._emitted: List[Dict] = []
+        self.duplicates_sent = 0
+
+    def _next_comment_id(self) -> str:
+        self._counter += 1
+        return f"{self.run_id}_{self._counter}"
+
+    def build_change(self) -> Dict:
+        """Build one `comments` change, possibly re-sending an earlier comment"""
+        if self._emitted and self.random.random() < self.duplicate_ratio:
+            self.duplicates_sent += 1
+            return self.random.choice(self._emitted)
+        comment_id = self._next_comment_id()
+        change = {
+            'field': 'comments',
+            'value': {
+                'from': {
+                    'id': str(self.random.randint(10**15, 10**16 - 1)),
+                    'username': f"user{self.random.randint(1, 99999)}",
+                },
+                'media': {
+                    'id': f"{self.run_id}_media_{self.random.randint(1, 50)}",
+                    'media_product_type': 'FEED',
+                },
+                'id': comment_id,
+                'text': self.random.choice(SAMPLE_COMMENTS),
+            },
+        }
+        self._emitted.append(change)
+        return change
+
+    @property
+    def unique_comments(self) -> int:
+        """Distinct comment ids emitted so far: the webhook rows a run should store"""
+        return len(self._emitted)
+
+    def build_delivery(self) -> Dict:
+        """Build one delivery body with the configured number of entries and changes"""
+        now = int(time.time())
+        return {
+            'object': 'instagram',
+            'entry': [
+                {
+                    'id': self.random.choice(self.ig_user_ids),
+                    'time': now,
+                    'changes': [self.build_change() for _ in range(self.changes_per_entry)],
+                }
+                for _ in range(self.entries_per_delivery)
+            ],
+        }
+
+    def generate(self, count: int) -> List[Dict]:
+        """
+        Generate a batch of delivery bodies
+
+        Args:
+            count: Number of deliveries
+
+        Returns:
+            list: Delivery bodies ready to be JSON encoded
+        """
+        return [self.build_delivery() for _ in range(count)]
@@ -0,0 +1,51 @@
+import io
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+
+from platforms.instagram.loadgen import WebhookLoadGenerator
+from platforms.instagram.parsers import WebhookJSONParser
+from shared import fast_json
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark webhook body parsing: DRF JSONParser (+ legacy fallback) vs WebhookJSONParser'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=50, help='Entries per delivery')
+        parser.add_argument('--changes', type=int, default=20, help='Changes per entry')
+        parser.add_argument('--number', type=int, default=200, help='Parses per timing run')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing runs (best is reported)')
+
+    def handle(self, *args, **options):
+        generator = WebhookLoadGenerator(
+            [str(900000000000000 + i) for i in range(10)],
+            entries_per_delivery=options['entries'],
+            changes_per_entry=options['changes'],
+            seed=1,
+        )
+        body = json.dumps(generator.build_delivery()).encode('utf-8')
+
+        def drf_json():
+            return JSONParser().parse(io.BytesIO(body), 'application/json', {})
+
+        def legacy_fallback():
+            # Previous view behaviour when request.data did not look like a delivery
+            JSONParser().parse(io.BytesIO(body), 'application/json', {})
+            return json.loads(body.decode('utf-8'))
+
+        def webhook_parser():
+            return WebhookJSONParser().parse(io.BytesIO(body), 'application/json', {})
+
+        self.stdout.write(
+            f"body: {len(body) / 1024:.1f} KiB, {options['entries']} entries x {options['changes']} changes, "
+            f"decoder: {'orjson' if fast_json.orjson else 'stdlib json'}"
+        )
+        baseline = None
+        for name, func in [('drf_json', drf_json), ('legacy_fallback', legacy_fallback), ('webhook_parser', webhook_parser)]:
+            best = min(timeit.repeat(func, number=options['number'], repeat=options['repeat']))
+            per_call_us = best / options['number'] * 1_000_000
+            baseline = baseline or per_call_us
+            self.stdout.write(f"{name:>16}: {per_call_us:10.1f} us/parse  ({baseline / per_call_us:.2f}x)")
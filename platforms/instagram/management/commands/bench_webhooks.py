@@ -0,0 +1,149 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from platforms.instagram.loadgen import WebhookLoadGenerator
+from platforms.instagram.models import InstagramAccount, InstagramWebhook
+from shared.stats import percentile
+
+
+ENDPOINT_PATHS = {
+    'receive': '/api/v1/instagram/webhooks/receive/',
+    'verify': '/api/v1/instagram/webhooks/verify/',
+}
+
+
+class Command(BaseCommand):
+    help = 'Replay synthetic Meta webhook deliveries and report ack latency, rows/s and queries per delivery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', type=int, default=200, help='Number of deliveries to send')
+        parser.add_argument('--entries', type=int, default=1, help='Entries per delivery')
+        parser.add_argument('--changes', type=int, default=5, help='Changes per entry')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='Fraction of changes re-sending an earlier comment')
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of concurrent senders')
+        parser.add_argument('--endpoint', choices=['receive', 'verify', 'handshake'], default='receive',
+                            help='POST deliveries to receive/ or verify/, or benchmark the GET verify handshake')
+        parser.add_argument('--fixture', default=None, help='Fixture to load accounts from (e.g. webhook_loadgen_accounts)')
+        parser.add_argument('--accounts', type=int, default=0, help='Limit the number of accounts drawn (0 = all active)')
+        parser.add_argument('--url', default=None, help='Base URL of a running server; uses the Django test client when omitted')
+        parser.add_argument('--host', default='reviewsocial.localhost', help='Host header for the test client')
+        parser.add_argument('--seed', type=int, default=None, help='RNG seed for reproducible deliveries')
+        parser.add_argument('--keep', action='store_true', help='Keep webhook rows created by this run')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['fixture']:
+            call_command('loaddata', options['fixture'], verbosity=0)
+
+        accounts = InstagramAccount.objects.filter(is_active=True).order_by('id')
+        if options['accounts']:
+            accounts = accounts[:options['accounts']]
+        ig_user_ids = list(accounts.values_list('instagram_user_id', flat=True))
+        if not ig_user_ids and options['endpoint'] != 'handshake':
+            raise CommandError('No active Instagram accounts found. Pass --fixture webhook_loadgen_accounts to seed some.')
+
+        generator = WebhookLoadGenerator(
+            ig_user_ids or ['0'],
+            entries_per_delivery=options['entries'],
+            changes_per_entry=options['changes'],
+            duplicate_ratio=options['duplicate_ratio'],
+            seed=options['seed'],
+        )
+        if options['endpoint'] == 'handshake':
+            bodies = [None] * options['deliveries']
+        else:
+            bodies = [json.dumps(d).encode('utf-8') for d in generator.generate(options['deliveries'])]
+
+        send = self._build_sender(options)
+        allowed_hosts = list(settings.ALLOWED_HOSTS) + [options['host']]
+        with override_settings(ALLOWED_HOSTS=allowed_hosts):
+            # Warm up URL resolution and view imports outside the timed window
+            send(None)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as pool:
+                results = list(pool.map(send, bodies))
+            elapsed = time.perf_counter() - started
+
+        rows = InstagramWebhook.objects.filter(webhook_id__startswith=generator.run_id).count()
+        if not options['keep']:
+            InstagramWebhook.objects.filter(webhook_id__startswith=generator.run_id).delete()
+
+        report = self._build_report(options, results, rows, elapsed, generator)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for key, value in report.items():
+                self.stdout.write(f"{key:>24}: {value}")
+
+    def _build_sender(self, options):
+        endpoint = options['endpoint']
+        verify_token = getattr(settings, 'FACEBOOK_WEBHOOK_VERIFY_TOKEN', '')
+        handshake_query = {'hub.mode': 'subscribe', 'hub.verify_token': verify_token, 'hub.challenge': 'loadgen'}
+        path = ENDPOINT_PATHS.get(endpoint, ENDPOINT_PATHS['verify'])
+
+        if options['url']:
+            import requests
+            url = options['url'].rstrip('/') + path
+
+            def send(body):
+                started = time.perf_counter()
+                if body is None:
+                    resp = requests.get(url, params=handshake_query, timeout=30)
+                else:
+                    resp = requests.post(url, data=body, headers={'Content-Type': 'application/json'}, timeout=30)
+                return resp.status_code, time.perf_counter() - started, None
+            return send
+
+        host = options['host']
+
+        def send(body):
+            client = Client(HTTP_HOST=host)
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    if body is None:
+                        resp = client.get(path, handshake_query)
+                    else:
+                        resp = client.post(path, data=body, content_type='application/json')
+                    latency = time.perf_counter() - started
+                return resp.status_code, latency, len(queries.captured_queries)
+            finally:
+                connection.close()
+        return send
+
+    def _build_report(self, options, results, rows, elapsed, generator):
+        latencies_ms = [r[1] * 1000 for r in results]
+        queries = [r[2] for r in results if r[2] is not None]
+        errors = sum(1 for r in results if r[0] >= 400)
+
+        def fmt(value):
+            return round(value, 2) if value is not None else None
+
+        return {
+            'endpoint': options['endpoint'],
+            'deliveries': len(results),
+            'changes_per_delivery': options['entries'] * options['changes'],
+            'concurrency': options['concurrency'],
+            'errors': errors,
+            'elapsed_s': round(elapsed, 3),
+            'deliveries_per_s': fmt(len(results) / elapsed if elapsed else None),
+            'rows_created': rows,
+            # A re-sent comment hits the webhook_id unique constraint; the endpoint still acks
+            # 200 but drops the rest of that delivery, so compare stored against expected rows
+            'rows_expected': generator.unique_comments if options['endpoint'] != 'handshake' else 0,
+            'rows_missing': (generator.unique_comments - rows) if options['endpoint'] != 'handshake' else 0,
+            'duplicates_sent': generator.duplicates_sent,
+            'rows_per_s': fmt(rows / elapsed if elapsed else None),
+            'ack_p50_ms': fmt(percentile(latencies_ms, 50)),
+            'ack_p95_ms': fmt(percentile(latencies_ms, 95)),
+            'ack_p99_ms': fmt(percentile(latencies_ms, 99)),
+            'queries_per_delivery': fmt(sum(queries) / len(queries) if queries else None),
+        }
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('instagram', '0002_instagramaccount_account_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='instagramwebhook',
+            index=models.Index(fields=['account', 'processed', '-created_at'], name='ig_webhook_acct_proc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='instagramwebhook',
+            index=models.Index(condition=models.Q(('processed', False)), fields=['account', '-created_at'], name='ig_webhook_unprocessed_idx'),
+        ),
+    ]
@@ -46,6 +46,16 @@ class InstagramWebhook(models.Model):
     class Meta:
         db_table = 'instagram_webhooks'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's webhooks, optionally filtered by processed
+            models.Index(fields=['account', 'processed', '-created_at'], name='ig_webhook_acct_proc_idx'),
+            # Small index over the unprocessed backlog only
+            models.Index(
+                fields=['account', '-created_at'],
+                name='ig_webhook_unprocessed_idx',
+                condition=models.Q(processed=False),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.event_type} - {self.created_at}"
@@ -48,3 +48,117 @@ class InstagramConnectTests(TestCase):
         self.assertTrue(resp.headers.get('Location', '').startswith('https://www.facebook.com/'))
 
 
+
+
+class WebhookLoadGeneratorTests(TestCase):
+    def test_delivery_shape(self):
+        from platforms.instagram.loadgen import WebhookLoadGenerator
+        gen = WebhookLoadGenerator(['1789'], entries_per_delivery=2, changes_per_entry=3, seed=7)
+        delivery = gen.build_delivery()
+        self.assertEqual(delivery['object'], 'instagram')
+        self.assertEqual(len(delivery['entry']), 2)
+        for entry in delivery['entry']:
+            self.assertEqual(entry['id'], '1789')
+            self.assertEqual(len(entry['changes']), 3)
+            self.assertEqual(entry['changes'][0]['field'], 'comments')
+
+    def test_duplicate_ratio_resends_comments(self):
+        from platforms.instagram.loadgen import WebhookLoadGenerator
+        gen = WebhookLoadGenerator(['1789'], changes_per_entry=10, duplicate_ratio=0.5, seed=7)
+        ids = [c['value']['id'] for d in gen.generate(20) for e in d['entry'] for c in e['changes']]
+        self.assertLess(len(set(ids)), len(ids))
+        self.assertEqual((gen.unique_comments, gen.duplicates_sent), (len(set(ids)), len(ids) - len(set(ids))))
+        unique = WebhookLoadGenerator(['1789'], changes_per_entry=10, seed=7)
+        ids = [c['value']['id'] for d in unique.generate(20) for e in d['entry'] for c in e['changes']]
+        self.assertEqual(len(set(ids)), len(ids))
+
+
+@override_settings(ALLOWED_HOSTS=['reviewsocial.testserver'])
+class InstagramWebhookListTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from platforms.instagram.models import InstagramWebhook
+        User = get_user_model()
+        self.user = User.objects.create_user(username='owner', password='pass12345')
+        other = User.objects.create_user(username='other', password='pass12345')
+        account = InstagramAccount.objects.create(user=self.user, instagram_user_id='1', username='mine', access_token='t')
+        other_account = InstagramAccount.objects.create(user=other, instagram_user_id='2', username='theirs', access_token='t')
+        for i in range(5):
+            InstagramWebhook.objects.create(webhook_id=f'mine-{i}', account=account, event_type='comments',
+                                            payload={}, processed=i % 2 == 0)
+        InstagramWebhook.objects.create(webhook_id='theirs-0', account=other_account, event_type='comments', payload={})
+        self.client = APIClient(HTTP_HOST='reviewsocial.testserver')
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_scoped_and_keyset_paginated(self):
+        resp = self.client.get('/api/v1/instagram/webhooks/', {'page_size': 3})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()['data']
+        self.assertEqual(len(data['results']), 3)
+        self.assertNotIn('count', data)
+        self.assertIn('cursor=', data['next'])
+        resp = self.client.get(data['next'])
+        page2 = resp.json()['data']
+        ids = [w['webhook_id'] for w in data['results'] + page2['results']]
+        self.assertEqual(sorted(ids), [f'mine-{i}' for i in range(5)])
+        self.assertIsNone(page2['next'])
+
+    def test_list_filters_processed(self):
+        resp = self.client.get('/api/v1/instagram/webhooks/', {'processed': 'false'})
+        results = resp.json()['data']['results']
+        self.assertEqual({w['webhook_id'] for w in results}, {'mine-1', 'mine-3'})
+
+
+class WebhookJSONParserTests(TestCase):
+    def parse(self, body):
+        import io
+        from platforms.instagram.parsers import WebhookJSONParser
+        return WebhookJSONParser().parse(io.BytesIO(body))
+
+    def test_parses_delivery_from_bytes(self):
+        body = '{"object":"instagram","entry":[{"id":"1","changes":[{"field":"comments","value":{"text":"😍"}}]}]}'
+        payload = self.parse(body.encode('utf-8'))
+        self.assertEqual(payload['entry'][0]['changes'][0]['value']['text'], '😍')
+
+    def test_rejects_bad_json_and_bad_envelope(self):
+        from rest_framework.exceptions import ParseError
+        for body in [b'{not json', b'[]', b'{"entry": {}}', b'{"entry": [{"changes": "x"}]}']:
+            with self.assertRaises(ParseError):
+                self.parse(body)
+
+    @override_settings(ALLOWED_HOSTS=['reviewsocial.testserver'])
+    def test_receive_acks_malformed_body(self):
+        resp = self.client.post('/api/v1/instagram/webhooks/receive/', data=b'{not json',
+                                content_type='text/plain', HTTP_HOST='reviewsocial.testserver')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['data'], {'created': 0})
+
+
+@override_settings(ALLOWED_HOSTS=['reviewsocial.testserver'], OPENAI_API_KEY=None)
+class WebhookCommentReplyTests(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        caches['default'].clear()
+        user = get_user_model().objects.create_user(username='owner', password='pass12345')
+        self.account = InstagramAccount.objects.create(user=user, instagram_user_id='17841', username='mine',
+                                                       access_token='t')
+
+    def deliver(self, path, comment_id, text):
+        body = {'object': 'instagram', 'entry': [{'id': '17841', 'changes': [
+            {'field': 'comments', 'value': {'id': comment_id, 'text': text, 'media': {'id': 'm1'}}},
+        ]}]}
+        return self.client.post(path, data=body, content_type='application/json',
+                                HTTP_HOST='reviewsocial.testserver')
+
+    def test_comment_deliveries_are_labelled_through_the_reply_service(self):
+        from platforms.instagram.models import InstagramWebhook
+        for path, comment_id, text in [('/api/v1/instagram/webhooks/receive/', 'c1', 'Love this!! 😍😍'),
+                                       ('/api/v1/instagram/webhooks/verify/', 'c2', 'love this 😍')]:
+            resp = self.deliver(path, comment_id, text)
+            self.assertEqual(resp.json()['data'], {'created': 1})
+        first = InstagramWebhook.objects.get(webhook_id='c1')
+        second = InstagramWebhook.objects.get(webhook_id='c2')
+        self.assertEqual(first.payload['reply']['sentiment'], 'positive')
+        self.assertIsNone(first.payload['reply']['ai_response'])
+        self.assertEqual((first.payload['reply']['reused'], second.payload['reply']['reused']), (False, True))
+        self.assertFalse(second.processed)
@@ -2,10 +2,16 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import ParseError
+from django_filters.rest_framework import DjangoFilterBackend
 from django.conf import settings
 
 from platforms.instagram.models import InstagramAccount, InstagramWebhook
+from platforms.instagram.filters import InstagramWebhookFilter
+from platforms.instagram.parsers import WebhookJSONParser
 from core.models import Post, UserSettings
+from core.replies import CommentReplyService
 from platforms.instagram.serializers import (
     InstagramAccountSerializer, 
     InstagramAccountCreateSerializer,
@@ -403,32 +409,101 @@ def mobile_oauth_callback(request):
 from django.http import HttpResponse
 
 
+def _read_delivery(request):
+    """Return the parsed webhook delivery, or an empty one if the body is unusable."""
+    try:
+        return request.data or {}
+    except ParseError as e:
+        # Ack malformed deliveries anyway so Meta does not keep retrying them
+        if settings.DEBUG:
+            print("Webhook parse error:", str(e))
+        return {}
+
+
+def _process_comment(replies, account, webhook):
+    """
+    Label a delivered comment and draft its reply
+
+    The result is stored under payload['reply'] for review; the webhook stays
+    unprocessed until the reply is handled. Failures never block the delivery.
+
+    Args:
+        replies: CommentReplyService shared by the delivery's comments (None
+            to create one)
+        account: InstagramAccount the comment was posted to
+        webhook: InstagramWebhook holding the comment payload
+
+    Returns:
+        CommentReplyService: the service, for the delivery's next comment
+    """
+    try:
+        replies = replies or CommentReplyService()
+        result = replies.process(account.id, webhook.payload.get('text', ''))
+        webhook.payload['reply'] = {
+            'sentiment': result['sentiment'].get('label'),
+            'ai_response': result['ai_response'],
+            'reused': result['reused'],
+        }
+        webhook.save(update_fields=['payload'])
+    except Exception as e:
+        if settings.DEBUG:
+            print('Webhook auto-process error:', str(e))
+    return replies
+
+
+class WebhookCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created_at, id)
+
+    Pages are fetched with a WHERE on the last seen position instead of an
+    OFFSET, and no COUNT(*) is issued, so cost stays proportional to the page.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return success_response(
+            data={
+                'results': data,
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+            },
+            message=f"Retrieved {len(data)} webhooks"
+        )
+
+
 class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint for Instagram webhooks (read-only)
     
-    list: GET /api/v1/instagram/webhooks/
+    list: GET /api/v1/instagram/webhooks/?processed=&event_type=&since=&until=&cursor=&page_size=
     retrieve: GET /api/v1/instagram/webhooks/{id}/
     """
     queryset = InstagramWebhook.objects.all()
     serializer_class = InstagramWebhookSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = WebhookCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = InstagramWebhookFilter
 
     def get_permissions(self):
         # Allow Facebook webhook verification and event delivery without auth
         if self.action in ['verify_subscription', 'receive_update']:
             return [AllowAny()]
         return super().get_permissions()
+
+    def get_queryset(self):
+        """Only expose webhooks for the current user's accounts"""
+        return InstagramWebhook.objects.filter(account__user=self.request.user)
     
     def list(self, request, *args, **kwargs):
-        """List all webhooks"""
+        """List the current user's webhooks, newest first, one keyset page at a time"""
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        
-        return success_response(
-            data=serializer.data,
-            message=f"Retrieved {queryset.count()} webhooks"
-        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def mark_processed(self, request, pk=None):
@@ -445,7 +520,7 @@ class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
             message="Webhook marked as processed"
         )
 
-    @action(detail=False, methods=['get', 'post'], url_path='verify')
+    @action(detail=False, methods=['get', 'post'], url_path='verify', parser_classes=[WebhookJSONParser])
     def verify_subscription(self, request):
         """Unified endpoint for GET verification and POST deliveries (if Meta posts to same URL)."""
         if request.method.lower() == 'get':
@@ -457,15 +532,9 @@ class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
                 return HttpResponse(challenge, content_type='text/plain', status=200)
             return error_response("Webhook verification failed", status_code=status.HTTP_403_FORBIDDEN)
         # Handle POST delivery same as receive_update
-        payload = request.data
-        # Fallback: some deliveries come as form-encoded with 'object' and 'entry' string
-        if not isinstance(payload, dict) or ('entry' not in payload and request.body):
-            try:
-                import json
-                payload = json.loads(request.body.decode('utf-8'))
-            except Exception:
-                payload = {}
+        payload = _read_delivery(request)
         created = []
+        replies = None
         try:
             for entry in payload.get('entry', []):
                 entry_ig_user_id = entry.get('id')  # IG Business Account ID
@@ -496,74 +565,8 @@ class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
                         payload=value
                     )
                     created.append(webhook.id)
-                    # Auto-process comment events
                     if event_type == 'comments' and comment_id:
-                        try:
-                            # Sentiment + auto-reply based on settings
-                            settings_obj = UserSettings.objects.get(user=account.user)
-                            service = InstagramService()
-                            service.bind_access_token(account.access_token)
-                            detail = service.fetch_comment_detail(comment_id)
-                            text = detail.get('text', '')
-                            # Process comment into core table, with idempotency
-                            result = service.core_service.process_comment(
-                                comment_text=text,
-                                platform='instagram',
-                                external_id=comment_id,
-                                user=account.user,
-                                post_id=media_id
-                            )
-                            label = result['sentiment'].get('label')
-                            # Determine if approval is required
-                            needs_approval = False
-                            if settings_obj.auto_comment_enabled:
-                                if label == 'negative' and settings_obj.require_approval_for_negative:
-                                    needs_approval = True
-                                if label == 'hate' and settings_obj.require_approval_for_hate:
-                                    needs_approval = True
-                            # Notification preferences
-                            should_notify = (
-                                (label == 'positive' and settings_obj.notify_on_positive) or
-                                (label == 'negative' and settings_obj.notify_on_negative) or
-                                (label == 'hate' and settings_obj.notify_on_hate) or
-                                (label == 'neutral' and settings_obj.notify_on_neutral)
-                            )
-                            notif, _ = Notification.objects.update_or_create(
-                                user=account.user,
-                                platform='instagram',
-                                external_id=comment_id,
-                                defaults={
-                                    'media_id': media_id,
-                                    'comment_text': text,
-                                    'sentiment_label': label,
-                                    'needs_approval': needs_approval,
-                                    'ai_response': result.get('ai_response'),
-                                    'is_read': False,
-                                }
-                            )
-                            # Push to SSE subscribers
-                            try:
-                                payload = {
-                                    'unread_count': Notification.objects.filter(user=account.user, is_read=False).count(),
-                                    'latest': {
-                                        'id': notif.id,
-                                        'text': text,
-                                        'label': label,
-                                        'needs_approval': needs_approval,
-                                    }
-                                }
-                                import json
-                                publish(account.user.id, json.dumps(payload))
-                            except Exception:
-                                pass
-                            # Send mobile push (FCM)
-                            try:
-                                PushService().notify_new_notification(account.user, notif)
-                            except Exception:
-                                pass
-                        except Exception as e:
-                            if settings.DEBUG:
-                                print('Webhook auto-process error:', str(e))
+                        replies = _process_comment(replies, account, webhook)
             return success_response({'created': len(created)}, "Webhook received")
         except Exception as e:
             # Do not block webhook delivery on parse errors; log and ack 200
@@ -575,18 +578,14 @@ class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
                     pass
             return HttpResponse(status=200)
 
-    @action(detail=False, methods=['post'], url_path='receive', permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], url_path='receive', permission_classes=[AllowAny],
+            parser_classes=[WebhookJSONParser])
     def receive_update(self, request):
         """Receive webhook events and store them."""
-        payload = request.data
-        if not isinstance(payload, dict) or ('entry' not in payload and request.body):
-            try:
-                import json
-                payload = json.loads(request.body.decode('utf-8'))
-            except Exception:
-                payload = {}
+        payload = _read_delivery(request)
         # Basic shape: {"entry":[{"id":"<ig_ba_id>","changes":[{"field":"comments","value":{...}}]}]}
         created = []
+        replies = None
         try:
             for entry in payload.get('entry', []):
                 entry_ig_user_id = entry.get('id')
@@ -616,6 +615,8 @@ class InstagramWebhookViewSet(viewsets.ReadOnlyModelViewSet):
                         payload=value
                     )
                     created.append(webhook.id)
+                    if event_type == 'comments' and comment_id:
+                        replies = _process_comment(replies, account, webhook)
             return success_response({'created': len(created)}, "Webhook received")
         except Exception as e:
             if settings.DEBUG:
@@ -6,7 +6,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from core.auth_views import login_view, logout_view, signup_view
-from core.api_auth_views import LoginView, MeView
+from core.api_auth_views import LoginView, LogoutView, MeView
 from shopify_integration.views import shopify_install, shopify_callback, judgeme_webhook
 from reviewsocial import views
 
@@ -44,6 +44,8 @@ urlpatterns = [
     path('api/v1/auth/login/', LoginView.as_view(), name='api_login_slash'),
     path('api/v1/auth/me', MeView.as_view(), name='api_me'),
     path('api/v1/auth/me/', MeView.as_view(), name='api_me_slash'),
+    path('api/v1/auth/logout', LogoutView.as_view(), name='api_logout'),
+    path('api/v1/auth/logout/', LogoutView.as_view(), name='api_logout_slash'),
     
     # Hosted API service endpoints
     path('api/', include('api_hosted.urls')),
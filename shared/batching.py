@@ -0,0 +1,77 @@
+"""
+Time-bounded micro-batching for calls that are cheaper in bulk
+"""
+import threading
+from concurrent.futures import Future
+from typing import Callable, List
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item calls into batched handler calls
+
+    A batch is flushed as soon as it holds `max_batch_size` items, or
+    `max_wait_ms` after its first item arrived, whichever comes first, so
+    batching never adds more than `max_wait_ms` to any caller's latency.
+    """
+
+    def __init__(self, handler: Callable[[List], List], max_batch_size: int = 20, max_wait_ms: float = 50):
+        """
+        Args:
+            handler: Called with a list of items; must return one result per item, in order
+            max_batch_size: Flush when this many items are pending
+            max_wait_ms: Flush this long after the first pending item arrived
+        """
+        self.handler = handler
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+
+    def submit(self, item) -> Future:
+        """
+        Queue an item for the next batch
+
+        Returns:
+            Future: Resolves to the handler's result for this item
+        """
+        future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((item, future))
+            if len(self._pending) >= self.max_batch_size or self.max_wait == 0:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run(batch)
+        return future
+
+    def flush(self):
+        """Run whatever is pending now"""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _run(self, batch):
+        try:
+            results = self.handler([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f'Batch handler returned {len(results)} results for {len(batch)} items')
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
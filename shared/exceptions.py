@@ -31,3 +31,24 @@ class ResponseGenerationError(ProvokelyException):
 class ValidationError(ProvokelyException):
     """Exception for validation errors"""
     pass
+
+
+class QuotaExceededError(ProvokelyException):
+    """Exception raised when a user has no quota left to reserve"""
+    pass
+
+
+class PromptTooLargeError(ValidationError):
+    """Exception raised when a prompt does not fit the model's context window"""
+
+    def __init__(self, message, estimate=None):
+        super().__init__(message)
+        self.estimate = estimate or {}
+
+
+class IdempotencyConflictError(ProvokelyException):
+    """Exception raised when an Idempotency-Key cannot be honoured"""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.status_code = status_code
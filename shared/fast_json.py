@@ -0,0 +1,31 @@
+"""
+JSON helpers that use orjson when it is installed and fall back to the stdlib
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+
+def loads(data):
+    """
+    Parse JSON from bytes or str in a single pass
+
+    orjson parses UTF-8 bytes directly, so large bodies are never decoded
+    into an intermediate str first.
+
+    Args:
+        data: JSON document as bytes, bytearray, memoryview or str
+
+    Returns:
+        Parsed Python object
+
+    Raises:
+        ValueError: If the document is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
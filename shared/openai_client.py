@@ -0,0 +1,194 @@
+"""
+Per-process registry of long-lived OpenAI clients
+
+Building `OpenAI(...)` per request throws away its httpx connection pool, so
+every call pays for client construction, DNS, TCP and TLS again. Clients are
+built lazily on first use and then shared by all requests (and threads) of
+the worker process.
+
+Fork safety: with gunicorn `preload_app` the master may import this module
+(or even build a client) before forking. Sockets inherited from the parent
+must not be shared, so the registry remembers the pid that built each client
+and starts empty in every child.
+
+Async clients (for the ASGI path) hold connections bound to the event loop
+that opened them, so they are cached per running loop instead: one per
+process under uvicorn, one per loop in tests and async_to_sync calls.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+
+class OpenAIClientRegistry:
+    """Lazily build and cache one OpenAI client per API key per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._pid = os.getpid()
+
+    def get(self, api_key=None):
+        """
+        Return the shared client for api_key, building it on first use
+
+        Args:
+            api_key: OpenAI API key (defaults to settings.OPENAI_API_KEY)
+
+        Returns:
+            openai.OpenAI: Client with pooled, keep-alive HTTP connections
+
+        Raises:
+            ValueError: If no API key is configured
+            ImportError: If the openai package is not installed
+        """
+        api_key = api_key or getattr(settings, 'OPENAI_API_KEY', None)
+        if not api_key:
+            raise ValueError('OPENAI_API_KEY not configured in settings')
+
+        self._check_pid()
+        client = self._clients.get(api_key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is None:
+                client = self._clients[api_key] = self._build(api_key)
+        return client
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked worker: drop the parent's clients without closing their sockets
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._lock = threading.Lock()
+                    self._clients = {}
+                    self._async_clients = weakref.WeakKeyDictionary()
+                    self._pid = os.getpid()
+
+    def get_async(self, api_key=None):
+        """
+        Return the shared AsyncOpenAI client of the running event loop
+
+        Args:
+            api_key: OpenAI API key (defaults to settings.OPENAI_API_KEY)
+
+        Returns:
+            openai.AsyncOpenAI: Client with pooled, keep-alive HTTP connections
+
+        Raises:
+            ValueError: If no API key is configured
+            RuntimeError: If called outside a running event loop
+            ImportError: If the openai package is not installed
+        """
+        api_key = api_key or getattr(settings, 'OPENAI_API_KEY', None)
+        if not api_key:
+            raise ValueError('OPENAI_API_KEY not configured in settings')
+
+        self._check_pid()
+        loop = asyncio.get_running_loop()
+        clients = self._async_clients.get(loop)
+        if clients is None:
+            clients = self._async_clients[loop] = {}
+        client = clients.get(api_key)
+        if client is None:
+            # Only this loop's thread touches its entry, so no lock is needed
+            client = clients[api_key] = self._build(api_key, asynchronous=True)
+        return client
+
+    @staticmethod
+    def _build(api_key, asynchronous=False):
+        try:
+            from openai import (
+                OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
+            )
+        except ImportError:
+            raise ImportError('openai package not installed')
+
+        if asynchronous:
+            client_cls, http_client_cls = AsyncOpenAI, DefaultAsyncHttpxClient
+        else:
+            client_cls, http_client_cls = OpenAI, DefaultHttpxClient
+        # Build Limits from the SDK's own default so it matches the httpx the SDK was built against
+        limits_cls = type(DEFAULT_CONNECTION_LIMITS)
+        http_client = http_client_cls(
+            limits=limits_cls(
+                max_connections=getattr(settings, 'OPENAI_HTTP_MAX_CONNECTIONS', 100),
+                max_keepalive_connections=getattr(settings, 'OPENAI_HTTP_MAX_KEEPALIVE', 20),
+                keepalive_expiry=getattr(settings, 'OPENAI_HTTP_KEEPALIVE_EXPIRY', 30.0),
+            ),
+            timeout=Timeout(
+                getattr(settings, 'OPENAI_TIMEOUT', 25.0),
+                connect=getattr(settings, 'OPENAI_CONNECT_TIMEOUT', 5.0),
+            ),
+        )
+        return client_cls(
+            api_key=api_key,
+            http_client=http_client,
+            # 0 by default: the model router retries and falls back within the worker timeout
+            max_retries=getattr(settings, 'OPENAI_MAX_RETRIES', 0),
+        )
+
+    def reset(self):
+        """Close and forget every client built by this process"""
+        with self._lock:
+            clients = list(self._clients.values()) if self._pid == os.getpid() else []
+            self._clients = {}
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._pid = os.getpid()
+        # Async clients are dropped, not closed: closing needs their (possibly finished) loop
+        for client in clients:
+            close = getattr(client, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    def health_check(self, api_key=None, timeout=5.0):
+        """
+        Probe the OpenAI API through the shared client
+
+        Args:
+            api_key: OpenAI API key (defaults to settings.OPENAI_API_KEY)
+            timeout: Seconds before the probe gives up
+
+        Returns:
+            dict: {'ok', 'latency_ms', 'error', 'pid', 'clients'}
+        """
+        started = time.perf_counter()
+        error = None
+        try:
+            self.get(api_key).with_options(timeout=timeout, max_retries=0).models.list()
+        except Exception as e:
+            error = str(e)
+        return {
+            'ok': error is None,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'error': error,
+            'pid': os.getpid(),
+            'clients': len(self._clients),
+        }
+
+
+openai_clients = OpenAIClientRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    # Belt and braces for the pid check: start each child with an empty registry
+    os.register_at_fork(after_in_child=lambda: openai_clients._check_pid())
+
+
+def get_openai_client(api_key=None):
+    """Shared OpenAI client for this process (see OpenAIClientRegistry.get)"""
+    return openai_clients.get(api_key)
+
+
+def get_async_openai_client(api_key=None):
+    """Shared AsyncOpenAI client for the running event loop (see OpenAIClientRegistry.get_async)"""
+    return openai_clients.get_async(api_key)